@@ -0,0 +1,77 @@
+# agent/answer_cache.py
+"""
+Per-user semantic cache of chat answers.
+
+An entry is reused when a new question retrieves the same chunks (same ids
+and offsets, from files at the same ingest version) and its embedding is
+within ANSWER_CACHE_SIMILARITY (cosine) of the cached question. Re-ingesting
+or removing a file drops every entry built on it; entries also expire after
+ANSWER_CACHE_TTL seconds. Identical questions in flight at the same time
+share one completion through `flight`.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from agent.models import CachedAnswer, UserFile
+from rag import metrics
+from rag.singleflight import SingleFlight
+
+flight = SingleFlight()
+
+
+def enabled() -> bool:
+    return settings.ANSWER_CACHE_SIMILARITY > 0
+
+
+def chunks_key(user, rows) -> str:
+    """Digest of retrieved `(id, file_id, file_name, start, end)` rows and their file versions."""
+    file_ids = sorted({row[1] for row in rows})
+    versions = dict(
+        UserFile.objects.filter(user=user, file_id__in=file_ids)
+        .values_list("file_id", "ingested_at")
+    )
+    h = hashlib.sha256()
+    for chunk_id, file_id, _, start, end in rows:
+        h.update(f"{chunk_id}:{start}:{end}\n".encode())
+    for file_id in file_ids:
+        h.update(f"{file_id}@{versions.get(file_id)}\n".encode())
+    return h.hexdigest()
+
+
+def _fresh(user):
+    cutoff = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+    return CachedAnswer.objects.filter(user=user, created_at__gte=cutoff)
+
+
+def lookup(user, embedding, key: str) -> str | None:
+    hit = (
+        _fresh(user)
+        .filter(chunks_key=key)
+        .annotate(distance=CosineDistance("embedding", embedding))
+        .filter(distance__lte=1 - settings.ANSWER_CACHE_SIMILARITY)
+        .order_by("distance")
+        .values_list("answer", flat=True)
+        .first()
+    )
+    metrics.cache_lookup("answer", hit is not None)
+    return hit
+
+
+def store(user, question: str, embedding, key: str, file_ids, answer: str) -> None:
+    CachedAnswer.objects.filter(
+        user=user, created_at__lt=timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+    ).delete()
+    CachedAnswer.objects.create(
+        user=user, question=question, embedding=embedding, chunks_key=key,
+        file_ids=sorted(set(file_ids)), answer=answer,
+    )
+
+
+def invalidate(user, file_id: str) -> int:
+    """Drop the user's answers that were built on `file_id`; returns how many."""
+    deleted, _ = CachedAnswer.objects.filter(user=user, file_ids__contains=[file_id]).delete()
+    return deleted
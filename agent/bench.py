@@ -0,0 +1,160 @@
+# agent/bench.py
+"""
+Offline benchmark: local stand-ins for Drive, Google OAuth and the OpenAI
+API, plus the workloads `manage.py benchmark` measures.
+
+The stand-in server answers
+  GET  /drive/v3/files/<id>?fields=…   metadata (text/plain, version "1")
+  GET  /drive/v3/files/<id>?alt=media  BENCH_DOC_CHARS of synthetic text
+  POST /token                          a long-lived access token
+  POST /v1/embeddings                  deterministic unit vectors
+  POST /v1/chat/completions            a canned reply
+Document text and vectors are pure functions of the file id / input text,
+so every run sees the same corpus.
+"""
+import hashlib
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DIMENSIONS = 1536
+WORDS = (
+    "vector index query chunk token embed drive folder search recall latency "
+    "budget cluster shard graph layer cache memory page pool thread socket "
+    "report metric sample model answer context source offset stream batch"
+).split()
+
+
+def synthetic_text(file_id: str, chars: int) -> str:
+    rnd = random.Random(file_id)
+    out, size = [], 0
+    while size < chars:
+        sentence = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(6, 18)))
+        sentence = sentence.capitalize() + ". "
+        if rnd.random() < 0.15:
+            sentence += "\n\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)[:chars]
+
+
+def fake_embedding(text: str) -> list[float]:
+    rnd = random.Random(hashlib.sha256(text.encode()).digest())
+    vec = [rnd.gauss(0, 1) for _ in range(DIMENSIONS)]
+    norm = math.sqrt(sum(x * x for x in vec))
+    return [x / norm for x in vec]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+    doc_chars = 20_000
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or b"{}")
+        return parse_qs(raw.decode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.startswith("/drive/v3/files/"):
+            return self._send(404, {"error": "not found"})
+        file_id = url.path.rsplit("/", 1)[1]
+        query = parse_qs(url.query)
+        if query.get("alt") == ["media"]:
+            text = synthetic_text(file_id, self.doc_chars).encode()
+            return self._send(200, text, "text/plain; charset=utf-8")
+        return self._send(200, {
+            "id": file_id, "name": f"{file_id}.txt", "mimeType": "text/plain",
+            "version": "1", "md5Checksum": hashlib.md5(file_id.encode()).hexdigest(),
+            "modifiedTime": "2025-01-01T00:00:00.000Z",
+        })
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path == "/token":
+            return self._send(200, {"access_token": "bench", "expires_in": 86400})
+        if path == "/v1/embeddings":
+            inputs = body["input"]
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return self._send(200, {
+                "object": "list",
+                "model": body.get("model"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(t)}
+                    for i, t in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        if path == "/v1/chat/completions":
+            return self._send(200, {
+                "id": "bench", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "Benchmark answer."},
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        return self._send(404, {"error": "not found"})
+
+
+class FakeServices:
+    """Run the stand-in server on a free localhost port for the `with` block."""
+
+    def __init__(self, doc_chars: int = 20_000):
+        handler = type("Handler", (_Handler,), {"doc_chars": doc_chars})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentiles(samples_ms) -> dict:
+    values = sorted(samples_ms)
+    if not values:
+        return {}
+
+    def pct(p):
+        return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+    return {
+        "n": len(values),
+        "mean": round(statistics.fmean(values), 3),
+        "p50": round(pct(50), 3),
+        "p95": round(pct(95), 3),
+        "p99": round(pct(99), 3),
+    }
+
+
+def timed(fn, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentiles(samples)
@@ -0,0 +1,116 @@
+# agent/drive_client.py
+"""
+Shared HTTP client for Google Drive and Google OAuth.
+
+One keep-alive `requests.Session` per process, with a connection pool sized
+for the ingest workers plus the retrieval export fan-out, and urllib3
+retries on 429/5xx using exponential backoff that honours `Retry-After`
+(token POSTs are never retried after the request may have been processed).
+Also owns the Drive mime-type → download/export URL mapping.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+# Google-native formats and the plain-text flavour we export them as
+EXPORT_MIME = {
+    "application/vnd.google-apps.document": "text/plain",
+    "application/vnd.google-apps.presentation": "text/plain",
+    "application/vnd.google-apps.spreadsheet": "text/csv",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _retry(**kwargs) -> Retry:
+    return Retry(
+        total=settings.DRIVE_HTTP_RETRIES,
+        backoff_factor=settings.DRIVE_HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        **kwargs,
+    )
+
+
+def session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=settings.DRIVE_HTTP_POOL_SIZE,
+                max_retries=_retry(allowed_methods=frozenset({"GET"})),
+            )
+            # the token endpoint is POST: a 429/5xx or a failed connect did not
+            # consume the grant, but a read timeout may have — replaying a
+            # one-time code then fails with invalid_grant
+            token_adapter = HTTPAdapter(
+                max_retries=_retry(allowed_methods=frozenset({"POST"}), read=0, other=0),
+            )
+            s = requests.Session()
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.mount(settings.GOOGLE_TOKEN_URL, token_adapter)   # longest prefix wins
+            _session = s
+        return _session
+
+
+def _timeout(read: float | None = None):
+    return (settings.DRIVE_HTTP_CONNECT_TIMEOUT, read or settings.DRIVE_HTTP_TIMEOUT)
+
+
+def get(path: str, token: str, **params) -> dict:
+    """GET `DRIVE_API_BASE/path` as JSON; raises for non-2xx after retries."""
+    res = session().get(
+        f"{settings.DRIVE_API_BASE}/{path}",
+        headers={"Authorization": f"Bearer {token}"},
+        params=params,
+        timeout=_timeout(),
+    )
+    res.raise_for_status()
+    return res.json()
+
+
+def file_meta(file_id: str, token: str, fields: str) -> dict:
+    return get(f"files/{file_id}", token, fields=fields)
+
+
+def content_url(file_id: str, mime: str) -> str | None:
+    """Download/export URL for a Drive file; None for types we cannot index."""
+    if mime.startswith("application/vnd.google-apps"):
+        export_mime = EXPORT_MIME.get(mime)
+        if not export_mime:
+            return None
+        return f"{settings.DRIVE_API_BASE}/files/{file_id}/export?mimeType={export_mime}"
+    return f"{settings.DRIVE_API_BASE}/files/{file_id}?alt=media"
+
+
+def download_to(fp, url: str, token: str) -> None:
+    """Stream `url` into binary file `fp` and rewind it; ValueError past the size cap."""
+    limit = settings.DRIVE_MAX_DOWNLOAD_BYTES
+    with session().get(
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=_timeout(settings.DRIVE_DOWNLOAD_TIMEOUT),
+        stream=True,
+    ) as res:
+        res.raise_for_status()
+        size = 0
+        for block in res.iter_content(chunk_size=1024 * 1024):
+            size += len(block)
+            if size > limit:
+                raise ValueError(f"download exceeds DRIVE_MAX_DOWNLOAD_BYTES ({limit})")
+            fp.write(block)
+    fp.flush()  # PDFs are re-opened by path in the extraction pool
+    fp.seek(0)
+
+
+def token_request(data: dict) -> dict:
+    """POST to Google's OAuth token endpoint (code exchange or refresh)."""
+    return session().post(settings.GOOGLE_TOKEN_URL, data=data, timeout=_timeout()).json()
@@ -1,83 +1,261 @@
 # agent/drive_ingest.py
 """
-Download a Google-Drive file, extract text in-memory, chunk → embed,
+Download a Google-Drive file, extract text, chunk → embed,
 store ONLY embeddings + offsets in rag_ragchunk.
+
+The pipeline is streamed end to end: the download is spooled to a temp file
+(capped at DRIVE_MAX_DOWNLOAD_BYTES), PDFs are parsed a page range at a time
+in the agent.pdf_extract process pool and fed into the chunker, and chunks
+are embedded EMBED_BATCH_SIZE at a time into a session staging table that
+replaces the file's rows in one transaction at the end, so memory stays flat
+regardless of document size. (Retrieval-time exports in agent.views still
+hold a file's whole text, since chunk offsets are sliced out of it.)
 """
-import io
+import codecs
+import hashlib
 import os
-import requests
-import pdfminer.high_level
+import tempfile
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from openai import OpenAI
+from agent import answer_cache, drive_client, pdf_extract, text_cache
+from agent.models import UserFile
+from rag import metrics
+from rag.chunking import iter_chunks
+from rag.embeddings import embed_texts
 from rag.models import RagChunk
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def _chunk_text(text, size=1500, overlap=200):
-    step = size - overlap
-    out = []
-    start = 0
-    idx = 0
-    while start < len(text):
-        end = min(len(text), start + size)
-        out.append((idx, start, end, text[start:end]))
-        idx += 1
-        start += step
-    return out
-
-def _embed(text):
-    return client.embeddings.create(
-        model="text-embedding-3-small", input=text
-    ).data[0].embedding
-
-
-def ingest_drive_file(user, file_id: str, access_token: str) -> None:
-    hdrs = {"Authorization": f"Bearer {access_token}"}
-    meta = requests.get(
-        f"https://www.googleapis.com/drive/v3/files/{file_id}?fields=name,mimeType",
-        headers=hdrs,
-        timeout=30,
-    ).json()
-    name = meta["name"]
-    mime = meta["mimeType"]
+_BLOCK = 1024 * 1024
+
 
-    # Download/export
-    if mime.startswith("application/vnd.google-apps"):
-        export_map = {
-            "application/vnd.google-apps.document": "text/plain",
-            "application/vnd.google-apps.presentation": "text/plain",
-            "application/vnd.google-apps.spreadsheet": "text/csv",
-        }
-        export_mime = export_map.get(mime)
-        if not export_mime:
+def _utf8_blocks(fp):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    while block := fp.read(_BLOCK):
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def _pdf_pages(path: str):
+    batches = pdf_extract.iter_page_batches(path)
+    while True:
+        with metrics.stage("pdf_extract"):
+            pages = next(batches, None)
+        if pages is None:
             return
-        url = f"https://www.googleapis.com/drive/v3/files/{file_id}/export?mimeType={export_mime}"
-    else:
-        url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+        yield from pages
 
-    data = requests.get(url, headers=hdrs, timeout=120).content
 
+def iter_text(fp, mime: str, name: str):
+    """
+    Extracted text of a downloaded file (a named temp file) as a stream of
+    pieces. PDFs come back from the extraction pool a page range at a time.
+    """
     if mime == "application/pdf" or name.lower().endswith(".pdf"):
-        text = pdfminer.high_level.extract_text(io.BytesIO(data))
-    else:
-        text = data.decode("utf-8", errors="ignore")
+        return _pdf_pages(fp.name)
+    return _utf8_blocks(fp)
+
+
+# Session-local staging table: new/changed rows of the file being ingested
+# collect here, outside any transaction, and are swapped into rag_ragchunk at
+# the end in one short one.
+_STAGE = "rag_ingest_stage"
 
-    if not text.strip():
+
+def _create_stage(cur) -> None:
+    dims = RagChunk._meta.get_field("embedding").dimensions
+    cur.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS {_STAGE} (
+            chunk_idx integer PRIMARY KEY,
+            char_start integer NOT NULL,
+            char_end integer NOT NULL,
+            token_count integer NOT NULL,
+            text_hash varchar(64) NOT NULL,
+            embedding vector({dims}) NOT NULL
+        )
+        """
+    )
+    cur.execute(f"TRUNCATE {_STAGE}")
+
+
+def _stage_rows(cur, rows) -> None:
+    """Stage (idx, start, end, n_tokens, text_hash, embedding) rows."""
+    if not rows:
         return
+    field = RagChunk._meta.get_field("embedding")
+    cur.executemany(
+        f"INSERT INTO {_STAGE} (chunk_idx, char_start, char_end, token_count, text_hash, embedding)"
+        " VALUES (%s, %s, %s, %s, %s, %s::vector)",
+        [
+            (idx, start, end, n, h, field.get_db_prep_value(emb, connection))
+            for idx, start, end, n, h, emb in rows
+        ],
+    )
+
+
+def _apply_stage(cur, user, file_id: str, name: str, total: int) -> None:
+    """Upsert the staged rows and drop chunks at or past `total`, in one transaction."""
+    with transaction.atomic():
+        cur.execute(
+            f"""
+            INSERT INTO rag_ragchunk (user_id, file_id, file_name, chunk_idx, char_start,
+                                      char_end, token_count, text_hash, embedding)
+            SELECT %s, %s, %s, chunk_idx, char_start, char_end, token_count, text_hash,
+                   embedding
+            FROM {_STAGE}
+            ON CONFLICT (user_id, file_id, chunk_idx) DO UPDATE SET
+                file_name = EXCLUDED.file_name, char_start = EXCLUDED.char_start,
+                char_end = EXCLUDED.char_end, token_count = EXCLUDED.token_count,
+                text_hash = EXCLUDED.text_hash, embedding = EXCLUDED.embedding
+            """,
+            [user.pk, file_id, name],
+        )
+        RagChunk.objects.filter(user=user, file_id=file_id, chunk_idx__gte=total).delete()
+
 
-    # Chunk → embed → store offsets only
-    chunks = _chunk_text(text)
-    for idx, start, end, chunk_text in chunks:
-        emb = _embed(chunk_text)
-        RagChunk.objects.update_or_create(
-            user=user,
-            file_id=file_id,
-            chunk_idx=idx,
-            defaults={
-                "file_name": name,
-                "char_start": start,
-                "char_end": end,
-                "embedding": emb,
-            },
+def _stored_chunks(user, file_id: str) -> dict:
+    return {
+        idx: (h, start, end, fname)
+        for idx, h, start, end, fname in RagChunk.objects.filter(
+            user=user, file_id=file_id
+        ).values_list("chunk_idx", "text_hash", "char_start", "char_end", "file_name")
+    }
+
+
+def _changed_rows(user, file_id: str, name: str, chunks, stored: dict | None = None):
+    """
+    Rows to stage covering only chunks that differ from what is stored.
+    Embeddings are reused for any chunk text already embedded for this file
+    (even at another index); only genuinely new text is embedded.
+    """
+    if stored is None:
+        stored = _stored_chunks(user, file_id)
+    hashes = [hashlib.sha256(c[3].encode()).hexdigest() for c in chunks]
+    changed = [
+        (c, h) for c, h in zip(chunks, hashes)
+        if stored.get(c[0]) != (h, c[1], c[2], name)
+    ]
+    if not changed:
+        return []
+    known = dict(
+        RagChunk.objects.filter(
+            user=user, file_id=file_id, text_hash__in={h for _, h in changed}
+        ).values_list("text_hash", "embedding")
+    )
+    todo = list({h: c for c, h in changed if h not in known}.items())
+    known.update(zip(
+        (h for h, _ in todo),
+        embed_texts((c[3] for _, c in todo), token_counts=(c[4] for _, c in todo)),
+    ))
+    return [(idx, start, end, n, h, known[h]) for (idx, start, end, _, n), h in changed]
+
+
+def _store_stream(user, file_id: str, name: str, chunks, progress=None) -> tuple[int, int]:
+    """
+    Embed a chunk stream one EMBED_BATCH_SIZE batch at a time and stage the
+    changed rows, then swap them in and drop the stale tail in one short
+    transaction; returns (chunks, tokens). Extraction and embedding run
+    outside any transaction, yet readers (and the answer cache) never see a
+    mix of old and new chunks. A failed run changes nothing and leaves
+    UserFile.version untouched, so the next ingest redoes the file.
+    `progress()`, if given, is called after every batch.
+    """
+    stored = _stored_chunks(user, file_id)
+    total = tokens = 0
+    with connection.cursor() as cur:
+        _create_stage(cur)
+        try:
+            while batch := list(islice(chunks, settings.EMBED_BATCH_SIZE)):
+                total += len(batch)
+                tokens += sum(c[4] for c in batch)
+                rows = _changed_rows(user, file_id, name, batch, stored)
+                _stage_rows(cur, rows)
+                if progress:
+                    progress()
+            with metrics.stage("upsert"):
+                _apply_stage(cur, user, file_id, name, total)
+        finally:
+            cur.execute(f"DROP TABLE IF EXISTS {_STAGE}")
+    return total, tokens
+
+
+def _update_centroid(uf: UserFile) -> None:
+    """Recompute the file-level search vector from the stored chunk embeddings."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE agent_userfile SET centroid = (
+                SELECT AVG(embedding) FROM rag_ragchunk
+                WHERE user_id = %s AND file_id = %s
+            )
+            WHERE id = %s
+            """,
+            [uf.user_id, uf.file_id, uf.id],
         )
 
+
+def ingest_drive_file(user, file_id: str, access_token: str, force: bool = False,
+                      progress=None) -> int:
+    """
+    Ingest one Drive file; returns the number of chunks stored. Files whose
+    Drive version matches the last ingest are skipped unless `force`.
+    `progress()`, if given, is called after every embedded batch.
+    """
+    with metrics.collect() as timings:
+        total = _ingest(user, file_id, access_token, force, progress)
+    if timings:
+        metrics.log_timings("ingest", timings, file_id=file_id, chunks=total)
+    return total
+
+
+def _ingest(user, file_id: str, access_token: str, force: bool, progress=None) -> int:
+    with metrics.stage("drive_meta"):
+        meta = drive_client.file_meta(
+            file_id, access_token, "name,mimeType,version,md5Checksum,modifiedTime"
+        )
+    name = meta["name"]
+    mime = meta["mimeType"]
+
+    uf, _ = UserFile.objects.get_or_create(
+        user=user, file_id=file_id, defaults={"name": name}
+    )
+    if not force and uf.version and uf.version == meta.get("version"):
+        return uf.chunk_count
+
+    url = drive_client.content_url(file_id, mime)
+    if url is None:
+        return 0
+
+    with tempfile.NamedTemporaryFile() as fp:
+        with metrics.stage("drive_download"):
+            drive_client.download_to(fp, url, access_token)
+        size = os.fstat(fp.fileno()).st_size
+        # pages → text cache + chunker → embed what changed → store offsets only
+        with text_cache.writer(file_id, text_cache.revision(meta)) as cache:
+            def pages():
+                for piece in iter_text(fp, mime, name):
+                    cache.write(piece)
+                    yield piece
+
+            total, tokens = _store_stream(
+                user, file_id, name, iter_chunks(pages()), progress
+            )
+
+    uf.name = name
+    uf.version = meta.get("version", "")
+    uf.md5_checksum = meta.get("md5Checksum", "")
+    uf.modified_time = parse_datetime(meta["modifiedTime"]) if meta.get("modifiedTime") else None
+    uf.chunk_count, uf.token_count, uf.size = total, tokens, size
+    uf.ingested_at = timezone.now()
+    uf.save(update_fields=[
+        "name", "version", "md5_checksum", "modified_time",
+        "chunk_count", "token_count", "size", "ingested_at",
+    ])
+    with metrics.stage("centroid"):
+        _update_centroid(uf)
+    answer_cache.invalidate(user, file_id)
+    return total
@@ -1,54 +1,170 @@
-import io, os, mimetypes, tempfile
-from pathlib import Path
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from .ingest import ingest_file  # your existing PDF→vector helper
-
-SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
-FOLDER_ID = os.getenv("DRIVE_FOLDER_ID")   # hard-code for MVP
-CREDS_FILE = os.getenv("GOOGLE_SERVICE_KEY", "service-account.json")
-
-def get_drive_service():
-    creds = service_account.Credentials.from_service_account_file(
-        CREDS_FILE, scopes=SCOPES
-    )
-    return build("drive", "v3", credentials=creds, cache_discovery=False)
-
-def sync_drive_folder():
-    service = get_drive_service()
-    # list files inside the shared folder (no recursion for clarity)
-    q = f"'{FOLDER_ID}' in parents and trashed = false"
-    results = service.files().list(q=q,
-                                   fields="files(id,name,mimeType,modifiedTime)").execute()
-    for file in results.get("files", []):
-        if file["mimeType"].startswith("application/vnd.google-apps"):
-            # Export Google Docs/Sheets/Slides as PDF or plain text
-            mime_map = {
-                "application/vnd.google-apps.document": "application/pdf",
-                "application/vnd.google-apps.presentation": "application/pdf",
-                "application/vnd.google-apps.spreadsheet": "text/csv",
-            }
-            export_mime = mime_map.get(file["mimeType"])
-            if not export_mime:
-                continue  # skip drawings, forms, etc.
-            request = service.files().export_media(fileId=file["id"],
-                                                   mimeType=export_mime)
-            suffix = mimetypes.guess_extension(export_mime) or ".pdf"
+# agent/drive_sync.py
+"""
+Keep one user's copy of a Drive folder tree in rag_ragchunk up to date.
+
+The first run walks the tree (paginated, recursive) and stores a Changes
+API start token; later runs only replay `changes.list` deltas: new and
+modified files are (re)ingested, trashed/removed/moved-out files lose their
+chunks. Unchanged files are cheap thanks to ingest_drive_file's version
+check. The access token is looked up per page and per file
+(drive_tokens.valid_token), so a crawl or replay longer than one token's
+lifetime keeps going on refreshed tokens.
+
+`changes.list` covers the user's whole Drive, so only files this sync
+ingested (DriveSyncState.file_ids) are ever dropped; a change to anything
+else outside the tree — a file added through the picker, or one in another
+synced folder — is ignored.
+"""
+import logging
+
+from agent import answer_cache, drive_client
+from agent.drive_client import FOLDER_MIME
+from agent.drive_ingest import ingest_drive_file
+from agent.drive_tokens import valid_token
+from agent.models import DriveSyncState, UserFile
+from rag.models import RagChunk
+
+logger = logging.getLogger(__name__)
+
+ALL_DRIVES = {"supportsAllDrives": "true", "includeItemsFromAllDrives": "true"}
+
+
+def _children(folder_id: str, token):
+    page = None
+    while True:
+        res = drive_client.get(
+            "files", token(),
+            q=f"'{folder_id}' in parents and trashed = false",
+            fields="nextPageToken,files(id,name,mimeType)",
+            pageSize=1000,
+            **({"pageToken": page} if page else {}),
+            **ALL_DRIVES,
+        )
+        yield from res.get("files", [])
+        page = res.get("nextPageToken")
+        if not page:
+            return
+
+
+def _walk(folder_id: str, token, folders: set):
+    """
+    Yield every non-folder file below `folder_id`; adds subfolders to
+    `folders`. `token` returns a currently valid access token.
+    """
+    folders.add(folder_id)
+    pending = [folder_id]
+    while pending:
+        for f in _children(pending.pop(), token):
+            if f["mimeType"] == FOLDER_MIME:
+                if f["id"] not in folders:
+                    folders.add(f["id"])
+                    pending.append(f["id"])
+            else:
+                yield f
+
+
+class _Sync:
+    def __init__(self, state: DriveSyncState):
+        self.state = state
+        self.user = state.user
+        self.folders = set(state.folder_ids)
+        self.files = set(state.file_ids)
+        self.stats = {"ingested": 0, "removed": 0, "failed": 0}
+
+    def token(self) -> str:
+        token = valid_token(self.user)
+        if not token:
+            raise RuntimeError("No Drive token")
+        return token
+
+    def ingest(self, f: dict) -> None:
+        UserFile.objects.update_or_create(
+            user=self.user, file_id=f["id"], defaults={"name": f["name"]}
+        )
+        self.files.add(f["id"])
+        try:
+            ingest_drive_file(self.user, f["id"], self.token())
+            self.stats["ingested"] += 1
+        except Exception:
+            logger.exception("sync: ingest of %s failed", f["id"])
+            self.stats["failed"] += 1
+
+    def drop(self, file_id: str) -> None:
+        deleted, _ = UserFile.objects.filter(user=self.user, file_id=file_id).delete()
+        RagChunk.objects.filter(user=self.user, file_id=file_id).delete()
+        answer_cache.invalidate(self.user, file_id)
+        self.files.discard(file_id)
+        self.stats["removed"] += bool(deleted)
+
+    def crawl(self, folder_id: str) -> None:
+        for f in _walk(folder_id, self.token, self.folders):
+            self.ingest(f)
+
+    def apply(self, change: dict) -> None:
+        f = change.get("file") or {}
+        file_id = change["fileId"]
+        inside = bool(self.folders & set(f.get("parents", [])))
+        gone = change.get("removed") or f.get("trashed") or not inside
+
+        if change.get("removed") and file_id in self.folders:
+            # permanently deleted folder (removals carry no file/mimeType);
+            # its files arrive as removals of their own
+            if file_id != self.state.folder_id:
+                self.folders.discard(file_id)
+        elif f.get("mimeType") == FOLDER_MIME:
+            if gone and file_id in self.folders and file_id != self.state.folder_id:
+                # moved out of the tree: its files will not show up as changes
+                for child in _walk(file_id, self.token, set()):
+                    if child["id"] in self.files:
+                        self.drop(child["id"])
+                self.folders.discard(file_id)
+            elif not gone and file_id not in self.folders:
+                self.crawl(file_id)  # moved/created inside the tree
+        elif gone:
+            if file_id in self.files:
+                self.drop(file_id)
         else:
-            # direct download (PDF, txt, etc.)
-            request = service.files().get_media(fileId=file["id"])
-            suffix = Path(file["name"]).suffix or ".bin"
-
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        downloader = MediaIoBaseDownload(tmp, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        tmp.close()
-
-        # call your existing ingestion function → writes to rag_document table
-        ingest_file(tmp.name, display_name=file["name"], source_id=file["id"],
-                    modified=file["modifiedTime"])
-        os.unlink(tmp.name)
+            self.ingest(f)
+
+    def save(self, page_token: str) -> None:
+        self.state.page_token = page_token
+        self.state.folder_ids = sorted(self.folders)
+        self.state.file_ids = sorted(self.files)
+        self.state.save(update_fields=["page_token", "folder_ids", "file_ids", "updated_at"])
+
+
+def sync_drive_folder(user, folder_id: str, full: bool = False) -> dict:
+    """Sync `folder_id` for `user`; returns counts of ingested/removed/failed files."""
+    state, _ = DriveSyncState.objects.get_or_create(user=user, folder_id=folder_id)
+    sync = _Sync(state)
+
+    if full or not state.page_token:
+        # take the cursor first so edits made during the crawl are replayed
+        start = drive_client.get("changes/startPageToken", sync.token(),
+                                 supportsAllDrives="true")
+        previous, sync.folders, sync.files = sync.files, set(), set()
+        sync.crawl(folder_id)
+        for file_id in previous - sync.files:
+            sync.drop(file_id)   # no longer in the tree
+        sync.save(start["startPageToken"])
+        return sync.stats
 
+    page = state.page_token
+    while page:
+        res = drive_client.get(
+            "changes", sync.token(),
+            pageToken=page,
+            pageSize=1000,
+            includeRemoved="true",
+            fields=(
+                "nextPageToken,newStartPageToken,"
+                "changes(fileId,removed,file(id,name,mimeType,parents,trashed))"
+            ),
+            **ALL_DRIVES,
+        )
+        for change in res.get("changes", []):
+            sync.apply(change)
+        # checkpoint after every page so an interrupted run resumes here
+        page = res.get("nextPageToken")
+        sync.save(page or res["newStartPageToken"])
+    return sync.stats
@@ -0,0 +1,106 @@
+# agent/drive_tokens.py
+"""
+Drive access tokens with an in-process cache and single-flight refresh.
+
+`valid_token` answers from a per-process cache while the token has more
+than EXPIRY_MARGIN seconds left. Tokens entering the last
+DRIVE_TOKEN_REFRESH_AHEAD seconds are refreshed by a background thread, so
+requests normally never wait on Google. A refresh holds a per-user lock in
+this process and a `SELECT … FOR UPDATE` on the DriveAuth row across
+processes; whoever gets the row second sees the fresh token and skips the
+POST.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from agent import drive_client
+from agent.models import DriveAuth
+from rag import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_MARGIN = 60   # never hand out a token with less time left than this
+
+_cache: dict = {}    # user_id → (access_token, expiry_ts, refreshable)
+_locks: dict = {}    # user_id → threading.Lock
+_locks_guard = threading.Lock()
+_inflight: dict = {}  # user_id → Future of a background refresh
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="token-refresh")
+
+
+def _lock(user_id: int) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(user_id, threading.Lock())
+
+
+def _load(user_id: int, within: float):
+    """
+    Read the token under the row lock, refreshing it when it expires within
+    `within` seconds; caches and returns the entry (None when not connected).
+    """
+    with _lock(user_id):
+        hit = _cache.get(user_id)
+        if hit and hit[1] > time.time() + within:
+            return hit  # refreshed by another thread while we waited
+        with transaction.atomic():
+            auth = DriveAuth.objects.select_for_update().filter(user_id=user_id).first()
+            if auth is None:
+                _cache.pop(user_id, None)
+                return None
+            if auth.expiry_ts <= time.time() + within and auth.refresh_token:
+                res = drive_client.token_request({
+                    "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+                    "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+                    "refresh_token": auth.refresh_token,
+                    "grant_type": "refresh_token",
+                })
+                auth.access_token = res["access_token"]
+                auth.expiry_ts = time.time() + res.get("expires_in", 0)
+                auth.save(update_fields=["access_token", "expiry_ts"])
+        hit = _cache[user_id] = (auth.access_token, auth.expiry_ts, bool(auth.refresh_token))
+        return hit
+
+
+def _background_refresh(user_id: int) -> None:
+    try:
+        _load(user_id, settings.DRIVE_TOKEN_REFRESH_AHEAD)
+    except Exception:
+        logger.exception("background Drive token refresh for user %s failed", user_id)
+    finally:
+        connection.close()  # this thread's connection, back to the pool
+        with _locks_guard:
+            _inflight.pop(user_id, None)
+
+
+def _schedule(user_id: int) -> Future:
+    with _locks_guard:
+        fut = _inflight.get(user_id)
+        if fut is None:
+            fut = _inflight[user_id] = _executor.submit(_background_refresh, user_id)
+        return fut
+
+
+def valid_token(user) -> str | None:
+    """A usable Drive access token for `user`, or None if Drive is not connected."""
+    hit = _cache.get(user.pk)
+    fresh = bool(hit) and hit[1] > time.time() + EXPIRY_MARGIN
+    metrics.cache_lookup("drive_token", fresh)
+    if not fresh:
+        hit = _load(user.pk, EXPIRY_MARGIN)
+        if hit is None:
+            return None
+    token, expiry_ts, refreshable = hit
+    if refreshable and expiry_ts <= time.time() + settings.DRIVE_TOKEN_REFRESH_AHEAD:
+        _schedule(user.pk)
+    return token
+
+
+def forget(user) -> None:
+    """Drop the cached token, e.g. after the OAuth callback stored a new one."""
+    _cache.pop(user.pk, None)
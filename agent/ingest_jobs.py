@@ -0,0 +1,126 @@
+# agent/ingest_jobs.py
+"""
+Postgres-backed ingest queue.
+
+`enqueue` records one IngestJobFile per selected file; workers started by
+`manage.py ingest_worker` claim them with SELECT … FOR UPDATE SKIP LOCKED,
+so any number of worker threads/processes can drain the queue without
+double-processing a file.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from agent.drive_ingest import ingest_drive_file
+from agent.drive_tokens import valid_token
+from agent.models import IngestJob, IngestJobFile
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(user, files) -> IngestJob:
+    with transaction.atomic():
+        job = IngestJob.objects.create(user=user)
+        IngestJobFile.objects.bulk_create(
+            IngestJobFile(job=job, file_id=f["id"], name=f["name"]) for f in files
+        )
+    return job
+
+
+def claim_next():
+    """
+    Lock and mark the oldest runnable item; None when the queue is empty.
+    An orphaned item that has already been claimed INGEST_JOB_MAX_ATTEMPTS
+    times (say, a file that keeps killing its worker) is failed instead.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    with transaction.atomic():
+        while True:
+            item = (
+                IngestJobFile.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=IngestJobFile.QUEUED)
+                    # picked up by a worker that died mid-file
+                    | Q(status=IngestJobFile.RUNNING, started_at__lt=stale)
+                )
+                .select_related("job__user")
+                .order_by("id")
+                .first()
+            )
+            if item is None:
+                return None
+            if item.attempts < settings.INGEST_JOB_MAX_ATTEMPTS:
+                break
+            logger.warning("giving up on %s after %d attempts", item.file_id, item.attempts)
+            item.status = IngestJobFile.FAILED
+            item.error = f"gave up after {item.attempts} attempts"
+            item.finished_at = timezone.now()
+            item.save(update_fields=["status", "error", "finished_at"])
+        item.status = IngestJobFile.RUNNING
+        item.started_at = timezone.now()
+        item.attempts += 1
+        item.save(update_fields=["status", "started_at", "attempts"])
+    return item
+
+
+def _heartbeat(item: IngestJobFile):
+    """Progress callback that keeps a long-running item from looking orphaned."""
+    def beat():
+        IngestJobFile.objects.filter(pk=item.pk, status=IngestJobFile.RUNNING).update(
+            started_at=timezone.now()
+        )
+    return beat
+
+
+def process(item: IngestJobFile) -> None:
+    user = item.job.user
+    try:
+        token = valid_token(user)
+        if not token:
+            raise RuntimeError("No Drive token")
+        item.chunks = ingest_drive_file(user, item.file_id, token, progress=_heartbeat(item))
+        item.status = IngestJobFile.DONE
+    except Exception as exc:
+        logger.exception("ingest of %s for %s failed", item.file_id, user)
+        item.status = IngestJobFile.FAILED
+        item.error = f"{type(exc).__name__}: {exc}"
+    item.finished_at = timezone.now()
+    item.save(update_fields=["status", "chunks", "error", "finished_at"])
+
+
+def _loop(stop: threading.Event, once: bool, poll_interval: float) -> None:
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            item = claim_next()
+            if item is not None:
+                process(item)
+            elif once:
+                return
+            else:
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def run_worker(concurrency: int = 1, once: bool = False, poll_interval: float = 2.0,
+               stop: threading.Event | None = None) -> None:
+    """Drain the queue with `concurrency` threads; `once` exits when it is empty."""
+    stop = stop or threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest") as pool:
+        futures = [pool.submit(_loop, stop, once, poll_interval) for _ in range(concurrency)]
+        try:
+            while not all(f.done() for f in futures):
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            stop.set()
+        for f in futures:
+            f.result()
@@ -0,0 +1,260 @@
+# agent/management/commands/benchmark.py
+"""
+Offline ingest / retrieval benchmark against local stand-ins for Drive,
+Google OAuth and OpenAI (see agent.bench).
+
+    python manage.py benchmark --scales 10000,100000 --output bench.json
+
+1. ingests --docs synthetic Drive files through the real pipeline
+   (download → chunk → embed → upsert) and reports chunks/sec;
+2. for each scale, tops the bench user's rag_ragchunk up to that many rows
+   with random vectors (plus UserFile stats/centroids) and times
+   get_relevant_context, /api/files, /api/files?q= and /api/chat, plus
+   search_chunks with and without the MMR stage (N = MMR_BENCH_CANDIDATES)
+   and the bare NumPy MMR pick over N candidates.
+
+Everything is written under a dedicated bench user, whose data is cleared
+at the start and again at the end unless --keep. Run it against a scratch database: seeding 1M chunks
+takes a while and the tables stay bloated until VACUUM.
+"""
+import itertools
+import json
+import random
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from agent import bench, drive_tokens
+from agent.drive_ingest import ingest_drive_file
+from agent.models import DriveAuth, UserFile
+from rag.mmr import mmr
+from rag.models import RagChunk
+from rag.search import search_chunks, vector_cursor
+
+BENCH_EMAIL = "bench@localhost"
+CHUNKS_PER_FILE = 50
+SEED_BATCH = 10_000
+SEED_POOL = 16_384  # random floats the seeded vectors are cut from
+MMR_BENCH_CANDIDATES = 100
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=settings.BASE_DIR, timeout=5,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark ingest throughput and retrieval latency with fake Drive/OpenAI servers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", default="10000",
+                            help="comma-separated chunk counts, e.g. 10000,100000,1000000")
+        parser.add_argument("--docs", type=int, default=20, help="documents to ingest")
+        parser.add_argument("--doc-chars", type=int, default=20_000)
+        parser.add_argument("--queries", type=int, default=50, help="timed runs per endpoint")
+        parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+        parser.add_argument("--keep", action="store_true", help="keep the bench user's data")
+
+    def handle(self, *args, **opts):
+        scales = [int(x) for x in opts["scales"].split(",") if x.strip()]
+        with bench.FakeServices(opts["doc_chars"]) as fake, \
+                tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(
+                    DRIVE_API_BASE=f"{fake.base}/drive/v3",
+                    GOOGLE_TOKEN_URL=f"{fake.base}/token",
+                    TEXT_CACHE_DIR=cache_dir,
+                    ALLOWED_HOSTS=["testserver"],
+                ):
+            restore = self._point_openai_at(f"{fake.base}/v1")
+            user = self._bench_user()
+            try:
+                report = {
+                    "commit": _git_commit(),
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "settings": {
+                        name: getattr(settings, name) for name in (
+                            "CHUNK_TOKENS", "EMBED_BATCH_SIZE", "RAG_HNSW_EF_SEARCH",
+                            "RAG_VECTOR_INDEX", "RAG_VECTOR_DIMENSIONS",
+                            "RAG_FILE_PREFILTER", "RAG_EXPORT_CONCURRENCY",
+                            "RAG_CONTEXT_K", "RAG_CONTEXT_TOKENS",
+                            "RAG_MMR_CANDIDATES", "RAG_MMR_LAMBDA",
+                        )
+                    },
+                    "ingest": self._ingest(user, opts["docs"]),
+                    "scales": {},
+                }
+                for scale in scales:
+                    self._seed(user, scale, opts["doc_chars"])
+                    report["scales"][str(scale)] = self._latencies(user, scale, opts["queries"])
+            finally:
+                restore()
+                if not opts["keep"]:
+                    self._clear(user)
+
+        out = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                fh.write(out + "\n")
+            self.stderr.write(f"wrote {opts['output']}")
+        else:
+            self.stdout.write(out)
+
+    def _point_openai_at(self, base_url: str):
+        from agent import views
+        from rag import embeddings
+
+        clients = [embeddings.client, views.client, views.async_client]
+        previous = [c.base_url for c in clients]
+        for c in clients:
+            c.base_url = base_url
+
+        def restore():
+            for c, url in zip(clients, previous):
+                c.base_url = url
+        return restore
+
+    def _bench_user(self):
+        User = get_user_model()
+        user = User.objects.filter(email=BENCH_EMAIL).first()
+        if user is None:
+            user = User.objects.create_user(BENCH_EMAIL, BENCH_EMAIL, None)
+        self._clear(user)
+        DriveAuth.objects.create(
+            user=user, access_token="bench", refresh_token="bench",
+            expiry_ts=time.time() + 86400,
+        )
+        return user
+
+    def _clear(self, user) -> None:
+        RagChunk.objects.filter(user=user).delete()
+        UserFile.objects.filter(user=user).delete()
+        DriveAuth.objects.filter(user=user).delete()
+        drive_tokens.forget(user)
+
+    def _ingest(self, user, docs: int) -> dict:
+        chunks = 0
+        t0 = time.perf_counter()
+        for i in range(docs):
+            chunks += ingest_drive_file(user, f"bench-doc-{i}", "bench", force=True)
+        seconds = time.perf_counter() - t0
+        self.stderr.write(f"ingested {docs} docs / {chunks} chunks in {seconds:.1f}s")
+        return {
+            "docs": docs,
+            "chunks": chunks,
+            "seconds": round(seconds, 3),
+            "chunks_per_sec": round(chunks / seconds, 1) if seconds else None,
+        }
+
+    def _seed(self, user, scale: int, doc_chars: int) -> None:
+        have = RagChunk.objects.filter(user=user).count()
+        seeded = RagChunk.objects.filter(user=user, file_id__startswith="bench-seed-").count()
+        span = max(1, doc_chars - 1200)
+        t0 = time.perf_counter()
+        with connection.cursor() as cur:
+            for start in range(seeded, seeded + max(0, scale - have), SEED_BATCH):
+                stop = min(start + SEED_BATCH, seeded + scale - have)
+                cur.execute(
+                    """
+                    INSERT INTO rag_ragchunk
+                        (user_id, file_id, file_name, chunk_idx, char_start, char_end,
+                         text_hash, token_count, embedding)
+                    WITH pool AS (
+                        SELECT array_agg(random()::real - 0.5) AS a
+                        FROM generate_series(1, %(pool)s)
+                    )
+                    SELECT %(user)s,
+                           'bench-seed-' || (g / %(per)s),
+                           'bench-seed-' || (g / %(per)s) || '.txt',
+                           g %% %(per)s,
+                           ((g %% %(per)s) * 300) %% %(span)s,
+                           ((g %% %(per)s) * 300) %% %(span)s + 1200,
+                           '', 300,
+                           -- product of two random windows onto the pool: distinct
+                           -- per row and ~100x cheaper than 1536 random() calls
+                           a[o1:o1 + 1535]::vector * a[o2:o2 + 1535]::vector
+                    FROM pool, generate_series(%(start)s, %(stop)s - 1) AS g,
+                         LATERAL (SELECT 1 + (random() * (%(pool)s - 1536))::int + g * 0 AS o1,
+                                         1 + (random() * (%(pool)s - 1536))::int + g * 0 AS o2) w
+                    """,
+                    {"user": user.id, "per": CHUNKS_PER_FILE, "span": span,
+                     "pool": SEED_POOL, "start": start, "stop": stop},
+                )
+                self.stderr.write(f"  seeded {stop}/{seeded + scale - have}")
+            cur.execute(
+                """
+                INSERT INTO agent_userfile
+                    (user_id, file_id, name, version, md5_checksum, chunk_count,
+                     token_count, size, ingested_at, centroid)
+                SELECT user_id, file_id, MAX(file_name), '1', '', COUNT(*),
+                       SUM(token_count), %s, now(), AVG(embedding)
+                FROM rag_ragchunk
+                WHERE user_id = %s AND file_id LIKE 'bench-seed-%%'
+                GROUP BY user_id, file_id
+                ON CONFLICT (user_id, file_id) DO UPDATE SET
+                    chunk_count = EXCLUDED.chunk_count,
+                    token_count = EXCLUDED.token_count,
+                    centroid = EXCLUDED.centroid
+                """,
+                [doc_chars, user.id],
+            )
+            cur.execute("ANALYZE rag_ragchunk")
+            cur.execute("ANALYZE agent_userfile")
+        self.stderr.write(
+            f"scale {scale}: {RagChunk.objects.filter(user=user).count()} chunks, "
+            f"{UserFile.objects.filter(user=user).count()} files "
+            f"(seeding took {time.perf_counter() - t0:.1f}s)"
+        )
+
+    def _latencies(self, user, scale: int, runs: int) -> dict:
+        from agent.views import get_relevant_context
+
+        rnd = random.Random(scale)
+        # distinct queries so the query-embedding cache does not flatter the numbers
+        queries = iter(
+            " ".join(rnd.choice(bench.WORDS) for _ in range(8)) + f" {i}"
+            for i in range(runs * 3)
+        )
+        client = Client()
+        client.force_login(user)
+        return {
+            "get_relevant_context": bench.timed(
+                lambda: get_relevant_context(next(queries), user, 3), runs),
+            "list_files": bench.timed(lambda: client.get("/api/files"), runs),
+            "list_files_q": bench.timed(
+                lambda: client.get("/api/files", {"q": next(queries)}), runs),
+            "chat": bench.timed(
+                lambda: client.post("/api/chat", {"message": next(queries)},
+                                    content_type="application/json"), runs),
+            **self._rerank_latencies(user, runs),
+        }
+
+    def _rerank_latencies(self, user, runs: int) -> dict:
+        k, n = settings.RAG_CONTEXT_K, MMR_BENCH_CANDIDATES
+        embs = (bench.fake_embedding(f"rerank {i}") for i in itertools.count())
+
+        def search():
+            with vector_cursor() as cur:
+                search_chunks(cur, user.id, next(embs), k)
+
+        out = {}
+        for name, candidates in (("search_chunks", 0), (f"search_chunks_mmr_{n}", n)):
+            with override_settings(RAG_MMR_CANDIDATES=candidates):
+                out[name] = bench.timed(search, runs)
+        pool = np.random.default_rng(0).normal(size=(n, bench.DIMENSIONS)).astype(np.float32)
+        out[f"mmr_{n}"] = bench.timed(
+            lambda: mmr(next(embs), pool, k, settings.RAG_MMR_LAMBDA), runs
+        )
+        return out
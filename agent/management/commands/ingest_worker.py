@@ -0,0 +1,22 @@
+# agent/management/commands/ingest_worker.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agent.ingest_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Process queued Drive ingest jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.INGEST_WORKER_CONCURRENCY)
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument("--once", action="store_true",
+                            help="exit as soon as the queue is empty")
+
+    def handle(self, *args, **opts):
+        run_worker(
+            concurrency=opts["concurrency"],
+            once=opts["once"],
+            poll_interval=opts["poll_interval"],
+        )
@@ -0,0 +1,34 @@
+# agent/management/commands/sync_drive_folder.py
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from agent.drive_sync import sync_drive_folder
+from agent.drive_tokens import valid_token
+
+
+class Command(BaseCommand):
+    help = "Sync a Drive folder tree into a user's knowledge base (incremental after the first run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="email of the owning user")
+        parser.add_argument("--folder", default=os.getenv("DRIVE_FOLDER_ID"),
+                            help="Drive folder id (default: $DRIVE_FOLDER_ID)")
+        parser.add_argument("--full", action="store_true",
+                            help="re-crawl the whole tree instead of replaying changes")
+
+    def handle(self, *args, **opts):
+        if not opts["folder"]:
+            raise CommandError("--folder or DRIVE_FOLDER_ID is required")
+        user = get_user_model().objects.filter(email=opts["user"]).first()
+        if user is None:
+            raise CommandError(f"no user with email {opts['user']}")
+        if not valid_token(user):
+            raise CommandError(f"{opts['user']} has not connected Google Drive")
+
+        stats = sync_drive_folder(user, opts["folder"], full=opts["full"])
+        self.stdout.write(
+            f"ingested {stats['ingested']}, removed {stats['removed']}, "
+            f"failed {stats['failed']}"
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0002_ingest_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='md5_checksum',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='modified_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
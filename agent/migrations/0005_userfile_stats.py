@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+
+def backfill_stats(apps, schema_editor):
+    RagChunk = apps.get_model("rag", "RagChunk")
+    UserFile = apps.get_model("agent", "UserFile")
+    now = timezone.now()
+    per_file = (
+        RagChunk.objects.values("user_id", "file_id")
+        .annotate(chunks=Count("id"), tokens=Sum("token_count"), name=Max("file_name"))
+        .order_by()
+    )
+    for row in per_file.iterator():
+        UserFile.objects.update_or_create(
+            user_id=row["user_id"], file_id=row["file_id"],
+            defaults={"chunk_count": row["chunks"], "token_count": row["tokens"] or 0,
+                      "ingested_at": now},
+            create_defaults={"name": row["name"], "chunk_count": row["chunks"],
+                             "token_count": row["tokens"] or 0, "ingested_at": now},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0004_drivesyncstate'),
+        ('rag', '0005_ragchunk_token_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='chunk_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='token_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'name', 'id'], name='agent_userfile_listing'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# agent/migrations/0006_userfile_centroid.py
+# HNSW parameters come from settings, as in rag/0003.
+import pgvector.django.vector
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from pgvector.django import HnswIndex
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY
+
+    dependencies = [
+        ('agent', '0005_userfile_stats'),
+        ('rag', '0005_ragchunk_token_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='centroid',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=1536, null=True),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE agent_userfile uf
+            SET centroid = c.centroid
+            FROM (
+                SELECT user_id, file_id, AVG(embedding) AS centroid
+                FROM rag_ragchunk
+                GROUP BY user_id, file_id
+            ) c
+            WHERE uf.user_id = c.user_id AND uf.file_id = c.file_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name='userfile',
+            index=HnswIndex(
+                name='agent_userfile_centroid_hnsw',
+                fields=['centroid'],
+                m=settings.RAG_HNSW_M,
+                ef_construction=settings.RAG_HNSW_EF_CONSTRUCTION,
+                opclasses=['vector_cosine_ops'],
+            ),
+        ),
+    ]
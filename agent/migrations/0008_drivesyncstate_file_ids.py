@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+def force_recrawl(apps, schema_editor):
+    # existing trees never recorded their files: the next sync re-crawls
+    # (cheap for unchanged files) and fills file_ids
+    DriveSyncState = apps.get_model("agent", "DriveSyncState")
+    DriveSyncState.objects.update(page_token="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0007_cachedanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivesyncstate',
+            name='file_ids',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(force_recrawl, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0008_drivesyncstate_file_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjobfile',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0009_ingestjobfile_attempts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userfile',
+            name='agent_userfile_centroid_hnsw',
+        ),
+    ]
@@ -2,6 +2,7 @@
 import time
 from django.conf import settings
 from django.db import models
+from pgvector.django import VectorField
 
 class DriveAuth(models.Model):
     user          = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -17,14 +18,100 @@ class DriveAuth(models.Model):
         return f"DriveAuth({self.user})"
 
 
+class IngestJob(models.Model):
+    """One store_selected_files request; its files are queued individually."""
+    user       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def status(self) -> str:
+        states = {f.status for f in self.files.all()}
+        if states & {IngestJobFile.QUEUED, IngestJobFile.RUNNING}:
+            return "running" if states - {IngestJobFile.QUEUED} else "queued"
+        return "failed" if IngestJobFile.FAILED in states else "done"
+
+    def __str__(self):
+        return f"IngestJob({self.pk}, {self.user})"
+
+
+class IngestJobFile(models.Model):
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUSES = [(s, s) for s in (QUEUED, RUNNING, DONE, FAILED)]
+
+    job         = models.ForeignKey(IngestJob, related_name="files", on_delete=models.CASCADE)
+    file_id     = models.CharField(max_length=128)
+    name        = models.CharField(max_length=512)
+    status      = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    chunks      = models.IntegerField(null=True, blank=True)
+    error       = models.TextField(blank=True, default="")
+    started_at  = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts    = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
+
+
+class DriveSyncState(models.Model):
+    """Changes-API cursor for one synced folder tree of one user."""
+    user       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    folder_id  = models.CharField(max_length=128)
+    page_token = models.CharField(max_length=256, blank=True, default="")
+    folder_ids = models.JSONField(default=list)  # every folder inside the tree
+    file_ids   = models.JSONField(default=list)  # every file this sync ingested
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "folder_id")
+
+    def __str__(self):
+        return f"DriveSyncState({self.user}, {self.folder_id})"
+
+
 class UserFile(models.Model):
     user    = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     file_id = models.CharField(max_length=128)
     name    = models.CharField(max_length=512)
+    # Drive revision as of the last successful ingest (empty = never ingested)
+    version       = models.CharField(max_length=32, blank=True, default="")
+    md5_checksum  = models.CharField(max_length=32, blank=True, default="")
+    modified_time = models.DateTimeField(null=True, blank=True)
+    # maintained by ingest_drive_file so the file list never aggregates chunks
+    chunk_count   = models.IntegerField(default=0)
+    token_count   = models.BigIntegerField(default=0)
+    size          = models.BigIntegerField(default=0)  # bytes downloaded/exported
+    ingested_at   = models.DateTimeField(null=True, blank=True)
+    # mean of the file's chunk embeddings; compared by cosine distance
+    centroid      = VectorField(dimensions=1536, null=True, blank=True)
 
     class Meta:
         unique_together = ("user", "file_id")
+        indexes = [
+            # keyset pagination of list_files: WHERE user = … AND (name, id) > (…)
+            models.Index(fields=["user", "name", "id"], name="agent_userfile_listing"),
+        ]
 
     def __str__(self):
         return f"{self.user} → {self.name}"
 
+
+
+class CachedAnswer(models.Model):
+    """A chat answer, reused for near-duplicate questions over the same chunks."""
+    user       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    question   = models.TextField()
+    embedding  = VectorField(dimensions=1536)  # of the question; compared by cosine
+    # digest of the retrieved chunks' ids/offsets and their files' ingest versions
+    chunks_key = models.CharField(max_length=64)
+    file_ids   = models.JSONField(default=list)  # for invalidation on re-ingest
+    answer     = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "chunks_key"])]
+
+    def __str__(self):
+        return f"CachedAnswer({self.user}, {self.question[:40]!r})"
@@ -0,0 +1,169 @@
+# agent/pdf_extract.py
+"""
+PDF text extraction off the request/ingest threads.
+
+pdfminer is pure Python and CPU-bound, so parsing runs in a small process
+pool (PDF_EXTRACT_WORKERS; 0 parses in-process) whose workers have an
+address-space cap, are recycled after PDF_EXTRACT_MAX_TASKS tasks and are
+killed when a document overruns PDF_EXTRACT_TIMEOUT.
+
+A document is extracted PDF_EXTRACT_PAGE_BATCH pages per task and handed
+back range by range (`iter_page_batches`), so the caller chunks and embeds
+the first pages while later ones are still unparsed, and never holds more
+than one range of a large document's text.
+
+PDF_EXTRACT_ENGINE="pypdf2" tries PyPDF2's much faster extractor first and
+falls back to pdfminer when its output looks empty or garbled.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from multiprocessing import get_context
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ───────── worker side (no Django here: runs in spawned processes) ─────────
+
+def _init_worker(memory_mb: int) -> None:
+    if memory_mb:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _pdfminer_pages(path: str, first: int = 0, count: int = 0) -> list[str]:
+    """
+    Per-page text of pages [first, first + count) (all when count is 0);
+    "".join() over every page equals pdfminer.high_level.extract_text().
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    pages = []
+    rsrcmgr = PDFResourceManager(caching=True)
+    with open(path, "rb") as fp, StringIO() as out:
+        device = TextConverter(rsrcmgr, out, codec="utf-8", laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        pagenos = set(range(first, first + count)) if count else None
+        for page in PDFPage.get_pages(fp, pagenos, maxpages=first + count, caching=True):
+            interpreter.process_page(page)
+            pages.append(out.getvalue())
+            out.seek(0)
+            out.truncate()
+    return pages
+
+
+def _pypdf2_pages(path: str, first: int = 0, count: int = 0) -> list[str]:
+    from PyPDF2 import PdfReader
+
+    pages = PdfReader(path).pages
+    last = min(len(pages), first + count) if count else len(pages)
+    # "\f" page breaks, like pdfminer
+    return [(pages[i].extract_text() or "") + "\n\f" for i in range(first, last)]
+
+
+def looks_garbled(pages: list[str]) -> bool:
+    """Heuristic for extractor output not worth indexing."""
+    text = "".join(pages)
+    body = "".join(text.split())
+    if not body:
+        return True
+    odd = sum(1 for c in body if c == "�" or not c.isprintable())
+    if odd / len(body) > 0.05:
+        return True
+    # glyph-by-glyph output with no word spacing
+    return len(body) > 200 and (len(text) - len(body)) / len(text) < 0.03
+
+
+def _extract(path: str, engine: str, first: int = 0, count: int = 0) -> list[str]:
+    if engine == "pypdf2":
+        try:
+            pages = _pypdf2_pages(path, first, count)
+            if not looks_garbled(pages):
+                return pages
+        except Exception:
+            pass  # pdfminer copes with plenty PyPDF2 rejects
+    return _pdfminer_pages(path, first, count)
+
+
+# ───────── caller side ─────────
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACT_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.PDF_EXTRACT_MEMORY_MB,),
+                max_tasks_per_child=settings.PDF_EXTRACT_MAX_TASKS or None,
+            )
+        return _pool
+
+
+def _discard(pool: ProcessPoolExecutor) -> None:
+    """Kill a pool whose worker is stuck or dead; the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for proc in list((pool._processes or {}).values()):
+        proc.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(path: str, engine: str, first: int, count: int, deadline: float | None):
+    if not settings.PDF_EXTRACT_WORKERS:
+        return _extract(path, engine, first, count)
+
+    for attempt in range(2):
+        pool = _executor()
+        timeout = max(deadline - time.monotonic(), 0.001) if deadline else None
+        try:
+            return pool.submit(_extract, path, engine, first, count).result(timeout=timeout)
+        except TimeoutError:
+            logger.warning("pdf extraction of %s timed out", path)
+            _discard(pool)
+            raise
+        except BrokenProcessPool:
+            # a worker died (ours or a neighbour's); retry once on a fresh pool
+            _discard(pool)
+            if attempt:
+                raise
+
+
+def iter_page_batches(path: str):
+    """
+    Text of each page of the PDF at `path`, as lists of up to
+    PDF_EXTRACT_PAGE_BATCH pages (the whole document at once when 0).
+    Raises TimeoutError when the document takes longer than
+    PDF_EXTRACT_TIMEOUT seconds in total.
+    """
+    engine, count = settings.PDF_EXTRACT_ENGINE, settings.PDF_EXTRACT_PAGE_BATCH
+    deadline = (time.monotonic() + settings.PDF_EXTRACT_TIMEOUT
+                if settings.PDF_EXTRACT_TIMEOUT else None)
+    first = 0
+    while True:
+        pages = _run(path, engine, first, count, deadline)
+        if pages:
+            yield pages
+        if not count or len(pages) < count:
+            return
+        first += count
+
+
+def extract_pages(path: str) -> list[str]:
+    """Text of each page of the PDF at `path`, all at once."""
+    return [page for batch in iter_page_batches(path) for page in batch]
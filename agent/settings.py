@@ -27,8 +27,25 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 import dj_database_url
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# DB_POOL_MAX_SIZE > 0 → psycopg_pool connections shared by all threads of a
+# process; 0 → one persistent connection per thread, kept DB_CONN_MAX_AGE s.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))   # wait for a free connection
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
 if DATABASE_URL:                       # production / docker-compose run
-    DATABASES = {"default": dj_database_url.parse(DATABASE_URL)}
+    DATABASES = {"default": dj_database_url.parse(
+        DATABASE_URL,
+        conn_max_age=0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+        conn_health_checks=True,
+    )}
+    if DB_POOL_MAX_SIZE:
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+        }
 else:                                  # image-build time → use a temp SQLite
     DATABASES = {
         "default": {
@@ -174,6 +191,7 @@ MIDDLEWARE = (
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "rag.metrics.ServerTimingMiddleware",
 )
 
 
@@ -281,6 +299,113 @@ MFA_SUPPORTED_TYPES = [
 MFA_PASSKEY_LOGIN_ENABLED = False
 MFA_PASSKEY_SIGNUP_ENABLED = False
 
+# ───────── Embeddings ─────────
+# OpenAI-compatible endpoint (default: api.openai.com)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# Inputs and tokens packed into one embeddings.create call
+# (API limits: 2048 inputs, 300k tokens per request).
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+# Chunk size and overlap in embedding-model tokens (~4 chars per token).
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+# Query-embedding cache: per-process LRU plus, when an alias from CACHES is
+# given (e.g. a Redis/Memcached backend), a cache shared across workers.
+EMBED_QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "1024"))
+EMBED_QUERY_CACHE_TTL = int(os.getenv("EMBED_QUERY_CACHE_TTL", str(24 * 3600)))
+EMBED_QUERY_CACHE_ALIAS = os.getenv("EMBED_QUERY_CACHE_ALIAS", "")
+
+# ───────── Vector search (pgvector HNSW) ─────────
+# m / ef_construction are read when the index is (re)built by migrate.
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "16"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "64"))
+# Candidate list size per query; must be >= k. Higher = better recall, slower.
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "100"))
+# pgvector >= 0.8 only: "relaxed_order" or "strict_order" keeps walking the
+# graph until the user_id filter has produced k rows. Empty = disabled.
+RAG_HNSW_ITERATIVE_SCAN = os.getenv("RAG_HNSW_ITERATIVE_SCAN", "")
+# Compact index (pgvector >= 0.7): "vector" (full precision), "halfvec" or
+# "bit", over the first RAG_VECTOR_DIMENSIONS dims of each embedding. Build it
+# with `manage.py vector_index`. Compact searches fetch k × RAG_RERANK_FACTOR
+# candidates and re-rank them on the full vectors (0 = no re-rank).
+RAG_VECTOR_INDEX = os.getenv("RAG_VECTOR_INDEX", "vector")
+RAG_VECTOR_DIMENSIONS = int(os.getenv("RAG_VECTOR_DIMENSIONS", "1536"))
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+
+# ───────── Retrieval ─────────
+# Two-stage search (opt-in): nearest files by centroid, then exact chunks
+# within them. It bypasses the chunk index (and so the compact mode above),
+# and a strong chunk in a file whose centroid is far from the query is missed.
+RAG_FILE_PREFILTER = os.getenv("RAG_FILE_PREFILTER", "0") == "1"
+RAG_PREFILTER_FILES = int(os.getenv("RAG_PREFILTER_FILES", "8"))
+# Diversity rerank: fetch this many candidates and pick the final k by MMR,
+# trading relevance (λ → 1) against redundancy (λ → 0). <= k turns it off.
+RAG_MMR_CANDIDATES = int(os.getenv("RAG_MMR_CANDIDATES", "50"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+# Drive files fetched in parallel per chat message, and how long (seconds)
+# get_relevant_context waits before answering with whatever is ready.
+RAG_EXPORT_CONCURRENCY = int(os.getenv("RAG_EXPORT_CONCURRENCY", "4"))
+RAG_EXPORT_DEADLINE = float(os.getenv("RAG_EXPORT_DEADLINE", "8"))
+# Chat context: chunks retrieved per question, and the tiktoken budget they
+# are merged and packed into (see rag.context).
+RAG_CONTEXT_K = int(os.getenv("RAG_CONTEXT_K", "8"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+
+# ───────── Answer cache ─────────
+# chat answers are reused for questions at least this cosine-similar that
+# retrieve the same chunks; 0 disables the cache.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+
+# ───────── Extracted-text cache ─────────
+# zlib-compressed Drive text keyed by (file_id, revision); 0 disables it.
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", str(BASE_DIR / "text_cache"))
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# ───────── Ingest queue ─────────
+INGEST_WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "4"))
+# RUNNING items whose worker has not reported progress for this long are
+# assumed orphaned and re-claimed, up to INGEST_JOB_MAX_ATTEMPTS claims in all.
+INGEST_JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", "1800"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+
+# ───────── Google Drive HTTP client ─────────
+# Overridable so the benchmark (and staging) can point at stand-in servers.
+DRIVE_API_BASE = os.getenv("DRIVE_API_BASE", "https://www.googleapis.com/drive/v3")
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+# Drive downloads are spooled to a temp file; larger files are refused.
+DRIVE_MAX_DOWNLOAD_BYTES = int(os.getenv("DRIVE_MAX_DOWNLOAD_BYTES", str(100 * 1024 * 1024)))
+# keep-alive connections per host: ingest threads + retrieval export fan-out
+DRIVE_HTTP_POOL_SIZE = int(os.getenv(
+    "DRIVE_HTTP_POOL_SIZE", str(INGEST_WORKER_CONCURRENCY + RAG_EXPORT_CONCURRENCY)
+))
+DRIVE_HTTP_CONNECT_TIMEOUT = float(os.getenv("DRIVE_HTTP_CONNECT_TIMEOUT", "5"))
+DRIVE_HTTP_TIMEOUT = float(os.getenv("DRIVE_HTTP_TIMEOUT", "30"))          # read, API calls
+DRIVE_DOWNLOAD_TIMEOUT = float(os.getenv("DRIVE_DOWNLOAD_TIMEOUT", "120"))  # read, file bodies
+# 429/5xx retries with exponential backoff (backoff × 2^n s), Retry-After wins
+DRIVE_HTTP_RETRIES = int(os.getenv("DRIVE_HTTP_RETRIES", "5"))
+DRIVE_HTTP_BACKOFF = float(os.getenv("DRIVE_HTTP_BACKOFF", "0.5"))
+# access tokens this close (seconds) to expiry are refreshed in the background
+DRIVE_TOKEN_REFRESH_AHEAD = int(os.getenv("DRIVE_TOKEN_REFRESH_AHEAD", "300"))
+
+# ───────── PDF extraction pool ─────────
+# Worker processes (0 = parse in the calling thread), per-document timeout
+# (seconds), per-worker address-space cap (MB, 0 = none), tasks per worker
+# before it is replaced, and pages extracted per task (0 = whole document).
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "120"))
+PDF_EXTRACT_MEMORY_MB = int(os.getenv("PDF_EXTRACT_MEMORY_MB", "1024"))
+PDF_EXTRACT_MAX_TASKS = int(os.getenv("PDF_EXTRACT_MAX_TASKS", "50"))
+PDF_EXTRACT_PAGE_BATCH = int(os.getenv("PDF_EXTRACT_PAGE_BATCH", "32"))
+# "pdfminer", or "pypdf2" (faster; falls back to pdfminer on empty/garbled output)
+PDF_EXTRACT_ENGINE = os.getenv("PDF_EXTRACT_ENGINE", "pdfminer")
+
+# ───────── Metrics ─────────
+# Per-stage timings go out as a Server-Timing header on instrumented views.
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") == "1"
+# /metrics is open to staff; scrapers send `Authorization: Bearer <token>`.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 try:
     from .local_settings import *  # noqa
 except ImportError:
@@ -0,0 +1,133 @@
+# agent/text_cache.py
+"""
+Compressed on-disk cache of extracted Drive text, keyed by (file_id, revision).
+
+Ingest stores the text it has just chunked, so retrieval can slice chunk
+offsets out of it after a cheap metadata check instead of re-downloading
+and re-parsing the whole file. Size-bounded; least recently read files are
+evicted first (access time is tracked through mtime).
+"""
+import hashlib
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+_evict_lock = threading.Lock()
+# cache dir → [estimated bytes, writes since the last walk]. Other processes
+# write to the same directory, so the estimate is re-synced every
+# RESCAN_WRITES writes and whenever it crosses the limit.
+_usage: dict = {}
+RESCAN_WRITES = 100
+
+
+def revision(meta: dict) -> str | None:
+    """Content checksum for binary files, Drive's version counter otherwise."""
+    return meta.get("md5Checksum") or meta.get("version")
+
+
+def _dir(file_id: str) -> Path:
+    return Path(settings.TEXT_CACHE_DIR) / hashlib.sha256(file_id.encode()).hexdigest()
+
+
+def _path(file_id: str, rev: str) -> Path:
+    return _dir(file_id) / (hashlib.sha256(rev.encode()).hexdigest()[:32] + ".z")
+
+
+def get(file_id: str, rev: str | None) -> str | None:
+    if not rev or not settings.TEXT_CACHE_MAX_BYTES:
+        return None
+    path = _path(file_id, rev)
+    try:
+        data = path.read_bytes()
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return zlib.decompress(data).decode("utf-8")
+
+
+class _Discard:
+    def write(self, text: str) -> None:
+        pass
+
+
+class _Writer:
+    def __init__(self, fp):
+        self._fp = fp
+        self._z = zlib.compressobj(6)
+
+    def write(self, text: str) -> None:
+        self._fp.write(self._z.compress(text.encode("utf-8")))
+
+    def close(self) -> None:
+        self._fp.write(self._z.flush())
+
+
+@contextmanager
+def writer(file_id: str, rev: str | None):
+    """
+    Stream text into the cache piece by piece (`.write(str)`). The entry only
+    becomes visible once the block exits cleanly; on error it is discarded.
+    """
+    if not rev or not settings.TEXT_CACHE_MAX_BYTES:
+        yield _Discard()
+        return
+    path = _path(file_id, rev)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as fp:
+            w = _Writer(fp)
+            yield w
+            w.close()
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    # older revisions of this file can never be hit again
+    for old in path.parent.glob("*.z"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    _evict(path.stat().st_size)
+
+
+def put(file_id: str, rev: str | None, text: str) -> None:
+    with writer(file_id, rev) as w:
+        w.write(text)
+
+
+def _evict(added: int) -> None:
+    """Account for a write of `added` bytes; walk and trim only when over the limit."""
+    limit = settings.TEXT_CACHE_MAX_BYTES
+    root = settings.TEXT_CACHE_DIR
+    with _evict_lock:
+        usage = _usage.get(root)
+        if usage and usage[1] < RESCAN_WRITES:
+            usage[0] += added
+            usage[1] += 1
+            if usage[0] <= limit:
+                return
+        entries = []
+        for p in Path(settings.TEXT_CACHE_DIR).glob("*/*.z"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        _usage[root] = [total, 0]
+        if total <= limit:
+            return
+        # trim to 90 % so the next walk is not due after the next write
+        for _, size, p in sorted(entries):
+            p.unlink(missing_ok=True)
+            try:
+                p.parent.rmdir()
+            except OSError:
+                pass  # other revisions / writers still in there
+            total -= size
+            if total <= limit * 0.9:
+                break
+        _usage[root][0] = total
@@ -7,14 +7,16 @@ from allauth.account.decorators import secure_admin_login
 
 from agent.views import (
     chat_completion,
+    chat_stream,
     drive_connect,
     drive_callback,
     drive_token,
     store_selected_files,
+    ingest_status,
     index_with_csrf,
     get_csrf_token,
 )
-from rag.views import list_files, search_similar
+from rag.views import db_pool, list_files, prometheus_metrics, search_similar
 
 admin.autodiscover()
 admin.site.login = secure_admin_login(admin.site.login)
@@ -33,12 +35,16 @@ urlpatterns = [
     path("api/csrf", get_csrf_token, name="get_csrf_token"),
 
     path("api/chat",   chat_completion, name="chat_completion"),
+    path("api/chat/stream", chat_stream, name="chat_stream"),
     path("api/files",  list_files,      name="list_files"),
     path("api/search", search_similar,  name="search_similar"),
+    path("api/db/pool", db_pool,        name="db_pool"),
+    path("metrics",     prometheus_metrics, name="metrics"),
 
     path("connect/drive/",            drive_connect,        name="drive_connect"),
     path("connect/drive/callback/",   drive_callback,       name="drive_callback"),
     path("api/drive/token",           drive_token,          name="drive_token"),
     path("api/drive/files",           store_selected_files, name="store_selected_files"),
+    path("api/ingest/<int:job_id>",   ingest_status,        name="ingest_status"),
 ]
 
@@ -1,26 +1,34 @@
 # agent/views.py
-import json, os, time, requests
+import contextvars, json, logging, os, tempfile, time
 from urllib.parse import urlencode
-from collections import defaultdict
-import io, pdfminer.high_level
+from concurrent.futures import ThreadPoolExecutor, wait
 
+from django.conf import settings
+from django.db.models import Prefetch
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse
 from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.middleware.csrf import get_token
-from django.db import connection
 
-from openai import OpenAI
-from pgvector.psycopg import register_vector
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI, OpenAI
 
-from agent.models import DriveAuth, UserFile
-from agent.drive_ingest import ingest_drive_file
+from agent import answer_cache, drive_client, drive_tokens, text_cache
+from agent.drive_tokens import valid_token
+from agent.drive_ingest import iter_text
+from agent.models import DriveAuth, IngestJob, IngestJobFile, UserFile
+from agent.ingest_jobs import enqueue
+from rag.embeddings import embed_query
+from rag import context, metrics
 from rag.models import RagChunk
+from rag.search import search_chunks, vector_cursor
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-EMBED_MODEL = "text-embedding-3-small"
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=settings.OPENAI_BASE_URL)
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=settings.OPENAI_BASE_URL)
+CHAT_MODEL = "gpt-3.5-turbo"
+logger = logging.getLogger(__name__)
 
 # ───────── OAuth helpers ─────────
 DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
@@ -48,17 +56,13 @@ def drive_callback(request):
     if not code:
         return JsonResponse({"error": "Missing code"}, status=400)
 
-    token_res = requests.post(
-        "https://oauth2.googleapis.com/token",
-        data={
-            "code": code,
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-            "redirect_uri": request.build_absolute_uri(reverse("drive_callback")),
-            "grant_type": "authorization_code",
-        },
-        timeout=30,
-    ).json()
+    token_res = drive_client.token_request({
+        "code": code,
+        "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+        "redirect_uri": request.build_absolute_uri(reverse("drive_callback")),
+        "grant_type": "authorization_code",
+    })
 
     DriveAuth.objects.update_or_create(
         user=request.user,
@@ -68,34 +72,15 @@ def drive_callback(request):
             "expiry_ts": time.time() + token_res.get("expires_in", 0),
         },
     )
+    drive_tokens.forget(request.user)
     return HttpResponseRedirect("/chat")
 
 
-def _valid_token(user):
-    auth = getattr(user, "driveauth", None)
-    if not auth:
-        return None
-    if auth.expiry_ts <= time.time() + 60 and auth.refresh_token:
-        res = requests.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-                "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-                "refresh_token": auth.refresh_token,
-                "grant_type": "refresh_token",
-            },
-            timeout=30,
-        ).json()
-        auth.access_token = res["access_token"]
-        auth.expiry_ts = time.time() + res.get("expires_in", 0)
-        auth.save()
-    return auth.access_token
-
 from agent.auth import login_required_json
 @login_required_json
 @require_GET
 def drive_token(request):
-    token = _valid_token(request.user)
+    token = valid_token(request.user)
     if not token:
         return JsonResponse({"error": "not_connected"}, status=400)
     return JsonResponse({"token": token})
@@ -106,103 +91,151 @@ def drive_token(request):
 def store_selected_files(request):
     """
     Payload: {files:[{id,name},...]}
-    Saves metadata + ingests embeddings/offsets only.
+    Saves metadata and queues ingestion; poll /api/ingest/<job> for progress.
     """
     payload = json.loads(request.body or "{}")
     files = payload.get("files") or []
     if not files:
         return JsonResponse({"error": "No files"}, status=400)
 
-    token = _valid_token(request.user)
+    token = valid_token(request.user)
     if not token:
         return JsonResponse({"error": "No Drive token"}, status=403)
 
-    ingested = 0
     for f in files:
         UserFile.objects.update_or_create(
             user=request.user, file_id=f["id"], defaults={"name": f["name"]}
         )
-        try:
-            ingest_drive_file(request.user, f["id"], token)
-            ingested += 1
-        except Exception:
-            continue
+    job = enqueue(request.user, files)
+    return JsonResponse({"job": job.id, "stored": len(files)}, status=202)
 
-    return JsonResponse({"stored": len(files), "ingested": ingested})
 
+@login_required_json
+@require_GET
+def ingest_status(request, job_id: int):
+    job = (
+        IngestJob.objects.filter(pk=job_id, user=request.user)
+        .prefetch_related(Prefetch("files", queryset=IngestJobFile.objects.order_by("id")))
+        .first()
+    )
+    if job is None:
+        return JsonResponse({"error": "not_found"}, status=404)
+    return JsonResponse({
+        "job": job.id,
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "files": [
+            {
+                "id": f.file_id,
+                "name": f.name,
+                "status": f.status,
+                "chunks": f.chunks,
+                "error": f.error or None,
+            }
+            for f in job.files.all()
+        ],
+    })
 
-# ───────── RAG retrieval ─────────
-def _embed_query(q):
-    return client.embeddings.create(model=EMBED_MODEL, input=q).data[0].embedding
 
+# ───────── RAG retrieval ─────────
 def _export_drive_text(file_id: str, token: str) -> str:
-    hdrs = {"Authorization": f"Bearer {token}"}
-    meta = requests.get(
-        f"https://www.googleapis.com/drive/v3/files/{file_id}?fields=name,mimeType",
-        headers=hdrs,
-        timeout=30,
-    ).json()
+    """Whole text of a Drive file (chunk offsets are sliced out of it), cached per revision."""
+    with metrics.stage("drive_meta"):
+        meta = drive_client.file_meta(file_id, token, "name,mimeType,version,md5Checksum")
     name = meta["name"]
     mime = meta["mimeType"]
 
-    if mime.startswith("application/vnd.google-apps"):
-        export_map = {
-            "application/vnd.google-apps.document": "text/plain",
-            "application/vnd.google-apps.presentation": "text/plain",
-            "application/vnd.google-apps.spreadsheet": "text/csv",
-        }
-        export_mime = export_map.get(mime)
-        if not export_mime:
-            return ""
-        url = (
-            f"https://www.googleapis.com/drive/v3/files/{file_id}/export"
-            f"?mimeType={export_mime}"
-        )
-    else:
-        url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-
-    data = requests.get(url, headers=hdrs, timeout=120).content
-
-    if mime == "application/pdf" or name.lower().endswith(".pdf"):
-        return pdfminer.high_level.extract_text(io.BytesIO(data))
-    return data.decode("utf-8", errors="ignore")
-
-
-def get_relevant_context(q: str, user, k: int = 3):
-    emb = _embed_query(q)
-    with connection.cursor() as cur:
-        register_vector(cur.connection)
-        cur.execute(
-            """
-            SELECT file_id, char_start, char_end
-            FROM rag_ragchunk
-            WHERE user_id = %s
-            ORDER BY embedding <-> %s::vector
-            LIMIT %s
-            """,
-            [user.id, emb, k],
-        )
-        rows = cur.fetchall()
+    rev = text_cache.revision(meta)
+    cached = text_cache.get(file_id, rev)
+    metrics.cache_lookup("text", cached is not None)
+    if cached is not None:
+        return cached
+
+    url = drive_client.content_url(file_id, mime)
+    if url is None:
+        return ""
+
+    with tempfile.NamedTemporaryFile() as fp, text_cache.writer(file_id, rev) as cache:
+        with metrics.stage("drive_download"):
+            drive_client.download_to(fp, url, token)
+        pieces = []
+        with metrics.stage("extract"):
+            for piece in iter_text(fp, mime, name):
+                cache.write(piece)
+                pieces.append(piece)
+    return "".join(pieces)
+
+
+def _search(q: str, user, k: int):
+    """(query embedding, top-k `(id, file_id, file_name, start, end)` rows)."""
+    with metrics.stage("embed"):
+        emb = embed_query(q)
+    with metrics.stage("vector"), vector_cursor() as cur:
+        rows = search_chunks(cur, user.id, emb, k)
+    return emb, rows
+
+
+def _retrieve(q: str, user, k: int | None = None) -> list[dict]:
+    """
+    Context for `q`: the top-k chunks (RAG_CONTEXT_K by default), merged per
+    file and packed into RAG_CONTEXT_TOKENS in relevance order, each with its
+    source metadata and text. Chunks whose file misses the export deadline
+    are dropped.
+    """
+    rows = _search(q, user, k or settings.RAG_CONTEXT_K)[1]
+    return context.pack(rows, _export_texts(rows, user))
+
 
+def _export_texts(rows, user) -> dict:
+    """file_id → text for the rows' files that exported before the deadline."""
     if not rows:
-        return []
+        return {}
 
-    token = _valid_token(user)
+    with metrics.stage("drive_token"):
+        token = valid_token(user)
     if not token:
-        return []
+        return {}
+
+    # export distinct files in parallel; give up on stragglers at the deadline
+    file_ids = list(dict.fromkeys(row[1] for row in rows))
+    pool = ThreadPoolExecutor(
+        max_workers=min(len(file_ids), settings.RAG_EXPORT_CONCURRENCY)
+    )
+    # each export runs in a copy of this context so its stages reach the request
+    futures = {
+        pool.submit(contextvars.copy_context().run, _export_drive_text, fid, token): fid
+        for fid in file_ids
+    }
+    with metrics.stage("drive_export"):
+        done, pending = wait(futures, timeout=settings.RAG_EXPORT_DEADLINE)
+    pool.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        logger.warning("drive export deadline hit for %d file(s)", len(pending))
+
+    texts = {}
+    for fut in done:
+        try:
+            texts[futures[fut]] = fut.result()
+        except Exception:
+            logger.exception("drive export of %s failed", futures[fut])
+    return texts
+
 
-    # group by file_id
-    chunks_by_file = defaultdict(list)
-    for file_id, start, end in rows:
-        chunks_by_file[file_id].append((start, end))
+def get_relevant_context(q: str, user, k: int | None = None):
+    return [c["text"] for c in _retrieve(q, user, k)]
 
-    contexts = []
-    for file_id, ranges in chunks_by_file.items():
-        full_text = _export_drive_text(file_id, token)
-        for start, end in ranges:
-            contexts.append(full_text[start:end])
 
-    return contexts[:k]
+def _chat_messages(msg: str, docs) -> list[dict]:
+    ctx = "".join(f"<doc>{c}</doc>\n" for c in docs)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Answer using the context below. If irrelevant, answer normally.\n" + ctx
+            ),
+        },
+        {"role": "user", "content": msg},
+    ]
 
 
 @require_POST
@@ -212,23 +245,92 @@ def chat_completion(request):
     if not msg:
         return JsonResponse({"response": "Please enter a message."})
 
-    docs = get_relevant_context(msg, request.user, 3)
-    ctx = "".join(f"<doc>{c}</doc>\n" for c in docs)
+    user = request.user
+    if not (answer_cache.enabled() and user.is_authenticated):
+        return JsonResponse({"response": _complete(msg, get_relevant_context(msg, user))})
+
+    emb, rows = _search(msg, user, settings.RAG_CONTEXT_K)
+    key = answer_cache.chunks_key(user, rows)
+    reply = answer_cache.lookup(user, emb, key)
+    if reply is None:
+        reply = answer_cache.flight.do(
+            (user.pk, " ".join(msg.lower().split()), key),
+            lambda: _answer_and_cache(msg, user, emb, rows, key),
+        )
+    return JsonResponse({"response": reply})
 
-    reply = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Answer using the context below. If irrelevant, answer normally.\n" + ctx
-                ),
-            },
-            {"role": "user", "content": msg},
-        ],
-    ).choices[0].message.content.strip()
 
-    return JsonResponse({"response": reply})
+def _complete(msg: str, docs) -> str:
+    with metrics.stage("completion"):
+        completion = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_chat_messages(msg, docs),
+        )
+    _record_usage(completion.usage)
+    return completion.choices[0].message.content.strip()
+
+
+def _answer_and_cache(msg: str, user, emb, rows, key: str) -> str:
+    texts = _export_texts(rows, user)
+    chunks = context.pack(rows, texts)
+    reply = _complete(msg, [c["text"] for c in chunks])
+    # an answer built on partial context (export failed / timed out) is not reused
+    if all(row[1] in texts for row in rows):
+        answer_cache.store(user, msg, emb, key, [row[1] for row in rows], reply)
+    return reply
+
+
+def _record_usage(usage) -> None:
+    metrics.record_usage(CHAT_MODEL, "prompt", getattr(usage, "prompt_tokens", None))
+    metrics.record_usage(CHAT_MODEL, "completion", getattr(usage, "completion_tokens", None))
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@require_POST
+async def chat_stream(request):
+    """
+    Server-Sent Events variant of chat_completion (serve via agent.asgi):
+    one `sources` event with the retrieved chunks' metadata, then `token`
+    events as the completion streams in, then `done`. If the client goes
+    away, the ASGI handler cancels the generator and the upstream stream
+    is closed so no further tokens are generated.
+    """
+    data = json.loads(request.body or "{}")
+    msg = data.get("message", "").strip()
+    if not msg:
+        return JsonResponse({"response": "Please enter a message."})
+    user = await request.auser()
+
+    async def events():
+        chunks = await sync_to_async(_retrieve)(msg, user)
+        yield _sse("sources", [
+            {key: c[key] for key in ("file_id", "file_name", "char_start", "char_end")}
+            for c in chunks
+        ])
+        stream = await async_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_chat_messages(msg, [c["text"] for c in chunks]),
+            stream=True,
+            stream_options={"include_usage": True},  # usage arrives on a final, choice-less chunk
+        )
+        try:
+            async for part in stream:
+                if not part.choices:
+                    _record_usage(part.usage)
+                delta = part.choices[0].delta.content if part.choices else None
+                if delta:
+                    yield _sse("token", {"text": delta})
+            yield _sse("done", {})
+        finally:
+            await stream.close()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # let nginx pass events through
+    return response
 
 
 # ───────── CSRF helpers ─────────
@@ -17,6 +17,7 @@ export default function App() {
   const [chatLoading, setLoading] = useState(false);
 
   const [files, setFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [search, setSearch] = useState("");
   const fetchTimer = useRef(null);
 
@@ -148,26 +149,34 @@ export default function App() {
     }
   };
 
+  /* ───── Files list: fetch a page (the listing is keyset-paginated) ───── */
+  const loadFiles = useCallback(async (url, append = false) => {
+    const res = await fetch(url, { credentials: "include" });
+    if (!res.ok) return;
+    const page = await res.json();
+    setFiles(prev => (append ? [...prev, ...page] : page));
+    setNextCursor(res.headers.get("X-Next-Cursor"));
+  }, []);
+
+  const loadMoreFiles = () =>
+    loadFiles(`/api/files?cursor=${encodeURIComponent(nextCursor)}`, true);
+
   /* ───── Files list: initial load ───── */
   useEffect(() => {
-    (async () => {
-      const res = await fetch("/api/files", { credentials: "include" });
-      if (res.ok) setFiles(await res.json());
-    })();
-  }, []);
+    loadFiles("/api/files");
+  }, [loadFiles]);
 
   /* ───── Files list: live similarity search ───── */
   useEffect(() => {
     if (fetchTimer.current) clearTimeout(fetchTimer.current);
-    fetchTimer.current = setTimeout(async () => {
+    fetchTimer.current = setTimeout(() => {
       const url = search.trim()
         ? `/api/files?q=${encodeURIComponent(search)}`
         : "/api/files";
-      const res = await fetch(url, { credentials: "include" });
-      if (res.ok) setFiles(await res.json());
+      loadFiles(url);
     }, 300);
     return () => clearTimeout(fetchTimer.current);
-  }, [search]);
+  }, [search, loadFiles]);
 
   return (
     <div style={styles.layout}>
@@ -182,7 +191,7 @@ export default function App() {
         <h4 style={{ marginTop: 16 }}>Knowledge files</h4>
         <ul style={styles.list}>
           {files.map(f => (
-            <li key={f.file_name}>
+            <li key={f.file_id || f.file_name}>
               {f.file_name} <small>{f.chunks && `(${f.chunks})`}</small>
               {f.distance !== undefined && (
                 <small style={{ color: "#888" }}> – {f.distance.toFixed(2)}</small>
@@ -190,6 +199,11 @@ export default function App() {
             </li>
           ))}
         </ul>
+        {nextCursor && !search.trim() && (
+          <button style={{ ...styles.btn, width: "100%", marginTop: 8 }} onClick={loadMoreFiles}>
+            Load more
+          </button>
+        )}
 
         <h4 style={{ marginTop: 24 }}>Add knowledge</h4>
         {pickerReady ? (
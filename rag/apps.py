@@ -0,0 +1,12 @@
+# rag/apps.py
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class RagConfig(AppConfig):
+    name = "rag"
+
+    def ready(self):
+        from rag.db import on_connection_created
+
+        connection_created.connect(on_connection_created, dispatch_uid="rag.register_vector")
@@ -0,0 +1,105 @@
+# rag/chunking.py
+"""
+Token-aware chunking.
+
+Chunks hold at most settings.CHUNK_TOKENS tokens (embedding-model
+tokenizer), end on the last paragraph / sentence / line / word boundary in
+the second half of the window, and overlap the previous chunk by up to
+settings.CHUNK_OVERLAP_TOKENS tokens, starting at a sentence boundary when
+one falls inside the overlap. Offsets are exact character positions in the
+concatenated input, so `text[char_start:char_end]` reproduces the chunk.
+"""
+import re
+from bisect import bisect_left
+
+from django.conf import settings
+
+from rag.embeddings import _encoding
+
+# tokens held back from the end of a partial buffer so that text arriving
+# in the next piece cannot change how the emitted window was tokenized
+_MARGIN = 16
+
+_PARAGRAPH = re.compile(r"\n[ \t]*\n")
+_SENTENCE = re.compile(r"[.!?][\"'”’)\]]*(?=\s)")
+_LINE = re.compile(r"\n")
+_SPACE = re.compile(r"\s")
+# (pattern, cut after the match?) in order of preference
+_BOUNDARIES = ((_PARAGRAPH, True), (_SENTENCE, True), (_LINE, True), (_SPACE, False))
+
+
+def _snap_end(buf, offsets, i, j):
+    """Pull window end `j` back to the best boundary in the window's second half."""
+    lo, hi = offsets[i + (j - i) // 2], offsets[j]
+    for pattern, after in _BOUNDARIES:
+        last = None
+        for last in pattern.finditer(buf, lo, hi):
+            pass
+        if last:
+            k = bisect_left(offsets, last.end() if after else last.start(), i + 1, j)
+            return k
+    return j
+
+
+def _next_start(buf, offsets, i, j, overlap):
+    """First token of the chunk after window [i, j), overlapping it."""
+    s = max(i + 1, j - overlap)
+    if s >= j:
+        return s
+    m = _SENTENCE.search(buf, offsets[s], offsets[j])
+    if m:
+        snapped = bisect_left(offsets, m.end(), s, j)
+        # keep at least half the overlap rather than start on the chunk's last sentence
+        if j - snapped >= overlap // 2:
+            return snapped
+    # otherwise at least do not start mid-word (if there is a word start at all)
+    w = s
+    while w < j and not (buf[offsets[w]].isspace() or buf[offsets[w] - 1].isspace()):
+        w += 1
+    return w if w < j else s
+
+
+def iter_chunks(pieces, size: int | None = None, overlap: int | None = None):
+    """
+    Yield (idx, char_start, char_end, text, n_tokens) over the concatenation
+    of `pieces` — a str or any iterable of str, e.g. pages as they are
+    extracted. Only a window of a few chunks is ever held in memory.
+    """
+    size = size or settings.CHUNK_TOKENS
+    overlap = settings.CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    enc = _encoding()
+    pieces = iter(pieces)
+    buf, base, idx, checked = "", 0, 0, 0
+    final = False
+    while not final:
+        piece = next(pieces, None)
+        if piece is None:
+            final = True
+        else:
+            buf += piece
+            # a token is at least one char: skip re-encoding until it can pay off
+            if len(buf) < max(size + _MARGIN, checked + size):
+                continue
+        checked = len(buf)
+
+        tokens = enc.encode(buf, disallowed_special=())
+        offsets = enc.decode_with_offsets(tokens)[1] + [len(buf)]
+        i = 0
+        while len(tokens) - i > (0 if final else size + _MARGIN):
+            j = min(len(tokens), i + size)
+            if j < len(tokens):
+                j = _snap_end(buf, offsets, i, j)
+            start, end = offsets[i], offsets[j]
+            text = buf[start:end]
+            if text.strip():
+                yield idx, base + start, base + end, text, j - i
+                idx += 1
+            if j == len(tokens):
+                i = j
+                break
+            i = _next_start(buf, offsets, i, j, overlap)
+        base += offsets[i]
+        buf = buf[offsets[i]:]
+        checked = len(buf)
@@ -0,0 +1,76 @@
+# rag/context.py
+"""
+Assemble retrieved chunks into prompt context under a token budget.
+
+Chunks are taken in relevance order. Each one is merged with any
+overlapping or touching range already picked from the same file, so the
+chunker's overlap is sent once, and it is kept only if the merged context
+still fits in `budget` tokens. Later, less relevant chunks may still fit
+after a larger one was skipped. The result is one segment per merged
+range, ordered by its best chunk's rank.
+"""
+from django.conf import settings
+
+from rag.embeddings import count_tokens, truncate_tokens
+
+
+def _merge(ranges, start: int, end: int, rank: int):
+    """`ranges` (sorted [start, end, rank] lists) with [start, end) folded in."""
+    out, new = [], [start, end, rank]
+    for r in ranges:
+        if r[1] < new[0] or r[0] > new[1]:
+            out.append(r)
+        else:
+            new = [min(r[0], new[0]), max(r[1], new[1]), min(r[2], new[2])]
+    out.append(new)
+    return sorted(out)
+
+
+def _tokens(text: str, ranges) -> int:
+    return sum(count_tokens(text[s:e]) for s, e, _ in ranges)
+
+
+def pack(rows, texts: dict, budget: int | None = None) -> list[dict]:
+    """
+    rows:  `(id, file_id, file_name, char_start, char_end)` in relevance order
+    texts: file_id → extracted text; rows of files missing here are skipped
+    Returns [{file_id, file_name, char_start, char_end, text}] within `budget`
+    tokens (settings.RAG_CONTEXT_TOKENS by default).
+    """
+    budget = settings.RAG_CONTEXT_TOKENS if budget is None else budget
+    picked: dict = {}      # file_id → sorted [start, end, rank]
+    cost: dict = {}        # file_id → tokens of its picked ranges
+    names, used = {}, 0
+    for rank, (_, file_id, file_name, start, end) in enumerate(rows):
+        text = texts.get(file_id)
+        if text is None:
+            continue
+        ranges = _merge(picked.get(file_id, []), start, end, rank)
+        tokens = _tokens(text, ranges)
+        extra = tokens - cost.get(file_id, 0)
+        if used + extra > budget:
+            if used == 0:
+                # a single chunk over budget: send its head rather than nothing
+                head = truncate_tokens(text[start:end], budget)
+                return [{"file_id": file_id, "file_name": file_name, "char_start": start,
+                         "char_end": start + len(head), "text": head}]
+            continue
+        picked[file_id], cost[file_id] = ranges, tokens
+        names[file_id] = file_name
+        used += extra
+
+    segments = [
+        (rank, file_id, start, end)
+        for file_id, ranges in picked.items()
+        for start, end, rank in ranges
+    ]
+    return [
+        {
+            "file_id": file_id,
+            "file_name": names[file_id],
+            "char_start": start,
+            "char_end": end,
+            "text": texts[file_id][start:end],
+        }
+        for _, file_id, start, end in sorted(segments)
+    ]
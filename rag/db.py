@@ -0,0 +1,49 @@
+# rag/db.py
+"""
+Per-connection setup and pool introspection.
+
+The pgvector adapters are registered once per physical connection from the
+`connection_created` signal (wired in rag.apps), instead of on every cursor.
+With DB_POOL_MAX_SIZE the signal fires on each checkout from the pool, so
+connections that already carry the adapters are remembered and skipped.
+vector_cursor() calls register_vector_once() too, which is a set lookup
+except for connections opened before the extension existed.
+"""
+import logging
+import weakref
+
+from django.db import connections
+from pgvector.psycopg import register_vector
+
+logger = logging.getLogger(__name__)
+
+_registered = weakref.WeakSet()   # raw psycopg connections
+
+
+def register_vector_once(connection) -> None:
+    if connection.vendor != "postgresql":
+        return
+    raw = connection.connection
+    if raw in _registered:
+        return
+    try:
+        register_vector(raw)
+    except Exception:
+        # extension not created yet (first `migrate`); retried by vector_cursor
+        logger.debug("pgvector type not available on %s", connection.alias)
+        return
+    _registered.add(raw)
+
+
+def on_connection_created(sender, connection, **kwargs) -> None:
+    register_vector_once(connection)
+
+
+def pool_stats() -> dict:
+    """psycopg_pool counters per database alias (empty when pooling is off)."""
+    out = {}
+    for conn in connections.all():
+        pool = getattr(conn, "pool", None)  # only the postgresql backend has one
+        if pool is not None:
+            out[conn.alias] = pool.get_stats()
+    return out
@@ -0,0 +1,167 @@
+# rag/embeddings.py
+"""
+OpenAI embedding helpers shared by ingest and retrieval.
+
+`embed_texts` packs many inputs into each `embeddings.create` call, bounded
+by settings.EMBED_BATCH_SIZE items and settings.EMBED_BATCH_TOKENS tokens.
+
+`embed_query` is the cached path for search/chat queries: an in-process LRU,
+an optional shared Django cache (settings.EMBED_QUERY_CACHE_ALIAS), and
+single-flight so identical concurrent queries cost one upstream call.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import tiktoken
+from django.conf import settings
+from django.core.cache import caches
+from openai import BadRequestError, OpenAI
+
+from rag import metrics
+from rag.singleflight import SingleFlight
+
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=settings.OPENAI_BASE_URL)
+EMBED_MODEL = "text-embedding-3-small"
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    return tiktoken.encoding_for_model(EMBED_MODEL)
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, n: int) -> str:
+    """
+    The longest prefix of `text` that is at most `n` tokens. Always a real
+    prefix: a token boundary can fall inside a multi-byte character, whose
+    decoded half would be U+FFFD, so then the cut is searched per character.
+    """
+    head = _encoding().decode(_encoding().encode(text, disallowed_special=())[:n])
+    if text.startswith(head):
+        return head
+    lo, hi = 0, min(len(head), len(text))   # text[:lo] fits
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= n:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def _batches(texts, token_counts):
+    """Split `texts` into consecutive slices that fit both batch budgets."""
+    size, budget = settings.EMBED_BATCH_SIZE, settings.EMBED_BATCH_TOKENS
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        n = token_counts[i] if token_counts else count_tokens(text)
+        if i > start and (i - start >= size or tokens + n > budget):
+            yield texts[start:i]
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        yield texts[start:]
+
+
+def _create(batch):
+    try:
+        with metrics.stage("embed"):
+            res = client.embeddings.create(model=EMBED_MODEL, input=batch)
+    except BadRequestError:
+        # one bad input rejects the whole request → bisect until it is isolated
+        if len(batch) == 1:
+            raise
+        mid = len(batch) // 2
+        return _create(batch[:mid]) + _create(batch[mid:])
+    _record_usage(res)
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+
+def _record_usage(res) -> None:
+    usage = getattr(res, "usage", None)
+    metrics.record_usage(EMBED_MODEL, "embedding", getattr(usage, "prompt_tokens", None))
+
+
+def embed_texts(texts, token_counts=None) -> list:
+    """
+    Embed `texts` with as few API calls as possible, preserving order.
+    Pass precomputed `token_counts` (e.g. from the chunker) to skip tokenizing.
+    """
+    texts = list(texts)
+    token_counts = list(token_counts) if token_counts is not None else None
+    out = []
+    for batch in _batches(texts, token_counts):
+        out.extend(_create(batch))
+    return out
+
+
+# ───────── query embeddings ─────────
+_lru: OrderedDict = OrderedDict()   # key → (expires_at, embedding)
+_lru_lock = threading.Lock()
+_flight = SingleFlight()
+_stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+
+def cache_stats() -> dict:
+    with _lru_lock:
+        return {**_stats, "size": len(_lru)}
+
+
+def _key(text: str) -> str:
+    return f"embq:{EMBED_MODEL}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+
+def _local_get(key):
+    with _lru_lock:
+        hit = _lru.get(key)
+        if hit and hit[0] > time.monotonic():
+            _lru.move_to_end(key)
+            _stats["local_hits"] += 1
+            return hit[1]
+        _lru.pop(key, None)
+    return None
+
+
+def _local_put(key, emb):
+    with _lru_lock:
+        _lru[key] = (time.monotonic() + settings.EMBED_QUERY_CACHE_TTL, emb)
+        _lru.move_to_end(key)
+        while len(_lru) > settings.EMBED_QUERY_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+def _fetch(key, text):
+    alias = settings.EMBED_QUERY_CACHE_ALIAS
+    emb = caches[alias].get(key) if alias else None
+    if alias:
+        metrics.cache_lookup("query_embedding_shared", emb is not None)
+    if emb is not None:
+        with _lru_lock:
+            _stats["shared_hits"] += 1
+    else:
+        res = client.embeddings.create(model=EMBED_MODEL, input=text)
+        _record_usage(res)
+        emb = res.data[0].embedding
+        with _lru_lock:
+            _stats["misses"] += 1
+        if alias:
+            caches[alias].set(key, emb, settings.EMBED_QUERY_CACHE_TTL)
+    _local_put(key, emb)
+    return emb
+
+
+def embed_query(text: str) -> list:
+    text = " ".join(text.split())
+    key = _key(text)
+    emb = _local_get(key)
+    metrics.cache_lookup("query_embedding", emb is not None)
+    if emb is None:
+        emb = _flight.do(key, lambda: _fetch(key, text))
+    return emb
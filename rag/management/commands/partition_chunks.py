@@ -0,0 +1,217 @@
+# rag/management/commands/partition_chunks.py
+"""
+Move rag_ragchunk online to a table hash-partitioned by user_id (see
+rag.partitioning for the steps).
+
+    python manage.py partition_chunks --partitions 16             # whole move
+    python manage.py partition_chunks --no-swap                   # copy + index only
+    python manage.py partition_chunks --drop-old                  # once satisfied
+    python manage.py partition_chunks --revert                    # back to one table
+
+Every step can be re-run: an interrupted backfill or index build resumes,
+and the swap only happens once the copy has as many rows as the original.
+Until `--drop-old`, writes are mirrored into rag_ragchunk_old and
+`--revert` puts it back in place.
+"""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from rag import partitioning
+from rag.partitioning import NEW, OLD, TABLE, _ident
+
+PROGRESS_EVERY = 50   # batches
+
+
+def _renamable(name: str, suffix: str) -> str:
+    if len(name + suffix) > 63:
+        raise CommandError(f"{name}{suffix} is longer than PostgreSQL's 63-character limit")
+    return name + suffix
+
+
+def _rename_all(cur, table: str, renames: dict) -> None:
+    """renames: {(kind, old name): new name}, kind 'constraint' or 'index'."""
+    for (kind, old), new in renames.items():
+        if kind == "constraint":
+            cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {old} TO {new}")
+        else:
+            cur.execute(f"ALTER INDEX {old} RENAME TO {new}")
+
+
+def _objects(cur, table: str) -> list[tuple[str, str]]:
+    """(kind, name) of the table's constraints and other indexes."""
+    return ([("constraint", name) for name, _, _ in partitioning.constraints(cur, table)]
+            + [("index", name) for name, _, _ in partitioning.indexes(cur, table)])
+
+
+def _serial_sequence(cur, table: str) -> str:
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    return cur.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = "Move rag_ragchunk to a table hash-partitioned by user_id, without downtime."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partitions", type=int, default=16)
+        parser.add_argument("--batch", type=int, default=2000, help="rows per backfill batch")
+        parser.add_argument("--no-swap", action="store_true",
+                            help="stop after backfill and indexes")
+        parser.add_argument("--drop-old", action="store_true",
+                            help=f"drop {OLD} after a swap")
+        parser.add_argument("--revert", action="store_true",
+                            help=f"swap {OLD} back in and drop the partitioned table")
+        parser.add_argument("--lock-timeout", default="5s",
+                            help="give up the swap if the table lock takes longer")
+
+    def handle(self, *args, **opts):
+        with connection.cursor() as cur:
+            kind = partitioning.relkind(cur, TABLE)
+            has_old = partitioning.relkind(cur, OLD) is not None
+        if opts["drop_old"] or opts["revert"]:
+            if kind != "p" or not has_old:
+                raise CommandError(f"no swapped {TABLE} / {OLD} pair to act on")
+            return self.revert(opts) if opts["revert"] else self.drop_old()
+        if kind == "p":
+            self.stdout.write(f"{TABLE} is already partitioned")
+            return
+        if opts["partitions"] < 1:
+            raise CommandError("--partitions must be positive")
+
+        self.prepare(opts["partitions"])
+        self.backfill(opts["batch"])
+        self.build_indexes()
+        self.verify()
+        if not opts["no_swap"]:
+            self.swap(opts["lock_timeout"])
+
+    def prepare(self, n: int) -> None:
+        with transaction.atomic(), connection.cursor() as cur:
+            if partitioning.relkind(cur, NEW):
+                existing = len(partitioning.partitions(cur, NEW))
+                if existing != n:
+                    self.stdout.write(f"{NEW} exists with {existing} partitions; keeping them")
+            else:
+                self.stdout.write(f"creating {NEW} with {n} hash partitions")
+                cur.execute(
+                    f"CREATE TABLE {NEW} (LIKE {TABLE} INCLUDING DEFAULTS) "
+                    "PARTITION BY HASH (user_id)"
+                )
+                for i in range(n):
+                    cur.execute(
+                        f"CREATE TABLE {TABLE}_p{i} PARTITION OF {NEW} "
+                        f"FOR VALUES WITH (MODULUS {n}, REMAINDER {i})"
+                    )
+                # identity columns cannot be partitioned here: an owned sequence instead
+                cur.execute(f"CREATE SEQUENCE {NEW}_id_seq OWNED BY {NEW}.id")
+                cur.execute(
+                    f"ALTER TABLE {NEW} ALTER COLUMN id SET DEFAULT nextval('{NEW}_id_seq')"
+                )
+                # unique constraints on a partitioned table must include the key
+                cur.execute(
+                    f"ALTER TABLE {NEW} ADD CONSTRAINT {_renamable(TABLE + '_pkey', '_new')} "
+                    "PRIMARY KEY (id, user_id)"
+                )
+                for name, contype, definition in partitioning.constraints(cur, TABLE):
+                    if contype in ("u", "f", "c"):
+                        cur.execute(
+                            f"ALTER TABLE {NEW} ADD CONSTRAINT {_renamable(name, '_new')} "
+                            f"{definition}"
+                        )
+            partitioning.install_mirror(cur, TABLE, NEW)
+
+    def backfill(self, batch: int) -> None:
+        last, copied, batches = 0, 0, 0
+        with connection.cursor() as cur:
+            while True:
+                # autocommit: each batch holds its row locks only while it runs
+                cur.execute(
+                    f"""
+                    WITH src AS (
+                        SELECT * FROM {TABLE} WHERE id > %s ORDER BY id LIMIT %s FOR SHARE
+                    ), ins AS (
+                        INSERT INTO {NEW} SELECT * FROM src ON CONFLICT DO NOTHING
+                    )
+                    SELECT max(id), count(*) FROM src
+                    """,
+                    [last, batch],
+                )
+                top, count = cur.fetchone()
+                if not count:
+                    break
+                last, copied, batches = top, copied + count, batches + 1
+                if batches % PROGRESS_EVERY == 0:
+                    self.stdout.write(f"backfill: {copied} rows (id {last})")
+            cur.execute(f"ANALYZE {NEW}")
+        self.stdout.write(f"backfill: {copied} rows copied")
+
+    def build_indexes(self) -> None:
+        with connection.cursor() as cur:
+            for name, unique, body in partitioning.indexes(cur, TABLE):
+                new = _renamable(name, "_new")
+                self.stdout.write(f"building {new} …")
+                partitioning.create_index(cur, NEW, new, body, unique,
+                                          base=re.sub(r"^rag_ragchunk?_", "", name))
+
+    def verify(self) -> None:
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT (SELECT count(*) FROM {TABLE}), (SELECT count(*) FROM {NEW})")
+            old, new = cur.fetchone()
+        if old != new:
+            raise CommandError(f"{TABLE} has {old} rows but {NEW} has {new}; re-run to resume")
+        self.stdout.write(f"verified {new} rows")
+
+    def _lock(self, cur, timeout: str, *tables: str) -> None:
+        cur.execute("SELECT set_config('lock_timeout', %s, true)", [timeout])
+        try:
+            cur.execute(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE")
+        except OperationalError as e:
+            raise CommandError(f"could not lock {TABLE} within {timeout}; retry later") from e
+
+    def swap(self, timeout: str) -> None:
+        with transaction.atomic(), connection.cursor() as cur:
+            self._lock(cur, timeout, TABLE, NEW)
+            partitioning.drop_mirror(cur, TABLE)
+            old_seq, new_seq = _serial_sequence(cur, TABLE), _serial_sequence(cur, NEW)
+            originals = _objects(cur, TABLE)
+
+            _rename_all(cur, TABLE, {o: _renamable(o[1], "_old") for o in originals})
+            cur.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD}")
+            cur.execute(f"ALTER SEQUENCE {old_seq} RENAME TO {OLD}_id_seq")
+
+            cur.execute(f"ALTER TABLE {NEW} RENAME TO {TABLE}")
+            _rename_all(cur, TABLE, {(kind, _ident(name + "_new")): name
+                                     for kind, name in originals})
+            cur.execute(f"ALTER SEQUENCE {new_seq} RENAME TO {TABLE}_id_seq")
+            cur.execute(
+                f"SELECT setval('{TABLE}_id_seq', GREATEST("
+                f"(SELECT last_value FROM {OLD}_id_seq), (SELECT max(id) FROM {TABLE}), 1))"
+            )
+            partitioning.install_mirror(cur, TABLE, OLD)
+        self.stdout.write(f"swapped: {TABLE} is partitioned, writes mirrored to {OLD}")
+
+    def drop_old(self) -> None:
+        with transaction.atomic(), connection.cursor() as cur:
+            partitioning.drop_mirror(cur, TABLE)
+            cur.execute(f"DROP TABLE {OLD}")
+            cur.execute(f"DROP FUNCTION IF EXISTS {partitioning.MIRROR}()")
+        self.stdout.write(f"dropped {OLD}")
+
+    def revert(self, opts) -> None:
+        with transaction.atomic(), connection.cursor() as cur:
+            self._lock(cur, opts["lock_timeout"], TABLE, OLD)
+            partitioning.drop_mirror(cur, TABLE)
+            cur.execute(f"DROP TABLE {TABLE}")   # drops its partitions and sequence
+
+            cur.execute(f"ALTER TABLE {OLD} RENAME TO {TABLE}")
+            _rename_all(cur, TABLE, {(kind, name): name.removesuffix("_old")
+                                     for kind, name in _objects(cur, TABLE)})
+            cur.execute(f"ALTER SEQUENCE {OLD}_id_seq RENAME TO {TABLE}_id_seq")
+            # ids handed out by the partitioned table's sequence since the swap
+            cur.execute(
+                f"SELECT setval('{TABLE}_id_seq', GREATEST("
+                f"(SELECT last_value FROM {TABLE}_id_seq), (SELECT max(id) FROM {TABLE}), 1))"
+            )
+            cur.execute(f"DROP FUNCTION IF EXISTS {partitioning.MIRROR}()")
+        self.stdout.write(f"reverted: {TABLE} is a single table again")
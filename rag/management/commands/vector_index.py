@@ -0,0 +1,85 @@
+# rag/management/commands/vector_index.py
+"""
+Build the compact HNSW index selected by RAG_VECTOR_INDEX /
+RAG_VECTOR_DIMENSIONS over the existing rows, without blocking writes.
+
+    python manage.py vector_index                     # from settings
+    python manage.py vector_index --index bit --dims 1536 --drop-full
+
+Rows keep their full-precision embedding (used for re-ranking); only the
+index is compact, so switching modes never rewrites the table. `--drop-full`
+drops the full-precision index declared by migration 0003 once searches no
+longer use it; `migrate` does not recreate it. On a table partitioned by
+`partition_chunks` the index is built partition by partition.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rag import partitioning
+from rag.search import FULL_DIMENSIONS, INDEX_TYPES, compact_expression, is_compact
+
+FULL_INDEX = "rag_ragchunk_embedding_hnsw"
+
+
+def index_name(index: str, dims: int) -> str:
+    return f"rag_ragchunk_embedding_{index}{dims}_hnsw"
+
+
+class Command(BaseCommand):
+    help = "Create the compact HNSW index for the configured vector storage mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", choices=sorted(INDEX_TYPES),
+                            default=settings.RAG_VECTOR_INDEX)
+        parser.add_argument("--dims", type=int, default=settings.RAG_VECTOR_DIMENSIONS)
+        parser.add_argument("--drop-full", action="store_true",
+                            help=f"drop {FULL_INDEX} afterwards")
+        parser.add_argument("--drop-others", action="store_true",
+                            help="drop compact indexes built for other modes")
+
+    def handle(self, *args, **opts):
+        index, dims = opts["index"], opts["dims"]
+        if not 0 < dims <= FULL_DIMENSIONS:
+            raise CommandError(f"--dims must be in 1..{FULL_DIMENSIONS}")
+        if not is_compact(index, dims):
+            raise CommandError("full-precision vectors use the index from migration 0003")
+
+        with connection.cursor() as cur:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cur.fetchone()
+            if not row or tuple(int(x) for x in row[0].split(".")[:2]) < (0, 7):
+                raise CommandError(f"compact indexes need pgvector >= 0.7 (found {row and row[0]})")
+
+            name = index_name(index, dims)
+            opclass = INDEX_TYPES[index][0]
+            self.stdout.write(f"building {name} …")
+            # CONCURRENTLY cannot run in a transaction: autocommit connection
+            partitioning.create_index(
+                cur, partitioning.TABLE, name,
+                f"USING hnsw ({compact_expression('embedding', index, dims)} {opclass}) "
+                f"WITH (m = {int(settings.RAG_HNSW_M)}, "
+                f"ef_construction = {int(settings.RAG_HNSW_EF_CONSTRUCTION)})",
+            )
+
+            drop = []
+            if opts["drop_others"]:
+                cur.execute(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = 'rag_ragchunk' "
+                    "AND indexname LIKE 'rag\\_ragchunk\\_embedding\\_%%\\_hnsw' "
+                    "AND indexname NOT IN (%s, %s)",
+                    [name, FULL_INDEX],
+                )
+                drop += [r[0] for r in cur.fetchall()]
+            if opts["drop_full"]:
+                drop.append(FULL_INDEX)
+            for old in drop:
+                self.stdout.write(f"dropping {old}")
+                partitioning.drop_index(cur, partitioning.TABLE, old)
+
+            cur.execute(
+                "SELECT pg_size_pretty(sum(pg_relation_size(relid))) "
+                "FROM pg_partition_tree(%s::regclass)",
+                [name],
+            )
+            self.stdout.write(f"{name}: {cur.fetchone()[0]}")
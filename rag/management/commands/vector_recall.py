@@ -0,0 +1,94 @@
+# rag/management/commands/vector_recall.py
+"""
+Recall-vs-latency check for the HNSW index against exact search.
+
+    python manage.py vector_recall --queries 100 --k 10 --ef 40,100,200
+    python manage.py vector_recall --storage vector:1536,halfvec:512,bit:1536
+
+`--storage` compares compact index modes (index:dims, re-ranked by
+RAG_RERANK_FACTOR unless `--rerank` says otherwise) with exact full-precision
+search. Build each mode's index with `vector_index` first, or the numbers
+are for a sequential scan. Query vectors are sampled from stored chunks; each query is filtered by the
+owning user exactly like `get_relevant_context`.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from rag.search import FULL_DIMENSIONS, nearest_chunks, vector_cursor
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Compare HNSW recall@k and latency against exact search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--ef", default="20,40,100,200,400",
+                            help="comma-separated hnsw.ef_search values")
+        parser.add_argument("--user", type=int, help="restrict to one user_id")
+        parser.add_argument("--storage", default="",
+                            help="comma-separated index:dims modes, e.g. halfvec:512,bit:1536")
+        parser.add_argument("--rerank", type=int, help="override RAG_RERANK_FACTOR")
+
+    def _search(self, queries, k, storage=None, **cursor_kw):
+        results, timings = [], []
+        for user_id, emb in queries:
+            with vector_cursor(**cursor_kw) as cur:
+                t0 = time.perf_counter()
+                rows = nearest_chunks(cur, user_id, emb, k, **(storage or {}))
+                timings.append((time.perf_counter() - t0) * 1000)
+            results.append({r[0] for r in rows})
+        return results, timings
+
+    def handle(self, *args, **opts):
+        k = opts["k"]
+        where, params = "", []
+        if opts["user"]:
+            where, params = "WHERE user_id = %s", [opts["user"]]
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT user_id, embedding FROM rag_ragchunk {where} "
+                f"ORDER BY random() LIMIT %s",
+                params + [opts["queries"]],
+            )
+            queries = cur.fetchall()
+        if not queries:
+            self.stdout.write("No chunks to sample queries from.")
+            return
+
+        full = {"index": "vector", "dims": FULL_DIMENSIONS}
+        truth, exact_ms = self._search(queries, k, full, exact=True)
+        self.stdout.write(f"{len(queries)} queries, k={k}")
+        self.stdout.write(f"{'mode':>12} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8}")
+        self.stdout.write(
+            f"{'exact':>12} {1.0:>7.3f} "
+            f"{statistics.median(exact_ms):>8.2f} {_pct(exact_ms, 95):>8.2f}"
+        )
+        runs = [
+            (f"ef={ef}", full, {"ef_search": ef})
+            for ef in (int(x) for x in opts["ef"].split(",") if x.strip())
+        ]
+        for spec in (x.strip() for x in opts["storage"].split(",") if x.strip()):
+            index, _, dims = spec.partition(":")
+            storage = {"index": index, "dims": int(dims or FULL_DIMENSIONS)}
+            if opts["rerank"] is not None:
+                storage["rerank"] = opts["rerank"]
+            runs.append((spec, storage, {}))
+
+        for label, storage, cursor_kw in runs:
+            found, ms = self._search(queries, k, storage, **cursor_kw)
+            recall = statistics.mean(
+                len(f & t) / len(t) for f, t in zip(found, truth) if t
+            )
+            self.stdout.write(
+                f"{label:>12} {recall:>7.3f} "
+                f"{statistics.median(ms):>8.2f} {_pct(ms, 95):>8.2f}"
+            )
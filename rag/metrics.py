@@ -0,0 +1,221 @@
+# rag/metrics.py
+"""
+In-process latency / usage metrics for the hot paths.
+
+`stage(name)` times a block: the duration goes into the `rag_stage_seconds`
+histogram and, inside a request (or a `collect()` block), into the
+per-request list that ServerTimingMiddleware turns into a `Server-Timing`
+header and one structured `timing {...}` log line. Counters and histograms
+are per process; `render()` emits them in the Prometheus text format for
+the /metrics view, so scrape every worker (or run one per container).
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+_registry: list = []
+_timings: ContextVar = ContextVar("rag_metrics_timings", default=None)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._lock = threading.Lock()
+        self._values: dict = {}   # sorted label items → value
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(dict(key))} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: dict = {}   # sorted label items → [bucket counts…, sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def count(self, **labels) -> int:
+        s = self._series.get(tuple(sorted(labels.items())))
+        return s[-1] if s else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                labels = dict(key)
+                cumulative = 0
+                for upper, n in zip(self.buckets, s):
+                    cumulative += n
+                    lines.append(
+                        f"{self.name}_bucket{_labels({**labels, 'le': upper})} {cumulative}"
+                    )
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {s[-1]}")
+                lines.append(f"{self.name}_sum{_labels(labels)} {s[-2]}")
+                lines.append(f"{self.name}_count{_labels(labels)} {s[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency of instrumented stages.")
+REQUEST_SECONDS = Histogram("rag_request_seconds", "Latency of instrumented requests by route.")
+OPENAI_TOKENS = Histogram(
+    "rag_openai_tokens", "Tokens per OpenAI call by model and kind.", TOKEN_BUCKETS
+)
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and result.")
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))  # list.append is atomic across threads
+
+
+@contextmanager
+def collect():
+    """Gather the stages run in this context (and copies of it) into a list."""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_usage(model: str, kind: str, tokens) -> None:
+    if isinstance(tokens, int):  # absent on streamed chunks without usage
+        OPENAI_TOKENS.observe(tokens, model=model, kind=kind)
+
+
+def summarize(timings) -> dict:
+    """{stage: total ms} in first-seen order; repeated stages are summed."""
+    out: dict = {}
+    for name, seconds in timings:
+        out[name] = out.get(name, 0.0) + seconds * 1000
+    return {name: round(ms, 1) for name, ms in out.items()}
+
+
+def log_timings(event: str, timings, **fields) -> dict:
+    stages = summarize(timings)
+    logger.info("timing %s", json.dumps({"event": event, **fields, "stages_ms": stages}))
+    return stages
+
+
+def render() -> str:
+    from rag.db import pool_stats
+
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    pools = pool_stats()
+    if pools:
+        lines += ["# HELP rag_db_pool Connection pool counters by alias.",
+                  "# TYPE rag_db_pool gauge"]
+        for alias, stats in sorted(pools.items()):
+            for name, value in sorted(stats.items()):
+                lines.append(f"rag_db_pool{_labels({'alias': alias, 'stat': name})} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class ServerTimingMiddleware:
+    """
+    Collect stage timings per request; instrumented responses get a
+    `Server-Timing` header and a structured log line. Sync and async capable,
+    so under ASGI it adds no thread hop in front of async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        t0 = time.perf_counter()
+        with collect() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, t0, timings)
+
+    async def __acall__(self, request):
+        t0 = time.perf_counter()
+        with collect() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, t0, timings)
+
+    def _finish(self, request, response, t0, timings):
+        if not timings:
+            return response
+        total = time.perf_counter() - t0
+        route = request.resolver_match.url_name if request.resolver_match else request.path
+        REQUEST_SECONDS.observe(total, route=route)
+        stages = log_timings(
+            "request", timings, route=route, status=response.status_code,
+            total_ms=round(total * 1000, 1),
+        )
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = ", ".join(
+                [f"{name};dur={ms}" for name, ms in stages.items()]
+                + [f"total;dur={total * 1000:.1f}"]
+            )
+        return response
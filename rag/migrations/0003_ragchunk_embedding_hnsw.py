@@ -0,0 +1,28 @@
+# rag/migrations/0003_ragchunk_embedding_hnsw.py
+# HNSW parameters come from settings so operators can tune them per deployment
+# without a schema diff; changing them requires dropping/re-creating the index.
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from pgvector.django import HnswIndex
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY
+
+    dependencies = [
+        ('rag', '0002_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='ragchunk',
+            index=HnswIndex(
+                name='rag_ragchunk_embedding_hnsw',
+                fields=['embedding'],
+                m=settings.RAG_HNSW_M,
+                ef_construction=settings.RAG_HNSW_EF_CONSTRUCTION,
+                opclasses=['vector_l2_ops'],
+            ),
+        ),
+    ]
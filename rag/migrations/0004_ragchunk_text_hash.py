@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0003_ragchunk_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ragchunk',
+            name='text_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
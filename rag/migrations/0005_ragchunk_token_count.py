@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0004_ragchunk_text_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ragchunk',
+            name='token_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,7 @@
 # rag/models.py
 from django.conf import settings
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 class RagChunk(models.Model):
     user       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -10,12 +10,21 @@ class RagChunk(models.Model):
     chunk_idx  = models.IntegerField()
     char_start = models.IntegerField()
     char_end   = models.IntegerField()
+    text_hash  = models.CharField(max_length=64, blank=True, default="")  # sha256 of chunk text
+    token_count = models.IntegerField(default=0)
     embedding  = VectorField(dimensions=1536)  # <-- use "dimensions", not "dim"
 
     class Meta:
         indexes = [
             models.Index(fields=["user"]),
             models.Index(fields=["file_id"]),
+            HnswIndex(
+                name="rag_ragchunk_embedding_hnsw",
+                fields=["embedding"],
+                m=settings.RAG_HNSW_M,
+                ef_construction=settings.RAG_HNSW_EF_CONSTRUCTION,
+                opclasses=["vector_l2_ops"],
+            ),
         ]
         unique_together = (("user", "file_id", "chunk_idx"),)
 
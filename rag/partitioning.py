@@ -0,0 +1,146 @@
+# rag/partitioning.py
+"""
+Online move of rag_ragchunk to a table hash-partitioned by user_id.
+
+Every query already filters on user_id, so with partitions an ANN search,
+index build or vacuum only touches one slice of the data. The move
+(`manage.py partition_chunks`) goes:
+
+1. prepare: create rag_ragchunk_part (same columns, PARTITION BY HASH
+   (user_id) into rag_ragchunk_p0…pN-1, PK (id, user_id), the model's
+   unique/foreign keys) and a trigger that mirrors every write on
+   rag_ragchunk into it;
+2. backfill: copy existing rows in id order, in batches that SHARE-lock
+   their source rows, so a concurrent update or delete either waits for the
+   batch (and its mirror replaces the copy) or is seen by it;
+3. indexes: recreate rag_ragchunk's other indexes — including the HNSW
+   ones — per partition with CREATE INDEX CONCURRENTLY, attached to
+   parent indexes created ON ONLY;
+4. swap: in one short transaction, rename the old table (and its indexes,
+   constraints and sequence) to *_old and the new one to rag_ragchunk, and
+   mirror writes back into rag_ragchunk_old until it is dropped, so the
+   move can still be reverted.
+
+Table and column names do not change, so the RagChunk model and the raw SQL
+in rag.search / rag.views run unchanged.
+"""
+import re
+
+TABLE = "rag_ragchunk"
+NEW = f"{TABLE}_part"
+OLD = f"{TABLE}_old"
+MIRROR = "rag_ragchunk_mirror"   # trigger + function name
+
+_INDEX_DEF = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ (USING .+)$")
+
+
+def _ident(name: str) -> str:
+    return name[:63]
+
+
+def relkind(cur, table: str) -> str | None:
+    """'r' table, 'p' partitioned table, None if missing."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def partitions(cur, table: str) -> list[str]:
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+        [table],
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def indexes(cur, table: str) -> list[tuple[str, bool, str]]:
+    """(name, unique, 'USING …' body) of indexes not backing a constraint."""
+    cur.execute(
+        """
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        ORDER BY 1
+        """,
+        [table],
+    )
+    out = []
+    for (definition,) in cur.fetchall():
+        m = _INDEX_DEF.match(definition)
+        if m:
+            out.append((m.group(2), bool(m.group(1)), m.group(3)))
+    return out
+
+
+def constraints(cur, table: str) -> list[tuple[str, str, str]]:
+    """(name, contype, definition) of the table's constraints."""
+    cur.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass ORDER BY conname",
+        [table],
+    )
+    return cur.fetchall()
+
+
+def create_index(cur, table: str, name: str, body: str, unique: bool = False,
+                 base: str | None = None) -> None:
+    """
+    CREATE INDEX without blocking writes. On a partitioned table that means
+    an invalid parent index ON ONLY, one CONCURRENTLY-built index per
+    partition (named `<partition>_<base>`), each attached to the parent,
+    which then becomes valid. Needs an autocommit connection.
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if relkind(cur, table) != "p":
+        cur.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} {body}")
+        return
+    base = base or name.removeprefix(TABLE + "_")
+    cur.execute(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY {table} {body}")
+    for part in partitions(cur, table):
+        child = _ident(f"{part}_{base}")
+        cur.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {child} ON {part} {body}")
+        cur.execute(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s) "
+            "AND inhparent = to_regclass(%s)",
+            [child, name],
+        )
+        if not cur.fetchone():
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def drop_index(cur, table: str, name: str) -> None:
+    # DROP INDEX CONCURRENTLY does not work on partitioned indexes
+    concurrently = "" if relkind(cur, table) == "p" else "CONCURRENTLY "
+    cur.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+def install_mirror(cur, source: str, target: str) -> None:
+    """Row trigger copying every INSERT/UPDATE/DELETE on `source` into `target`."""
+    cur.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION {MIRROR}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                EXECUTE format('DELETE FROM %I WHERE id = $1 AND user_id = $2', TG_ARGV[0])
+                    USING OLD.id, OLD.user_id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                EXECUTE format('INSERT INTO %I SELECT ($1).*', TG_ARGV[0]) USING NEW;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute(f"DROP TRIGGER IF EXISTS {MIRROR} ON {source}")
+    cur.execute(
+        f"CREATE TRIGGER {MIRROR} AFTER INSERT OR UPDATE OR DELETE ON {source} "
+        f"FOR EACH ROW EXECUTE FUNCTION {MIRROR}('{target}')"
+    )
+
+
+def drop_mirror(cur, table: str) -> None:
+    if relkind(cur, table):
+        cur.execute(f"DROP TRIGGER IF EXISTS {MIRROR} ON {table}")
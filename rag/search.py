@@ -0,0 +1,251 @@
+# rag/search.py
+"""
+pgvector query helpers.
+
+Every vector query runs inside its own transaction so the HNSW knobs can be
+applied with SET LOCAL and never leak into other requests on the connection.
+
+Compact storage (RAG_VECTOR_INDEX / RAG_VECTOR_DIMENSIONS): the full float32
+embedding stays in the table, but the HNSW index is built on an expression —
+a Matryoshka prefix of the vector, re-normalized, cast to halfvec or
+binary-quantized to bit — so the index is 2× to 32× smaller. Search walks that
+index for a k × RAG_RERANK_FACTOR shortlist and re-orders it by exact
+distance on the full vectors. `manage.py vector_index` builds the index.
+It only applies to the chunk-index path: with RAG_FILE_PREFILTER the second
+stage is an exact scan of the chosen files on the full vectors.
+
+Diversity (RAG_MMR_CANDIDATES / RAG_MMR_LAMBDA): search_chunks over-fetches
+N candidates with their embeddings — in binary, parsing 100 × 1536 floats
+from text alone costs tens of ms — and picks the final k by MMR (rag.mmr).
+"""
+from contextlib import contextmanager
+
+import numpy as np
+import psycopg
+from django.conf import settings
+from django.db import connection, transaction
+
+from rag import metrics
+from rag.db import register_vector_once
+from rag.mmr import mmr
+
+COLUMNS = "id, file_id, file_name, char_start, char_end"
+
+
+@contextmanager
+def vector_cursor(ef_search: int | None = None, exact: bool = False):
+    """
+    Cursor tuned for ANN search. `exact=True` disables index scans so the
+    planner falls back to a full distance sort (ground truth for recall).
+    """
+    with transaction.atomic(), connection.cursor() as cur:
+        register_vector_once(connection)
+        if exact:
+            cur.execute("SELECT set_config('enable_indexscan', 'off', true)")
+        else:
+            ef = ef_search or settings.RAG_HNSW_EF_SEARCH
+            cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef)])
+            if settings.RAG_HNSW_ITERATIVE_SCAN:
+                cur.execute(
+                    "SELECT set_config('hnsw.iterative_scan', %s, true)",
+                    [settings.RAG_HNSW_ITERATIVE_SCAN],
+                )
+        yield cur
+
+
+FULL_DIMENSIONS = 1536
+# index type → (operator class, distance operator)
+INDEX_TYPES = {
+    "vector": ("vector_l2_ops", "<->"),
+    "halfvec": ("halfvec_l2_ops", "<->"),
+    "bit": ("bit_hamming_ops", "<~>"),
+}
+
+
+def compact_expression(arg: str, index: str, dims: int) -> str:
+    """SQL for the compact form of vector expression `arg`; index and query must match."""
+    if dims < FULL_DIMENSIONS:
+        arg = f"subvector({arg}, 1, {dims})"
+        if index != "bit":  # sign bits do not care about scale
+            arg = f"l2_normalize({arg})"
+    if index == "bit":
+        return f"(binary_quantize({arg})::bit({dims}))"
+    return f"(({arg})::{index}({dims}))"
+
+
+def is_compact(index: str, dims: int) -> bool:
+    return index != "vector" or dims < FULL_DIMENSIONS
+
+
+def _columns(embeddings: bool) -> str:
+    return COLUMNS + (", embedding" if embeddings else "")
+
+
+def nearest_chunks(cur, user_id: int, emb, k: int, index: str | None = None,
+                   dims: int | None = None, rerank: int | None = None,
+                   embeddings: bool = False):
+    """
+    Top-k (id, file_id, file_name, char_start, char_end) rows for one user,
+    plus the embedding when `embeddings`.
+    `index`, `dims` and `rerank` override the RAG_VECTOR_* settings.
+    """
+    index = index or settings.RAG_VECTOR_INDEX
+    dims = dims or settings.RAG_VECTOR_DIMENSIONS
+    rerank = settings.RAG_RERANK_FACTOR if rerank is None else rerank
+    if is_compact(index, dims):
+        return _nearest_compact(cur, user_id, emb, k, index, dims, rerank, embeddings)
+    cur.execute(
+        f"""
+        SELECT {_columns(embeddings)}
+        FROM rag_ragchunk
+        WHERE user_id = %s
+        ORDER BY embedding <-> %s::vector
+        LIMIT %s
+        """,
+        [user_id, emb, k],
+    )
+    return cur.fetchall()
+
+
+def nearest_files(cur, user_id: int, emb, n: int):
+    """
+    Top-n (file_id, name, chunk_count, distance) by cosine distance to the
+    file centroid. Exact over the user's own files (found through
+    agent_userfile_listing): one centroid per file keeps the scan small, and
+    a centroid HNSW index shared by all users would be filtered by user_id
+    only after the graph walk, returning fewer than n files.
+    """
+    cur.execute(
+        """
+        WITH files AS MATERIALIZED (
+            SELECT file_id, name, chunk_count, centroid
+            FROM agent_userfile
+            WHERE user_id = %s AND centroid IS NOT NULL
+        )
+        SELECT file_id, name, chunk_count, centroid <=> %s::vector AS distance
+        FROM files
+        ORDER BY distance
+        LIMIT %s
+        """,
+        [user_id, emb, n],
+    )
+    return cur.fetchall()
+
+
+def nearest_chunks_in(cur, user_id: int, file_ids, emb, k: int, embeddings: bool = False):
+    """
+    Exact top-k chunk rows restricted to `file_ids` (the second stage after
+    nearest_files). MATERIALIZED keeps the planner off the chunk HNSW index,
+    which would filter after the graph walk and lose rows.
+    """
+    cur.execute(
+        f"""
+        WITH candidates AS MATERIALIZED (
+            SELECT id, file_id, file_name, char_start, char_end, embedding
+            FROM rag_ragchunk
+            WHERE user_id = %s AND file_id = ANY(%s)
+        )
+        SELECT {_columns(embeddings)}
+        FROM candidates
+        ORDER BY embedding <-> %s::vector
+        LIMIT %s
+        """,
+        [user_id, list(file_ids), emb, k],
+    )
+    return cur.fetchall()
+
+
+def search_chunks(cur, user_id: int, emb, k: int):
+    """
+    Retrieval entry point: search all chunks through the chunk index (full
+    or compact). With RAG_FILE_PREFILTER (and once centroids exist), pick the
+    RAG_PREFILTER_FILES closest files by centroid instead, then the exact top
+    chunks inside them. When RAG_MMR_CANDIDATES > k, that many
+    candidates are fetched and the k returned are chosen by MMR.
+    """
+    n = settings.RAG_MMR_CANDIDATES
+    if n <= k:
+        return _candidates(cur, user_id, emb, k)
+    # the graph walk must be at least as wide as the candidate list
+    cur.execute(
+        "SELECT set_config('hnsw.ef_search',"
+        " GREATEST(current_setting('hnsw.ef_search')::int, %s)::text, true)",
+        [n],
+    )
+    with binary_cursor(cur) as bcur:
+        rows = _candidates(bcur, user_id, emb, n, embeddings=True)
+    if len(rows) <= k:
+        return [row[:5] for row in rows]
+    with metrics.stage("mmr"):
+        picked = mmr(
+            emb, np.stack([_as_array(row[5]) for row in rows]), k, settings.RAG_MMR_LAMBDA
+        )
+    return [rows[i][:5] for i in picked]
+
+
+def _as_array(value) -> np.ndarray:
+    # pgvector's binary loader returns Vector objects in some releases and
+    # plain ndarrays in others
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def _candidates(cur, user_id, emb, n, embeddings=False):
+    if settings.RAG_FILE_PREFILTER:
+        files = nearest_files(cur, user_id, emb, settings.RAG_PREFILTER_FILES)
+        if files:
+            return nearest_chunks_in(cur, user_id, [f[0] for f in files], emb, n, embeddings)
+    return nearest_chunks(cur, user_id, emb, n, embeddings=embeddings)
+
+
+class _BinaryCursor:
+    """Server-binding psycopg cursor on the same connection, with binary results."""
+
+    def __init__(self, raw):
+        self._cur = psycopg.Cursor(raw)
+
+    def execute(self, sql, params=None):
+        self._cur.execute(sql, params, binary=True)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+
+@contextmanager
+def binary_cursor(cur):
+    """
+    Like `cur` (same connection and transaction, so SET LOCAL knobs apply)
+    but returning vectors in binary. Django's client-side-binding cursors
+    cannot fetch binary results.
+    """
+    b = _BinaryCursor(cur.connection)
+    try:
+        yield b
+    finally:
+        b._cur.close()
+
+
+def _nearest_compact(cur, user_id, emb, k, index, dims, rerank, embeddings=False):
+    op = INDEX_TYPES[index][1]
+    shortlist = f"""
+        SELECT {_columns(bool(rerank or embeddings))}
+        FROM rag_ragchunk
+        WHERE user_id = %s
+        ORDER BY {compact_expression("embedding", index, dims)} {op}
+                 {compact_expression("%s::vector", index, dims)}
+        LIMIT %s
+    """
+    if not rerank:
+        cur.execute(shortlist, [user_id, emb, k])
+        return cur.fetchall()
+    cur.execute(
+        f"""
+        SELECT {_columns(embeddings)}
+        FROM ({shortlist}) AS s
+        ORDER BY embedding <-> %s::vector
+        LIMIT %s
+        """,
+        [user_id, emb, k * rerank, emb, k],
+    )
+    return cur.fetchall()
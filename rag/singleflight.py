@@ -0,0 +1,29 @@
+# rag/singleflight.py
+"""
+Collapse concurrent calls that share a key into one execution; callers that
+arrive while it is running wait for and share its result (or exception).
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if leader:
+            try:
+                fut.set_result(fn())
+            except BaseException as exc:
+                fut.set_exception(exc)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return fut.result()
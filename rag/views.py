@@ -1,20 +1,23 @@
 # rag/views.py
+import base64
+import hmac
 import json
-from django.db import connection
-from django.db.models import Count
+from django.conf import settings
+from django.db.models import F, Field, Func, Value
 from django.views.decorators.http import require_GET, require_POST
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from openai import OpenAI
-from pgvector.psycopg import register_vector
 
-from rag.models import RagChunk
+from agent.models import UserFile
+from rag import metrics
+from rag.db import pool_stats
+from rag.embeddings import embed_query
+from rag.search import nearest_files, vector_cursor
 
-client = OpenAI()
-EMBED_MODEL = "text-embedding-3-small"
+FILES_PAGE_SIZE = 100
+FILES_PAGE_MAX = 500
+FILES_SEARCH_LIMIT = 50
 
-def _embed_query(q):
-    return client.embeddings.create(model=EMBED_MODEL, input=q).data[0].embedding
 
 @require_GET
 def list_files(request):
@@ -24,43 +27,116 @@ def list_files(request):
 
     q = request.GET.get("q", "").strip()
     if not q:
-        qs = (
-            RagChunk.objects
-            .filter(user=user)
-            .values("file_name")
-            .annotate(chunks=Count("id"))
-            .order_by("file_name")
-        )
-        return JsonResponse(list(qs), safe=False)
-
-    emb = _embed_query(q)
-    with connection.cursor() as cur:
-        register_vector(cur.connection)
-        cur.execute(
-            """
-            SELECT file_name,
-                   COUNT(*)                      AS chunks,
-                   MIN(embedding <-> %s::vector) AS distance
-            FROM rag_ragchunk
-            WHERE user_id = %s
-            GROUP BY file_name
-            ORDER BY distance
-            LIMIT 50
-            """,
-            [emb, user.id],
-        )
-        rows = cur.fetchall()
+        return _list_ingested(request, user)
+
+    with metrics.stage("embed"):
+        emb = embed_query(q)
+    with metrics.stage("vector"), vector_cursor() as cur:
+        if settings.RAG_FILE_PREFILTER:
+            rows = nearest_files(cur, user.id, emb, FILES_SEARCH_LIMIT)
+        else:
+            # exact: best chunk per file, full scan
+            cur.execute(
+                """
+                SELECT file_id,
+                       MAX(file_name)                AS file_name,
+                       COUNT(*)                      AS chunks,
+                       MIN(embedding <-> %s::vector) AS distance
+                FROM rag_ragchunk
+                WHERE user_id = %s
+                GROUP BY file_id
+                ORDER BY distance
+                LIMIT %s
+                """,
+                [emb, user.id, FILES_SEARCH_LIMIT],
+            )
+            rows = cur.fetchall()
 
     files = [
-        {"file_name": fn, "chunks": c, "distance": float(d)}
-        for fn, c, d in rows
+        {"file_id": fid, "file_name": fn, "chunks": c, "distance": float(d)}
+        for fid, fn, c, d in rows
     ]
     return JsonResponse(files, safe=False)
 
 
+def _encode_cursor(name: str, pk: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, pk]).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(name), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def _row(*exprs) -> Func:
+    # (name, id) > (…, …): one range on the (user, name, id) index, unlike an OR
+    return Func(*exprs, function="ROW", output_field=Field())
+
+
+def _list_ingested(request, user):
+    """
+    Ingested files by name, read from the per-file stats on UserFile.
+    Keyset-paginated: pass the X-Next-Cursor response header back as ?cursor=.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", FILES_PAGE_SIZE)), 1), FILES_PAGE_MAX)
+    except ValueError:
+        return JsonResponse({"error": "bad limit"}, status=400)
+    qs = UserFile.objects.filter(user=user, chunk_count__gt=0)
+    if cursor := request.GET.get("cursor"):
+        after = _decode_cursor(cursor)
+        if after is None:
+            return JsonResponse({"error": "bad cursor"}, status=400)
+        name, pk = after
+        qs = qs.alias(key=_row(F("name"), F("id"))).filter(
+            key__gt=_row(Value(name), Value(pk))
+        )
+    with metrics.stage("db"):
+        page = list(qs.order_by("name", "id")[:limit + 1])
+
+    res = JsonResponse([
+        {
+            "file_id": f.file_id,
+            "file_name": f.name,
+            "chunks": f.chunk_count,
+            "tokens": f.token_count,
+            "size": f.size,
+            "version": f.version,
+            "ingested_at": f.ingested_at,
+        }
+        for f in page[:limit]
+    ], safe=False)
+    if len(page) > limit:
+        res["X-Next-Cursor"] = _encode_cursor(page[limit - 1].name, page[limit - 1].id)
+    return res
+
+
 @csrf_exempt
 @require_POST
 def search_similar(request):
     # If still used, implement properly or delete
     return JsonResponse({"results": []})
 
+
+
+@require_GET
+def db_pool(request):
+    """Connection-pool counters for this process (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "forbidden"}, status=403)
+    return JsonResponse(pool_stats())
+
+
+@require_GET
+def prometheus_metrics(request):
+    """This process's metrics in the Prometheus text format (staff or METRICS_TOKEN)."""
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        auth, f"Bearer {settings.METRICS_TOKEN}"
+    )
+    if not (token_ok or request.user.is_staff):
+        return HttpResponse("forbidden\n", status=403, content_type="text/plain")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
@@ -2,11 +2,43 @@
 import os
 import pytest
 
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+_encoding_error = None
+
+
+def pytest_sessionstart(session):
+    # tiktoken downloads its BPE file on first use; try once before `responses`
+    # starts intercepting HTTP, and only skip the tests that tokenize if offline
+    global _encoding_error
+    from rag.embeddings import _encoding
+    try:
+        _encoding()
+    except Exception as e:
+        _encoding_error = e
+
+@pytest.fixture(autouse=True)
+def _skip_without_encoding(monkeypatch):
+    # tests that never tokenize still run offline; the others skip on first use
+    if _encoding_error is None:
+        return
+
+    def unavailable():
+        pytest.skip(f"tiktoken encoding unavailable (set TIKTOKEN_CACHE_DIR): {_encoding_error}")
+
+    from rag import chunking, embeddings
+    monkeypatch.setattr(embeddings, "_encoding", unavailable)
+    monkeypatch.setattr(chunking, "_encoding", unavailable)
+
 @pytest.fixture(autouse=True)
-def _env_settings(settings, monkeypatch):
+def _env_settings(settings, monkeypatch, tmp_path):
     # keep external calls off by default
     os.environ.setdefault("OPENAI_API_KEY", "test")
     settings.SECRET_KEY = "test"
+    settings.TEXT_CACHE_DIR = str(tmp_path / "text_cache")
+    settings.PDF_EXTRACT_WORKERS = 0  # parse in-process unless a test opts in
+    from agent import drive_tokens
+    monkeypatch.setattr(drive_tokens, "_cache", {})
     return settings
 
 @pytest.fixture
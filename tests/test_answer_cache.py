@@ -0,0 +1,131 @@
+# tests/test_answer_cache.py
+import json
+import threading
+import time
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from agent import answer_cache
+from agent.models import CachedAnswer, UserFile
+
+ROWS = [(1, "f1", "a.txt", 0, 4), (2, "f2", "b.txt", 0, 4)]
+
+
+def _vec(*head):
+    return list(head) + [0.0] * (1536 - len(head))
+
+
+def _texts(rows, user):
+    return {row[1]: "ctx text" for row in rows}
+
+
+@pytest.fixture
+def chat(auth_client, user, mocker):
+    for fid in ("f1", "f2"):
+        UserFile.objects.create(user=user, file_id=fid, name=fid, ingested_at=timezone.now())
+    search = mocker.patch("agent.views._search", return_value=(_vec(1.0), ROWS))
+    mocker.patch("agent.views._export_texts", side_effect=_texts)
+    create = mocker.patch("agent.views.client.chat.completions.create")
+    create.return_value.choices[0].message.content = "cached answer"
+
+    def ask(msg="what is it?"):
+        res = auth_client.post(
+            reverse("chat_completion"), json.dumps({"message": msg}),
+            content_type="application/json",
+        )
+        return res.json()["response"]
+
+    return ask, search, create
+
+
+@pytest.mark.django_db
+def test_near_duplicate_question_reuses_answer(chat):
+    ask, search, create = chat
+    assert ask() == "cached answer"
+    search.return_value = (_vec(1.0, 0.1), ROWS)   # cosine ≈ 0.995
+    assert ask("what is this?") == "cached answer"
+    assert create.call_count == 1
+
+    search.return_value = (_vec(0.0, 1.0), ROWS)   # unrelated question
+    ask("something else")
+    assert create.call_count == 2
+
+
+@pytest.mark.django_db
+def test_different_chunks_or_reingest_miss(chat, user):
+    ask, search, create = chat
+    ask()
+    search.return_value = (_vec(1.0), ROWS[:1])
+    ask()
+    assert create.call_count == 2
+
+    UserFile.objects.filter(user=user, file_id="f1").update(ingested_at=timezone.now())
+    ask()
+    assert create.call_count == 3
+
+
+@pytest.mark.django_db
+def test_invalidate_drops_entries_for_file(chat, user):
+    ask, search, create = chat
+    ask()
+    search.return_value = (_vec(1.0), ROWS[1:])
+    ask()
+    assert answer_cache.invalidate(user, "f1") == 1
+    assert list(CachedAnswer.objects.values_list("file_ids", flat=True)) == [["f2"]]
+
+
+@pytest.mark.django_db
+def test_partial_context_not_cached(chat, mocker):
+    ask, search, create = chat
+    mocker.patch("agent.views._export_texts", return_value={"f1": "ctx text"})
+    ask()
+    assert not CachedAnswer.objects.exists()
+
+
+@pytest.mark.django_db
+def test_disabled_cache_uses_plain_retrieval(auth_client, mocker, settings):
+    settings.ANSWER_CACHE_SIMILARITY = 0
+    ctx = mocker.patch("agent.views.get_relevant_context", return_value=["ctx"])
+    create = mocker.patch("agent.views.client.chat.completions.create")
+    create.return_value.choices[0].message.content = "hi"
+    auth_client.post(reverse("chat_completion"), json.dumps({"message": "q"}),
+                     content_type="application/json")
+    assert ctx.called and not CachedAnswer.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_identical_questions_in_flight_share_one_completion(user, mocker):
+    UserFile.objects.create(user=user, file_id="f1", name="f1", ingested_at=timezone.now())
+    mocker.patch("agent.views._search", return_value=(_vec(1.0), ROWS[:1]))
+    mocker.patch("agent.views._export_texts", side_effect=_texts)
+    create = mocker.patch("agent.views.client.chat.completions.create")
+
+    def slow(**kw):
+        time.sleep(0.3)
+        return create.return_value
+    create.side_effect = slow
+    create.return_value.choices[0].message.content = "once"
+
+    answers = []
+
+    def ask():
+        c = Client()
+        c.force_login(user)
+        try:
+            res = c.post(reverse("chat_completion"), json.dumps({"message": "Same  question"}),
+                         content_type="application/json")
+            answers.append(res.json()["response"])
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=ask) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert answers == ["once"] * 3
+    assert create.call_count == 1
@@ -0,0 +1,41 @@
+# tests/test_benchmark.py
+import json
+
+import pytest
+import responses
+from django.core.management import call_command
+
+from agent import bench
+from rag.models import RagChunk
+
+
+def test_percentiles_nearest_rank():
+    stats = bench.percentiles(range(1, 101))
+    assert stats == {"n": 100, "mean": 50.5, "p50": 50, "p95": 95, "p99": 99}
+    assert bench.percentiles([]) == {}
+
+
+def test_synthetic_corpus_is_deterministic():
+    assert bench.synthetic_text("a", 500) == bench.synthetic_text("a", 500)
+    assert len(bench.synthetic_text("a", 500)) == 500
+    assert bench.fake_embedding("q") == bench.fake_embedding("q")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_command_writes_report(tmp_path):
+    responses.add_passthru("http://127.0.0.1")  # the local stand-in server
+    out = tmp_path / "bench.json"
+    call_command(
+        "benchmark", scales="150", docs=2, doc_chars=3000, queries=3, output=str(out),
+    )
+    report = json.loads(out.read_text())
+
+    assert report["ingest"]["docs"] == 2
+    assert report["ingest"]["chunks"] > 0
+    timings = report["scales"]["150"]
+    assert set(timings) == {
+        "get_relevant_context", "list_files", "list_files_q", "chat",
+        "search_chunks", "search_chunks_mmr_100", "mmr_100",
+    }
+    assert all(t["n"] == 3 and t["p50"] <= t["p99"] for t in timings.values())
+    assert not RagChunk.objects.exists()  # bench data cleared
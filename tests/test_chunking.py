@@ -0,0 +1,44 @@
+# tests/test_chunking.py
+from rag.chunking import iter_chunks
+from rag.embeddings import count_tokens
+
+SENTENCE = "The quick brown fox jumps over the lazy dog near the river bank. "
+TEXT = "\n\n".join(SENTENCE * n for n in (3, 5, 2, 7, 4))
+
+
+def test_offsets_are_exact_and_sizes_bounded():
+    chunks = list(iter_chunks(TEXT, size=50, overlap=10))
+    assert len(chunks) > 3
+    assert [c[0] for c in chunks] == list(range(len(chunks)))
+    for _, start, end, text, n in chunks:
+        assert TEXT[start:end] == text
+        assert 0 < n <= 50
+        assert abs(count_tokens(text) - n) <= 1
+    assert chunks[-1][2] == len(TEXT)
+
+
+def test_chunks_end_on_sentence_or_paragraph():
+    chunks = list(iter_chunks(TEXT, size=50, overlap=0))
+    for _, _, end, text, _ in chunks[:-1]:
+        assert text.rstrip(" ").endswith((".", "\n"))
+    # no overlap → chunks tile the text
+    assert all(a[2] == b[1] for a, b in zip(chunks, chunks[1:]))
+
+
+def test_overlap_starts_on_a_word():
+    chunks = list(iter_chunks(SENTENCE * 20, size=40, overlap=15))
+    for (_, _, prev_end, _, _), (_, start, _, text, _) in zip(chunks, chunks[1:]):
+        assert start < prev_end
+        assert text[0] == " " or text[0].isupper()
+
+
+def test_streamed_pieces_match_whole_text():
+    pieces = [TEXT[i:i + 97] for i in range(0, len(TEXT), 97)]
+    assert list(iter_chunks(pieces, size=50, overlap=10)) == list(
+        iter_chunks(TEXT, size=50, overlap=10)
+    )
+
+
+def test_blank_text_yields_nothing():
+    assert list(iter_chunks(" \n\n ", size=50)) == []
+    assert list(iter_chunks([], size=50)) == []
@@ -0,0 +1,55 @@
+# tests/test_context.py
+from rag.context import pack
+from rag.embeddings import count_tokens
+
+TEXT = " ".join(f"w{i}" for i in range(400))   # "w0 w1 … w399"
+
+
+def _row(i, file_id, start, end):
+    return (i, file_id, f"{file_id}.txt", start, end)
+
+
+def test_overlapping_and_touching_ranges_merge():
+    rows = [_row(1, "a", 100, 200), _row(2, "a", 150, 260), _row(3, "a", 260, 300),
+            _row(4, "a", 500, 550)]
+    out = pack(rows, {"a": TEXT}, budget=10_000)
+    assert [(c["char_start"], c["char_end"]) for c in out] == [(100, 300), (500, 550)]
+    assert out[0]["text"] == TEXT[100:300]
+
+
+def test_segments_follow_best_rank_across_files():
+    rows = [_row(1, "b", 0, 50), _row(2, "a", 300, 350), _row(3, "b", 40, 90)]
+    out = pack(rows, {"a": TEXT, "b": TEXT}, budget=10_000)
+    assert [(c["file_id"], c["char_start"], c["char_end"]) for c in out] == [
+        ("b", 0, 90), ("a", 300, 350),
+    ]
+
+
+def test_budget_skips_chunks_that_do_not_fit():
+    big, small = TEXT[0:800], TEXT[1000:1040]
+    budget = count_tokens(small) + 5
+    rows = [_row(1, "a", 1000, 1040), _row(2, "a", 0, 800), _row(3, "b", 0, 20)]
+    out = pack(rows, {"a": TEXT, "b": "tiny text here"}, budget=budget)
+    assert [c["file_id"] for c in out] == ["a", "b"]
+    assert sum(count_tokens(c["text"]) for c in out) <= budget
+    assert big not in [c["text"] for c in out]
+
+
+def test_oversized_first_chunk_is_truncated():
+    out = pack([_row(1, "a", 0, 1000)], {"a": TEXT}, budget=10)
+    assert len(out) == 1
+    assert count_tokens(out[0]["text"]) <= 10
+    assert TEXT.startswith(out[0]["text"]) and out[0]["char_end"] == len(out[0]["text"])
+
+
+def test_rows_of_unexported_files_are_dropped(settings):
+    settings.RAG_CONTEXT_TOKENS = 1000
+    out = pack([_row(1, "gone", 0, 10), _row(2, "a", 0, 10)], {"a": TEXT})
+    assert [c["file_id"] for c in out] == ["a"]
+
+
+def test_truncated_head_is_a_real_prefix():
+    text = "🙂" * 5 + "漢字テスト" * 3   # 2 tokens per emoji: odd cuts split one
+    out = pack([_row(1, "a", 0, len(text))], {"a": text}, budget=3)
+    assert out[0]["text"] == "🙂"
+    assert out[0]["text"] == text[out[0]["char_start"]:out[0]["char_end"]]
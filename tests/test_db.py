@@ -0,0 +1,34 @@
+# tests/test_db.py
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from rag import db
+from rag.search import vector_cursor
+
+
+@pytest.mark.django_db
+def test_vector_registered_once_per_connection(mocker):
+    with vector_cursor():
+        pass
+    assert connection.connection in db._registered
+    spy = mocker.patch("rag.db.register_vector")
+    db.on_connection_created(None, connection)
+    with vector_cursor() as cur:
+        cur.execute("SELECT '[1,2]'::vector")
+        assert cur.fetchone()[0].to_list() == [1, 2]  # adapter loaded, not a string
+    spy.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_db_pool_stats_staff_only(client, django_user_model, settings):
+    user = django_user_model.objects.create_user("s", "s@x.com", "p")
+    client.force_login(user)
+    assert client.get(reverse("db_pool")).status_code == 403
+
+    user.is_staff = True
+    user.save()
+    res = client.get(reverse("db_pool"))
+    assert res.status_code == 200
+    if settings.DATABASES["default"].get("OPTIONS", {}).get("pool"):
+        assert res.json()["default"]["pool_max"] == settings.DB_POOL_MAX_SIZE
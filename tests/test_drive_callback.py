@@ -6,8 +6,8 @@ from unittest.mock import patch
 def test_drive_callback_saves_and_redirects(client, django_user_model):
     user = django_user_model.objects.create_user("u","u@x.com","p")
     client.force_login(user)
-    with patch("agent.views.requests.post") as req:
-        req.return_value.json.return_value = {
+    with patch("agent.drive_client.token_request") as req:
+        req.return_value = {
             "access_token":"ya29",
             "refresh_token":"r",
             "expires_in":3600
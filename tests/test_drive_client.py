@@ -0,0 +1,64 @@
+# tests/test_drive_client.py
+import pytest
+import requests
+import responses
+
+from django.conf import settings
+
+from agent import drive_client
+
+META = f"{settings.DRIVE_API_BASE}/files/abc"
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(settings, monkeypatch):
+    settings.DRIVE_HTTP_RETRIES = 2
+    settings.DRIVE_HTTP_BACKOFF = 0
+    monkeypatch.setattr(drive_client, "_session", None)
+
+
+def test_session_is_shared_and_pooled(settings):
+    settings.DRIVE_HTTP_POOL_SIZE = 7
+    s = drive_client.session()
+    assert drive_client.session() is s
+    assert s.get_adapter("https://www.googleapis.com")._pool_maxsize == 7
+
+
+@responses.activate
+def test_retries_429_honouring_retry_after():
+    responses.add(responses.GET, META, status=429, headers={"Retry-After": "0"})
+    responses.add(responses.GET, META, json={"name": "a"})
+    assert drive_client.file_meta("abc", "tok", "name") == {"name": "a"}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_gives_up_after_retries():
+    for _ in range(3):
+        responses.add(responses.GET, META, status=503)
+    with pytest.raises(requests.HTTPError):
+        drive_client.file_meta("abc", "tok", "name")
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_token_post_retries_5xx_but_not_read_timeouts(settings):
+    responses.add(responses.POST, settings.GOOGLE_TOKEN_URL, status=503)
+    responses.add(responses.POST, settings.GOOGLE_TOKEN_URL, json={"access_token": "a"})
+    assert drive_client.token_request({"code": "c"}) == {"access_token": "a"}
+    assert len(responses.calls) == 2
+
+    retry = drive_client.session().get_adapter(settings.GOOGLE_TOKEN_URL).max_retries
+    assert retry.read == 0
+    assert retry.is_retry("POST", 503) and not retry.is_retry("POST", 400)
+    get_retry = drive_client.session().get_adapter(META).max_retries
+    assert not get_retry.is_retry("POST", 503)
+
+
+def test_content_url():
+    assert drive_client.content_url("d", "application/vnd.google-apps.spreadsheet") == (
+        f"{settings.DRIVE_API_BASE}/files/d/export?mimeType=text/csv"
+    )
+    assert drive_client.content_url("d", "application/vnd.google-apps.form") is None
+    assert drive_client.content_url("d", "application/pdf") == f"{settings.DRIVE_API_BASE}/files/d?alt=media"
+
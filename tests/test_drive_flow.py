@@ -8,8 +8,8 @@ def test_drive_callback_then_drive_token(client, django_user_model, settings):
     client.force_login(user)
 
     cb_url = reverse("drive_callback")
-    with patch("agent.views.requests.post") as mock_post:
-        mock_post.return_value.json.return_value = {
+    with patch("agent.drive_client.token_request") as mock_post:
+        mock_post.return_value = {
             "access_token": "ya29.token",
             "refresh_token": "1//refresh",
             "expires_in": 3600,
@@ -33,8 +33,8 @@ def test_drive_token_refresh(client, django_user_model):
         expiry_ts=time.time() - 5
     )
 
-    with patch("agent.views.requests.post") as mock_post:
-        mock_post.return_value.json.return_value = {
+    with patch("agent.drive_client.token_request") as mock_post:
+        mock_post.return_value = {
             "access_token": "new", "expires_in": 3600
         }
         res = client.get(reverse("drive_token"))
@@ -5,14 +5,7 @@ import pytest
 import responses
 from django.urls import reverse
 
-from agent.drive_ingest import ingest_drive_file, _chunk_text
-
-def test_chunk_text_exact():
-    txt = "A" * 3500
-    chunks = _chunk_text(txt, size=1000, overlap=100)
-    # expected chunk starts: 0, 900, 1800, 2700
-    starts = [s for _, s, *_ in chunks]
-    assert starts == [0, 900, 1800, 2700]
+from agent.drive_ingest import ingest_drive_file, _store_stream
 
 @pytest.mark.django_db
 @responses.activate
@@ -22,16 +15,21 @@ def test_ingest_drive_file_minimal(user, mocker):
     responses.add(
         responses.GET,
         metadata_url,
-        json={"name": "doc.txt", "mimeType": "text/plain"},
-        match=[responses.matchers.query_param_matcher({"fields": "name,mimeType"})],
+        json={"name": "doc.txt", "mimeType": "text/plain", "version": "7"},
+        match=[responses.matchers.query_param_matcher(
+            {"fields": "name,mimeType,version,md5Checksum,modifiedTime"}
+        )],
         status=200,
     )
     # 2) stub file download
     download_url = metadata_url + "?alt=media"
     responses.add(responses.GET, download_url, body=b"hello world", status=200)
 
-    # Mock embedding call → deterministic vector
-    mocker.patch("agent.drive_ingest._embed", return_value=[0.0] * 1536)
+    # Mock embedding call → deterministic vectors
+    mocker.patch(
+        "agent.drive_ingest.embed_texts",
+        side_effect=lambda texts, token_counts=None: [[0.0] * 1536 for _ in texts],
+    )
 
     ingest_drive_file(user, "abc", access_token="tok")
 
@@ -41,21 +39,183 @@ def test_ingest_drive_file_minimal(user, mocker):
     chunk = qs.first()
     assert chunk.char_end == len("hello world")
 
+    from agent import text_cache
+    assert text_cache.get("abc", "7") == "hello world"
+
+def _stub_drive(version, body):
+    responses.add(
+        responses.GET, "https://www.googleapis.com/drive/v3/files/abc",
+        json={"name": "doc.txt", "mimeType": "text/plain", "version": version,
+              "modifiedTime": "2025-08-01T10:00:00.000Z"},
+        match=[responses.matchers.query_param_matcher(
+            {"fields": "name,mimeType,version,md5Checksum,modifiedTime"}
+        )],
+    )
+    responses.add(
+        responses.GET, "https://www.googleapis.com/drive/v3/files/abc?alt=media",
+        body=body,
+    )
+
+@pytest.mark.django_db
+@responses.activate
+def test_reingest_skips_unchanged_version_and_chunks(user, mocker, settings):
+    from agent.models import UserFile
+    from rag.models import RagChunk
+    settings.CHUNK_TOKENS = 40
+    settings.CHUNK_OVERLAP_TOKENS = 0
+    embedded = []
+
+    def fake_embed(texts, token_counts=None):
+        texts = list(texts)
+        embedded.append(texts)
+        return [[float(len(t))] + [0.0] * 1535 for t in texts]
+
+    embed = mocker.patch("agent.drive_ingest.embed_texts", side_effect=fake_embed)
+    first = "The first paragraph stays exactly the same between versions. " * 2
+    second = "The second paragraph is the one that gets edited later on. " * 2
+    _stub_drive("1", first + "\n\n" + second)
+    assert ingest_drive_file(user, "abc", "tok") == 2
+    assert embed.call_count == 1
+    uf = UserFile.objects.get(user=user, file_id="abc")
+    assert (uf.version, uf.modified_time.year) == ("1", 2025)
+    assert (uf.chunk_count, uf.size) == (2, len((first + "\n\n" + second).encode()))
+    assert uf.token_count == sum(
+        RagChunk.objects.filter(user=user, file_id="abc").values_list("token_count", flat=True)
+    )
+    assert uf.ingested_at is not None
+    uf.refresh_from_db()
+    assert uf.centroid is not None
+    assert RagChunk.objects.get(user=user, file_id="abc", chunk_idx=0).token_count > 0
+
+    # same version → metadata request only, nothing embedded or downloaded
+    responses.reset()
+    _stub_drive("1", first + "\n\n" + second)
+    assert ingest_drive_file(user, "abc", "tok") == 2
+    assert len(responses.calls) == 1
+    assert embed.call_count == 1
+
+    # new version where only the second paragraph changed
+    responses.reset()
+    edited = second.replace("edited", "rewritten")
+    _stub_drive("2", first + "\n\n" + edited)
+    assert ingest_drive_file(user, "abc", "tok") == 2
+    assert embedded[-1] == [edited]
+
+@pytest.mark.django_db(transaction=True)
+def test_store_stream_upserts_and_drops_stale_tail(user, mocker):
+    from django.db import connection
+    from rag.models import RagChunk
+
+    def fake_embed(texts, token_counts=None):
+        assert not connection.in_atomic_block  # no transaction held while embedding
+        return [[0.0] * 1536 for _ in texts]
+
+    mocker.patch("agent.drive_ingest.embed_texts", side_effect=fake_embed)
+    _store_stream(user, "abc", "v1.txt", iter([
+        (i, i * 10, i * 10 + 10, f"text {i}", 3) for i in range(3)
+    ]))
+    first_id = RagChunk.objects.get(user=user, file_id="abc", chunk_idx=0).id
+
+    # document shrank to two chunks and was renamed
+    assert _store_stream(user, "abc", "v2.txt", iter([
+        (i, i * 5, i * 5 + 5, f"new {i}", 2) for i in range(2)
+    ])) == (2, 4)
+    qs = RagChunk.objects.filter(user=user, file_id="abc").order_by("chunk_idx")
+    assert [(c.chunk_idx, c.char_end, c.file_name) for c in qs] == [
+        (0, 5, "v2.txt"), (1, 10, "v2.txt"),
+    ]
+    assert qs[0].id == first_id  # updated in place, not re-inserted
+
 @pytest.mark.django_db
 def test_store_selected_files_ingests(client, django_user_model):
     from agent.models import DriveAuth
+    from agent.ingest_jobs import claim_next, process
     user = django_user_model.objects.create_user("u", "u@x.com", "p")
     client.force_login(user)
     DriveAuth.objects.create(user=user, access_token="tok", expiry_ts=time.time() + 3600)
 
-    from unittest.mock import patch
-    with patch("agent.views.ingest_drive_file") as ingest_mock:
+    from unittest.mock import ANY, patch
+    with patch("agent.ingest_jobs.ingest_drive_file", return_value=2) as ingest_mock:
         payload = {"files": [{"id": "file1", "name": "Doc 1"}]}
         res = client.post(
             reverse("store_selected_files"),
             data=json.dumps(payload),
             content_type="application/json",
         )
-    assert res.status_code == 200
-    ingest_mock.assert_called_once_with(user, "file1", "tok")
+        assert res.status_code == 202
+        ingest_mock.assert_not_called()  # queued, not ingested in-request
+
+        process(claim_next())
+    ingest_mock.assert_called_once_with(user, "file1", "tok", progress=ANY)
+
+def test_utf8_split_across_blocks(monkeypatch):
+    import io
+    from agent import drive_ingest
+    monkeypatch.setattr(drive_ingest, "_BLOCK", 3)
+    pieces = list(drive_ingest.iter_text(io.BytesIO("héllo wörld".encode()), "text/plain", "a.txt"))
+    assert "".join(pieces) == "héllo wörld"
+
+@pytest.mark.django_db
+@responses.activate
+def test_download_over_cap_is_refused(user, mocker, settings):
+    from rag.models import RagChunk
+    settings.DRIVE_MAX_DOWNLOAD_BYTES = 10
+    _stub_drive("1", b"x" * 11)
+    embed = mocker.patch("agent.drive_ingest.embed_texts")
+    with pytest.raises(ValueError):
+        ingest_drive_file(user, "abc", "tok")
+    embed.assert_not_called()
+    assert not RagChunk.objects.filter(user=user).exists()
+
+    from agent import text_cache
+    assert text_cache.get("abc", "1") is None
+
+@pytest.mark.django_db
+@responses.activate
+def test_chunks_embedded_in_batches(user, mocker, settings):
+    from rag.models import RagChunk
+    settings.CHUNK_TOKENS = 20
+    settings.CHUNK_OVERLAP_TOKENS = 0
+    settings.EMBED_BATCH_SIZE = 2
+    sizes = []
+
+    def fake_embed(texts, token_counts=None):
+        texts = list(texts)
+        sizes.append(len(texts))
+        return [[0.0] * 1536 for _ in texts]
+
+    mocker.patch("agent.drive_ingest.embed_texts", side_effect=fake_embed)
+    body = " ".join(f"Sentence number {i} is here." for i in range(40))
+    _stub_drive("1", body)
+    beat = mocker.Mock()
+    total = ingest_drive_file(user, "abc", "tok", progress=beat)
+    assert total > 2
+    assert max(sizes) <= 2 and sum(sizes) == total
+    assert beat.call_count == len(sizes)
+    assert RagChunk.objects.filter(user=user, file_id="abc").count() == total
+
+@pytest.mark.django_db
+@responses.activate
+def test_failed_reingest_keeps_previous_chunks(user, mocker, settings):
+    from rag.models import RagChunk
+    settings.CHUNK_TOKENS = 20
+    settings.CHUNK_OVERLAP_TOKENS = 0
+    settings.EMBED_BATCH_SIZE = 2
+    mocker.patch("agent.drive_ingest.embed_texts",
+                 side_effect=lambda texts, token_counts=None: [[0.0] * 1536 for _ in texts])
+    _stub_drive("1", " ".join(f"Sentence number {i} is here." for i in range(40)))
+    ingest_drive_file(user, "abc", "tok")
+    before = list(RagChunk.objects.filter(user=user, file_id="abc")
+                  .order_by("chunk_idx").values_list("chunk_idx", "char_end"))
 
+    # new version: the first batch is stored, the second fails to embed
+    responses.reset()
+    _stub_drive("2", " ".join(f"Another sentence {i} replaces it." for i in range(40)))
+    mocker.patch("agent.drive_ingest.embed_texts", side_effect=[
+        [[1.0] * 1536] * 2, RuntimeError("openai down"),
+    ])
+    with pytest.raises(RuntimeError):
+        ingest_drive_file(user, "abc", "tok")
+    after = list(RagChunk.objects.filter(user=user, file_id="abc")
+                 .order_by("chunk_idx").values_list("chunk_idx", "char_end"))
+    assert after == before
@@ -0,0 +1,164 @@
+# tests/test_drive_sync.py
+import pytest
+import responses
+from responses import matchers
+
+from django.conf import settings
+
+from agent.drive_client import FOLDER_MIME
+from agent.drive_sync import sync_drive_folder
+from agent.models import DriveSyncState, UserFile
+from rag.models import RagChunk
+
+API = settings.DRIVE_API_BASE
+
+
+def _q(**params):
+    return [matchers.query_param_matcher(params, strict_match=False)]
+
+
+def _list(folder, files, page=None, next_page=None):
+    params = {"q": f"'{folder}' in parents and trashed = false"}
+    if page:
+        params["pageToken"] = page
+    body = {"files": files}
+    if next_page:
+        body["nextPageToken"] = next_page
+    responses.add(responses.GET, f"{API}/files", json=body, match=_q(**params))
+
+
+@pytest.fixture
+def ingest(mocker):
+    mocker.patch("agent.drive_sync.valid_token", return_value="tok")
+    return mocker.patch("agent.drive_sync.ingest_drive_file", return_value=1)
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_first_run_crawls_tree_with_pagination(user, ingest):
+    responses.add(responses.GET, f"{API}/changes/startPageToken",
+                  json={"startPageToken": "100"})
+    _list("root", [{"id": "a", "name": "a.txt", "mimeType": "text/plain"},
+                   {"id": "sub", "name": "sub", "mimeType": FOLDER_MIME}],
+          next_page="p2")
+    _list("root", [{"id": "b", "name": "b.pdf", "mimeType": "application/pdf"}], page="p2")
+    _list("sub", [{"id": "c", "name": "c.txt", "mimeType": "text/plain"}])
+
+    stats = sync_drive_folder(user, "root")
+
+    assert stats == {"ingested": 3, "removed": 0, "failed": 0}
+    assert sorted(c.args[1] for c in ingest.call_args_list) == ["a", "b", "c"]
+    state = DriveSyncState.objects.get(user=user, folder_id="root")
+    assert state.page_token == "100"
+    assert state.folder_ids == ["root", "sub"]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_later_runs_apply_only_changes(user, ingest):
+    DriveSyncState.objects.create(
+        user=user, folder_id="root", page_token="100", folder_ids=["root"], file_ids=["old"]
+    )
+    UserFile.objects.create(user=user, file_id="old", name="old.txt")
+    RagChunk.objects.create(user=user, file_id="old", file_name="old.txt", chunk_idx=0,
+                            char_start=0, char_end=1, embedding=[0.0] * 1536)
+    responses.add(responses.GET, f"{API}/changes", match=_q(pageToken="100"), json={
+        "nextPageToken": "101",
+        "changes": [
+            {"fileId": "new", "file": {"id": "new", "name": "new.txt",
+                                       "mimeType": "text/plain", "parents": ["root"]}},
+            {"fileId": "old", "file": {"id": "old", "name": "old.txt", "trashed": True,
+                                       "mimeType": "text/plain", "parents": ["root"]}},
+            {"fileId": "elsewhere", "file": {"id": "elsewhere", "name": "x.txt",
+                                             "mimeType": "text/plain", "parents": ["other"]}},
+        ],
+    })
+    responses.add(responses.GET, f"{API}/changes", match=_q(pageToken="101"), json={
+        "newStartPageToken": "102",
+        "changes": [
+            {"fileId": "dir", "file": {"id": "dir", "name": "dir", "mimeType": FOLDER_MIME,
+                                       "parents": ["root"]}},
+        ],
+    })
+    _list("dir", [{"id": "inner", "name": "inner.txt", "mimeType": "text/plain"}])
+
+    stats = sync_drive_folder(user, "root")
+
+    assert stats == {"ingested": 2, "removed": 1, "failed": 0}
+    assert [c.args[1] for c in ingest.call_args_list] == ["new", "inner"]
+    assert not RagChunk.objects.filter(user=user, file_id="old").exists()
+    assert not UserFile.objects.filter(user=user, file_id="old").exists()
+    state = DriveSyncState.objects.get(user=user, folder_id="root")
+    assert state.page_token == "102"
+    assert state.folder_ids == ["dir", "root"]
+    assert state.file_ids == ["inner", "new"]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_changes_outside_the_tree_keep_other_files(user, ingest):
+    DriveSyncState.objects.create(
+        user=user, folder_id="root", page_token="100", folder_ids=["root", "sub"],
+        file_ids=["a"],
+    )
+    for file_id in ("a", "picked"):
+        UserFile.objects.create(user=user, file_id=file_id, name=f"{file_id}.txt")
+        RagChunk.objects.create(user=user, file_id=file_id, file_name=f"{file_id}.txt",
+                                chunk_idx=0, char_start=0, char_end=1, embedding=[0.0] * 1536)
+    responses.add(responses.GET, f"{API}/changes", match=_q(pageToken="100"), json={
+        "newStartPageToken": "101",
+        "changes": [
+            # edited document added through the picker, not in the synced tree
+            {"fileId": "picked", "file": {"id": "picked", "name": "picked.txt",
+                                          "mimeType": "text/plain", "parents": ["mine"]}},
+            {"fileId": "picked", "removed": True},
+            {"fileId": "sub", "removed": True},
+        ],
+    })
+
+    stats = sync_drive_folder(user, "root")
+
+    assert stats == {"ingested": 0, "removed": 0, "failed": 0}
+    ingest.assert_not_called()
+    assert UserFile.objects.filter(user=user, file_id="picked").exists()
+    assert RagChunk.objects.filter(user=user, file_id="picked").exists()
+    state = DriveSyncState.objects.get(user=user, folder_id="root")
+    assert state.folder_ids == ["root"]   # deleted subfolder forgotten
+    assert state.file_ids == ["a"]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_full_recrawl_drops_files_gone_from_the_tree(user, ingest):
+    DriveSyncState.objects.create(
+        user=user, folder_id="root", page_token="100", folder_ids=["root"], file_ids=["a", "b"],
+    )
+    for file_id in ("a", "b"):
+        UserFile.objects.create(user=user, file_id=file_id, name=f"{file_id}.txt")
+    responses.add(responses.GET, f"{API}/changes/startPageToken",
+                  json={"startPageToken": "200"})
+    _list("root", [{"id": "a", "name": "a.txt", "mimeType": "text/plain"}])
+
+    stats = sync_drive_folder(user, "root", full=True)
+
+    assert stats == {"ingested": 1, "removed": 1, "failed": 0}
+    assert list(UserFile.objects.filter(user=user).values_list("file_id", flat=True)) == ["a"]
+    assert DriveSyncState.objects.get(user=user, folder_id="root").file_ids == ["a"]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_token_is_looked_up_per_page_and_file(user, ingest, mocker):
+    tokens = mocker.patch("agent.drive_sync.valid_token",
+                          side_effect=[f"t{i}" for i in range(10)])
+    responses.add(responses.GET, f"{API}/changes/startPageToken",
+                  json={"startPageToken": "100"})
+    _list("root", [{"id": "a", "name": "a.txt", "mimeType": "text/plain"}], next_page="p2")
+    _list("root", [{"id": "b", "name": "b.txt", "mimeType": "text/plain"}], page="p2")
+
+    sync_drive_folder(user, "root")
+
+    sent = [c.request.headers["Authorization"] for c in responses.calls]
+    assert len(set(sent)) == len(sent) == 3   # start token, two listing pages
+    assert len({c.args[2] for c in ingest.call_args_list}) == 2
+    assert tokens.call_count == 5
@@ -0,0 +1,63 @@
+# tests/test_drive_tokens.py
+import threading
+import time
+import pytest
+
+from agent import drive_tokens
+from agent.models import DriveAuth
+
+
+@pytest.mark.django_db
+def test_cached_between_calls(user, django_assert_num_queries):
+    DriveAuth.objects.create(user=user, access_token="tok", expiry_ts=time.time() + 3600)
+    assert drive_tokens.valid_token(user) == "tok"
+    with django_assert_num_queries(0):
+        assert drive_tokens.valid_token(user) == "tok"
+
+
+@pytest.mark.django_db
+def test_not_connected(user):
+    assert drive_tokens.valid_token(user) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_expired_requests_refresh_once(user, mocker):
+    DriveAuth.objects.create(user=user, access_token="old", refresh_token="r",
+                             expiry_ts=time.time() - 5)
+    calls = []
+
+    def slow_refresh(data):
+        calls.append(data)
+        time.sleep(0.05)
+        return {"access_token": "new", "expires_in": 3600}
+
+    mocker.patch("agent.drive_client.token_request", side_effect=slow_refresh)
+    results = []
+
+    def worker():
+        results.append(drive_tokens.valid_token(user))
+        from django.db import connection
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["new"] * 5
+    assert len(calls) == 1
+    assert DriveAuth.objects.get(user=user).access_token == "new"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_refreshes_ahead_of_expiry_in_background(user, mocker, settings):
+    settings.DRIVE_TOKEN_REFRESH_AHEAD = 300
+    DriveAuth.objects.create(user=user, access_token="old", refresh_token="r",
+                             expiry_ts=time.time() + 200)
+    refresh = mocker.patch("agent.drive_client.token_request",
+                           return_value={"access_token": "new", "expires_in": 3600})
+
+    assert drive_tokens.valid_token(user) == "old"  # still good: no waiting
+    drive_tokens._schedule(user.pk).result(timeout=5)
+    refresh.assert_called_once()
+    assert drive_tokens.valid_token(user) == "new"
@@ -0,0 +1,138 @@
+# tests/test_embeddings.py
+import httpx
+import pytest
+from openai import BadRequestError
+from unittest.mock import MagicMock
+
+from rag import embeddings
+
+
+def _result(batch):
+    # return items out of order to check that `index` is honoured
+    data = [MagicMock(index=i, embedding=[float(len(t))]) for i, t in enumerate(batch)]
+    return MagicMock(data=list(reversed(data)))
+
+
+def _bad_request():
+    req = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    return BadRequestError("bad", response=httpx.Response(400, request=req), body=None)
+
+
+def test_embed_texts_batches_by_size(settings, mocker):
+    settings.EMBED_BATCH_SIZE = 2
+    settings.EMBED_BATCH_TOKENS = 10_000
+    create = mocker.patch.object(
+        embeddings.client.embeddings, "create",
+        side_effect=lambda model, input: _result(input),
+    )
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    assert embeddings.embed_texts(texts) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert [c.kwargs["input"] for c in create.call_args_list] == [
+        ["a", "bb"], ["ccc", "dddd"], ["eeeee"],
+    ]
+
+
+def test_embed_texts_respects_token_budget(settings, mocker):
+    settings.EMBED_BATCH_SIZE = 100
+    settings.EMBED_BATCH_TOKENS = 4
+    create = mocker.patch.object(
+        embeddings.client.embeddings, "create",
+        side_effect=lambda model, input: _result(input),
+    )
+    texts = ["one two three", "four five", "six"]  # 3 + 2 + 1 tokens
+    embeddings.embed_texts(texts)
+    assert [c.kwargs["input"] for c in create.call_args_list] == [
+        ["one two three"], ["four five", "six"],
+    ]
+
+
+def test_embed_texts_bisects_rejected_batch(settings, mocker):
+    settings.EMBED_BATCH_SIZE = 100
+    settings.EMBED_BATCH_TOKENS = 10_000
+
+    def create(model, input):
+        if "bad" in input and len(input) > 1:
+            raise _bad_request()
+        return _result(input)
+
+    mocker.patch.object(embeddings.client.embeddings, "create", side_effect=create)
+    assert embeddings.embed_texts(["a", "bad", "cc", "d"]) == [[1.0], [3.0], [2.0], [1.0]]
+
+
+def test_embed_texts_raises_for_single_rejected_item(settings, mocker):
+    mocker.patch.object(
+        embeddings.client.embeddings, "create", side_effect=_bad_request(),
+    )
+    with pytest.raises(BadRequestError):
+        embeddings.embed_texts(["x"])
+
+
+# ───────── query cache ─────────
+@pytest.fixture
+def query_cache(mocker):
+    embeddings._lru.clear()
+    for k in embeddings._stats:
+        embeddings._stats[k] = 0
+    create = mocker.patch.object(
+        embeddings.client.embeddings, "create",
+        side_effect=lambda model, input: MagicMock(data=[MagicMock(embedding=[float(len(input))])]),
+    )
+    yield create
+    embeddings._lru.clear()
+
+
+def test_embed_query_local_hit_and_normalisation(query_cache):
+    assert embeddings.embed_query("hello  world") == [11.0]
+    assert embeddings.embed_query(" hello world ") == [11.0]
+    assert query_cache.call_count == 1
+    stats = embeddings.cache_stats()
+    assert (stats["local_hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_embed_query_ttl_and_lru_bound(query_cache, settings, mocker):
+    settings.EMBED_QUERY_CACHE_SIZE = 2
+    settings.EMBED_QUERY_CACHE_TTL = 60
+    now = mocker.patch("rag.embeddings.time.monotonic", return_value=1000.0)
+    for q in ("a", "b", "c"):
+        embeddings.embed_query(q)
+    assert list(embeddings._lru) == [embeddings._key("b"), embeddings._key("c")]
+    now.return_value = 1061.0
+    embeddings.embed_query("c")
+    assert query_cache.call_count == 4  # expired → refetched
+
+
+def test_embed_query_shared_cache(query_cache, settings):
+    settings.EMBED_QUERY_CACHE_ALIAS = "default"
+    from django.core.cache import cache
+    cache.clear()
+    embeddings.embed_query("shared")
+    embeddings._lru.clear()  # as if another worker process
+    assert embeddings.embed_query("shared") == [6.0]
+    assert query_cache.call_count == 1
+    assert embeddings.cache_stats()["shared_hits"] == 1
+
+
+def test_embed_query_single_flight(query_cache):
+    import threading
+    started, release = threading.Event(), threading.Event()
+
+    def slow(model, input):
+        started.set()
+        release.wait(5)
+        return MagicMock(data=[MagicMock(embedding=[1.0])])
+
+    query_cache.side_effect = slow
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(embeddings.embed_query("same")))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == [[1.0]] * 5
+    assert query_cache.call_count == 1
@@ -0,0 +1,114 @@
+# tests/test_ingest_jobs.py
+import time
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from agent.ingest_jobs import claim_next, enqueue, process
+from agent.models import DriveAuth, IngestJobFile
+
+FILES = [{"id": "f1", "name": "One"}, {"id": "f2", "name": "Two"}]
+
+
+@pytest.fixture
+def drive_user(user):
+    DriveAuth.objects.create(user=user, access_token="tok", expiry_ts=time.time() + 3600)
+    return user
+
+
+@pytest.mark.django_db
+def test_claim_skips_claimed_and_finished(drive_user):
+    enqueue(drive_user, FILES)
+    first, second = claim_next(), claim_next()
+    assert (first.file_id, second.file_id) == ("f1", "f2")
+    assert first.status == IngestJobFile.RUNNING
+    assert claim_next() is None
+
+
+@pytest.mark.django_db
+def test_stale_running_item_is_reclaimed(drive_user, settings):
+    settings.INGEST_JOB_STALE_SECONDS = 0
+    enqueue(drive_user, FILES[:1])
+    claim_next()
+    assert claim_next().file_id == "f1"
+
+
+@pytest.mark.django_db
+def test_item_failed_after_max_attempts(drive_user, settings):
+    settings.INGEST_JOB_STALE_SECONDS = 0
+    settings.INGEST_JOB_MAX_ATTEMPTS = 2
+    enqueue(drive_user, FILES[:1])
+    assert [claim_next().attempts for _ in range(2)] == [1, 2]
+    assert claim_next() is None
+    item = IngestJobFile.objects.get()
+    assert (item.status, item.error) == (IngestJobFile.FAILED, "gave up after 2 attempts")
+    assert item.finished_at is not None
+
+
+@pytest.mark.django_db
+def test_progress_keeps_item_from_going_stale(drive_user, settings, mocker):
+    enqueue(drive_user, FILES[:1])
+    item = claim_next()
+    IngestJobFile.objects.filter(pk=item.pk).update(
+        started_at=timezone.now() - timedelta(hours=1)
+    )
+
+    def ingest(user, file_id, token, progress):
+        progress()
+        settings.INGEST_JOB_STALE_SECONDS = 60
+        assert claim_next() is None   # still owned by this worker
+        return 1
+
+    mocker.patch("agent.ingest_jobs.ingest_drive_file", side_effect=ingest)
+    process(item)
+    assert IngestJobFile.objects.get().status == IngestJobFile.DONE
+
+
+@pytest.mark.django_db
+def test_status_endpoint_reports_per_file_state(auth_client, drive_user, mocker):
+    job = enqueue(drive_user, FILES)
+    ingest = mocker.patch("agent.ingest_jobs.ingest_drive_file",
+                          side_effect=[5, ValueError("boom")])
+    url = reverse("ingest_status", args=[job.id])
+    assert auth_client.get(url).json()["status"] == "queued"
+
+    process(claim_next())
+    assert auth_client.get(url).json()["status"] == "running"
+
+    process(claim_next())
+    data = auth_client.get(url).json()
+    assert data["status"] == "failed"
+    assert [(f["id"], f["status"], f["chunks"], f["error"]) for f in data["files"]] == [
+        ("f1", "done", 5, None),
+        ("f2", "failed", None, "ValueError: boom"),
+    ]
+    assert ingest.call_count == 2
+
+
+@pytest.mark.django_db
+def test_status_endpoint_loads_files_once(auth_client, drive_user, django_assert_max_num_queries):
+    job = enqueue(drive_user, FILES)
+    url = reverse("ingest_status", args=[job.id])
+    auth_client.get(url)   # warm the session / user lookups
+    with django_assert_max_num_queries(4):   # session, user, job, files
+        data = auth_client.get(url).json()
+    assert [f["id"] for f in data["files"]] == ["f1", "f2"]
+
+
+@pytest.mark.django_db
+def test_status_endpoint_hides_other_users_jobs(auth_client, django_user_model):
+    other = django_user_model.objects.create_user("o", "o@x.com", "p")
+    job = enqueue(other, FILES)
+    r = auth_client.get(reverse("ingest_status", args=[job.id]))
+    assert r.status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_command_drains_queue(drive_user, mocker):
+    mocker.patch("agent.ingest_jobs.ingest_drive_file", return_value=1)
+    job = enqueue(drive_user, FILES * 3)
+    call_command("ingest_worker", concurrency=3, once=True)
+    assert set(job.files.values_list("status", flat=True)) == {IngestJobFile.DONE}
@@ -0,0 +1,83 @@
+# tests/test_metrics.py
+import pytest
+from django.urls import reverse
+
+from rag import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = metrics.Histogram("t_seconds", "test", buckets=(0.1, 1))
+    metrics._registry.remove(h)
+    for v in (0.05, 0.5, 0.7, 3):
+        h.observe(v, stage="x")
+    lines = h.render()
+    assert 't_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="x",le="1"} 3' in lines
+    assert 't_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 't_seconds_count{stage="x"} 4' in lines
+
+
+def test_stages_collected_and_summed():
+    with metrics.collect() as timings:
+        with metrics.stage("a"):
+            pass
+        with metrics.stage("a"):
+            pass
+        with metrics.stage("b"):
+            pass
+    with metrics.stage("outside"):
+        pass
+    assert [name for name, _ in timings] == ["a", "a", "b"]
+    assert list(metrics.summarize(timings)) == ["a", "b"]
+
+
+@pytest.mark.django_db
+def test_server_timing_header_on_file_search(auth_client, mocker):
+    mocker.patch("rag.views.embed_query", return_value=[0.0] * 1536)
+    mocker.patch("rag.views.nearest_files", return_value=[])
+    before = metrics.STAGE_SECONDS.count(stage="vector")
+
+    res = auth_client.get(reverse("list_files"), {"q": "x"})
+
+    header = res["Server-Timing"]
+    assert header.startswith("embed;dur=")
+    assert "vector;dur=" in header and "total;dur=" in header
+    assert metrics.STAGE_SECONDS.count(stage="vector") == before + 1
+
+
+def test_middleware_runs_natively_async(rf):
+    import asyncio
+    from django.http import HttpResponse
+
+    async def view(request):
+        with metrics.stage("embed"):
+            pass
+        return HttpResponse("ok")
+
+    mw = metrics.ServerTimingMiddleware(view)
+    assert asyncio.iscoroutinefunction(mw)
+    res = asyncio.run(mw(rf.get("/")))
+    assert res["Server-Timing"].startswith("embed;dur=")
+
+
+def test_uninstrumented_views_have_no_header(client):
+    assert "Server-Timing" not in client.get(reverse("get_csrf_token"))
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_access(client, user, settings):
+    url = reverse("metrics")
+    assert client.get(url).status_code == 403
+
+    settings.METRICS_TOKEN = "s3cret"
+    assert client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code == 403
+    res = client.get(url, HTTP_AUTHORIZATION="Bearer s3cret")
+    assert res.status_code == 200
+    assert res["Content-Type"].startswith("text/plain")
+    assert "# TYPE rag_stage_seconds histogram" in res.content.decode()
+
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    settings.METRICS_TOKEN = ""
+    assert client.get(url).status_code == 200
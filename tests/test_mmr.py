@@ -0,0 +1,23 @@
+# tests/test_mmr.py
+import numpy as np
+
+from rag.mmr import mmr
+
+
+def test_mmr_skips_near_duplicates():
+    q = np.array([1.0, 0.0, 0.0])
+    cands = np.array([
+        [0.95, 0.30, 0.0],   # most relevant
+        [0.95, 0.31, 0.0],   # near-duplicate of it
+        [0.80, 0.0, 0.60],   # less relevant, different direction
+    ])
+    assert mmr(q, cands, 2, lambda_=1.0) == [0, 1]
+    assert mmr(q, cands, 2, lambda_=0.5) == [0, 2]
+
+
+def test_mmr_edge_cases():
+    rnd = np.random.default_rng(0)
+    cands = rnd.normal(size=(5, 8))
+    assert sorted(mmr(rnd.normal(size=8), cands, 10)) == [0, 1, 2, 3, 4]
+    assert mmr(np.ones(8), cands, 0) == []
+    assert mmr(np.ones(3), np.zeros((2, 3)), 1) == [0]  # zero vectors do not blow up
@@ -0,0 +1,112 @@
+# tests/test_partitioning.py
+import io
+import random
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from agent.drive_ingest import _store_stream
+from rag import partitioning
+from rag.models import RagChunk
+from rag.search import nearest_chunks, vector_cursor
+
+
+def _vec(rnd):
+    return [rnd.random() for _ in range(1536)]
+
+
+def _rows(table):
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT id, user_id, chunk_idx, char_end FROM {table} ORDER BY id")
+        return cur.fetchall()
+
+
+@pytest.fixture
+def restore_table():
+    yield
+    # leave a plain rag_ragchunk behind for the other tests, even on failure
+    with connection.cursor() as cur:
+        swapped = partitioning.relkind(cur, partitioning.TABLE) == "p"
+    if swapped:
+        call_command("partition_chunks", revert=True, stdout=io.StringIO())
+    with connection.cursor() as cur:
+        partitioning.drop_mirror(cur, partitioning.TABLE)
+        cur.execute(f"DROP TABLE IF EXISTS {partitioning.NEW}")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partition_move_swap_and_revert(user, django_user_model, mocker, restore_table):
+    other = django_user_model.objects.create_user("o", "o@x.com", "p")
+    rnd = random.Random(0)
+    for owner in (user, other):
+        for i in range(5):
+            RagChunk.objects.create(
+                user=owner, file_id="f", file_name="f.txt", chunk_idx=i,
+                char_start=i, char_end=i + 1, embedding=_vec(rnd),
+            )
+
+    call_command("partition_chunks", partitions=4, batch=3, no_swap=True, stdout=io.StringIO())
+    assert _rows(partitioning.NEW) == _rows(partitioning.TABLE)
+
+    # writes during the move are mirrored into the copy
+    RagChunk.objects.filter(user=user, chunk_idx=0).update(char_end=99)
+    RagChunk.objects.filter(user=other, chunk_idx=4).delete()
+    RagChunk.objects.create(user=user, file_id="g", file_name="g.txt", chunk_idx=0,
+                            char_start=0, char_end=1, embedding=_vec(rnd))
+    assert _rows(partitioning.NEW) == _rows(partitioning.TABLE)
+
+    out = io.StringIO()
+    call_command("partition_chunks", stdout=out)
+    assert "swapped" in out.getvalue()
+    with connection.cursor() as cur:
+        assert partitioning.relkind(cur, partitioning.TABLE) == "p"
+        assert len(partitioning.partitions(cur, partitioning.TABLE)) == 4
+        names = {name for name, _, _ in partitioning.indexes(cur, partitioning.TABLE)}
+        assert "rag_ragchunk_embedding_hnsw" in names
+        assert {name for name, _, _ in partitioning.indexes(cur, partitioning.OLD)} == {
+            name + "_old" for name in names
+        }
+    assert RagChunk.objects.count() == 10
+
+    # the model, upserts and vector search run unchanged on the partitioned table
+    mocker.patch("agent.drive_ingest.embed_texts",
+                 side_effect=lambda texts, token_counts=None: [_vec(rnd) for _ in texts])
+    _store_stream(user, "f", "f2.txt", iter([(i, i, i + 1, f"t{i}", 1) for i in range(10)]))
+    assert RagChunk.objects.get(user=user, file_id="f", chunk_idx=0).file_name == "f2.txt"
+    new = RagChunk.objects.get(user=user, file_id="f", chunk_idx=9)
+    assert new.id > max(r[0] for r in _rows(partitioning.OLD) if r[0] != new.id)
+    with vector_cursor() as cur:
+        rows = nearest_chunks(cur, user.id, _vec(rnd), 3)
+    assert len(rows) == 3
+    assert {r[0] for r in rows} <= set(
+        RagChunk.objects.filter(user=user).values_list("id", flat=True)
+    )
+
+    # the old table is kept current until dropped, so revert loses nothing
+    assert _rows(partitioning.OLD) == _rows(partitioning.TABLE)
+    call_command("partition_chunks", revert=True, stdout=io.StringIO())
+    with connection.cursor() as cur:
+        assert partitioning.relkind(cur, partitioning.TABLE) == "r"
+        assert partitioning.relkind(cur, partitioning.OLD) is None
+    assert RagChunk.objects.count() == 15
+    created = RagChunk.objects.create(user=other, file_id="h", file_name="h.txt", chunk_idx=0,
+                                      char_start=0, char_end=1, embedding=_vec(rnd))
+    assert created.id > new.id
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_index_builds_per_partition(user, restore_table):
+    call_command("partition_chunks", partitions=2, stdout=io.StringIO())
+    with connection.cursor() as cur:
+        partitioning.create_index(cur, partitioning.TABLE, "rag_ragchunk_test_idx",
+                                  "USING btree (file_id)")
+        cur.execute(
+            "SELECT count(*) FROM pg_partition_tree('rag_ragchunk_test_idx') WHERE isleaf"
+        )
+        assert cur.fetchone()[0] == 2
+        cur.execute("SELECT indisvalid FROM pg_index "
+                    "WHERE indexrelid = 'rag_ragchunk_test_idx'::regclass")
+        assert cur.fetchone()[0]
+        partitioning.drop_index(cur, partitioning.TABLE, "rag_ragchunk_test_idx")
+        assert partitioning.relkind(cur, "rag_ragchunk_p0_test_idx") is None
@@ -0,0 +1,102 @@
+# tests/test_pdf_extract.py
+import pdfminer.high_level
+import pytest
+import responses
+
+from agent import pdf_extract
+
+
+def _pdf(*pages):
+    """Minimal multi-page PDF with one line of Helvetica text per page."""
+    n = len(pages)
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n)), n),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode()
+        objs.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+        )
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    out, offsets = b"%PDF-1.4\n", []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return out
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(_pdf("First page text", "Second page text"))
+    return str(path)
+
+def test_pdfminer_pages_join_to_extract_text(pdf_path):
+    pages = pdf_extract.extract_pages(pdf_path)
+    assert len(pages) == 2
+    assert "First" in pages[0] and "Second" not in pages[0]
+    assert "".join(pages) == pdfminer.high_level.extract_text(pdf_path)
+
+def test_page_batches_stream_in_ranges(pdf_path, settings, mocker):
+    settings.PDF_EXTRACT_PAGE_BATCH = 1
+    extract = mocker.spy(pdf_extract, "_extract")
+    batches = list(pdf_extract.iter_page_batches(pdf_path))
+    assert [len(b) for b in batches] == [1, 1]
+    assert [c.args[2:] for c in extract.call_args_list] == [(0, 1), (1, 1), (2, 1)]
+    assert "".join(p for b in batches for p in b) == pdfminer.high_level.extract_text(pdf_path)
+
+def test_pypdf2_engine(pdf_path, settings, mocker):
+    settings.PDF_EXTRACT_ENGINE = "pypdf2"
+    miner = mocker.spy(pdf_extract, "_pdfminer_pages")
+    pages = pdf_extract.extract_pages(pdf_path)
+    assert "First page text" in pages[0] and "Second page text" in pages[1]
+    miner.assert_not_called()
+
+def test_pypdf2_falls_back_on_garbled_output(pdf_path, settings, mocker):
+    settings.PDF_EXTRACT_ENGINE = "pypdf2"
+    mocker.patch.object(pdf_extract, "_pypdf2_pages", return_value=["\x00\x01�", "  "])
+    assert "First" in pdf_extract.extract_pages(pdf_path)[0]
+
+def test_looks_garbled():
+    assert pdf_extract.looks_garbled(["", " \n\f"])
+    assert pdf_extract.looks_garbled(["abc��"])
+    assert pdf_extract.looks_garbled(["x" * 300])
+    assert not pdf_extract.looks_garbled(["A normal sentence of text.\n\f"])
+
+def test_process_pool(pdf_path, settings):
+    settings.PDF_EXTRACT_WORKERS = 1
+    settings.PDF_EXTRACT_MAX_TASKS = 1  # recycle the worker after every document
+    try:
+        first = pdf_extract.extract_pages(pdf_path)
+        assert pdf_extract.extract_pages(pdf_path) == first
+        assert "Second" in first[1]
+    finally:
+        pdf_extract._discard(pdf_extract._executor())
+
+@pytest.mark.django_db
+@responses.activate
+def test_ingest_pdf(user, mocker):
+    from agent.drive_ingest import ingest_drive_file
+    from agent import text_cache
+    url = "https://www.googleapis.com/drive/v3/files/p1"
+    responses.add(responses.GET, url, json={
+        "name": "doc.pdf", "mimeType": "application/pdf", "version": "1", "md5Checksum": "m",
+    }, match=[responses.matchers.query_param_matcher(
+        {"fields": "name,mimeType,version,md5Checksum,modifiedTime"}
+    )])
+    responses.add(responses.GET, url + "?alt=media", body=_pdf("Alpha", "Beta"))
+    mocker.patch(
+        "agent.drive_ingest.embed_texts",
+        side_effect=lambda texts, token_counts=None: [[0.0] * 1536 for _ in texts],
+    )
+    assert ingest_drive_file(user, "p1", "tok") == 1
+    cached = text_cache.get("p1", "m")
+    assert "Alpha" in cached and "Beta" in cached
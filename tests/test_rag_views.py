@@ -1,5 +1,6 @@
 # tests/test_rag_views.py
 import json
+import pytest
 from django.urls import reverse
 from rag.models import RagChunk
 
@@ -8,14 +9,41 @@ def test_list_files_empty(auth_client):
     assert r.status_code == 200
     assert json.loads(r.content) == []
 
-def test_list_files_similarity(auth_client, mocker, user):
-    RagChunk.objects.create(
-        user=user, file_id="x", file_name="α.txt", chunk_idx=0,
-        char_start=0, char_end=5, embedding=[0.1]*1536
-    )
-    mocker.patch("rag.views._embed_query", return_value=[0.0]*1536)
+@pytest.mark.parametrize("prefilter", [True, False])
+def test_list_files_similarity(auth_client, mocker, user, settings, prefilter):
+    from agent.models import UserFile
+    settings.RAG_FILE_PREFILTER = prefilter
+    for fid, name, vec in [("x", "α.txt", [0.1] * 1536), ("y", "β.txt", [0.1, -0.1] * 768)]:
+        UserFile.objects.create(user=user, file_id=fid, name=name, chunk_count=1, centroid=vec)
+        RagChunk.objects.create(
+            user=user, file_id=fid, file_name=name, chunk_idx=0,
+            char_start=0, char_end=5, embedding=vec
+        )
+    mocker.patch("rag.views.embed_query", return_value=[0.2] * 1536)
     r = auth_client.get(reverse("list_files") + "?q=anything")
     data = r.json()
-    assert data[0]["file_name"] == "α.txt"
+    assert [f["file_id"] for f in data] == ["x", "y"]
+    assert data[0]["file_name"] == "α.txt" and data[0]["chunks"] == 1
     assert "distance" in data[0]
 
+def test_list_files_pages_by_name_from_userfile_stats(auth_client, user):
+    from agent.models import UserFile
+    for fid, name in [("a", "b.txt"), ("b", "a.txt"), ("c", "a.txt"), ("d", "c.txt")]:
+        UserFile.objects.create(user=user, file_id=fid, name=name,
+                                chunk_count=2, token_count=50, size=10)
+    UserFile.objects.create(user=user, file_id="pending", name="0.txt")  # not ingested yet
+
+    r = auth_client.get(reverse("list_files"), {"limit": 2})
+    assert [(f["file_id"], f["file_name"]) for f in r.json()] == [("b", "a.txt"), ("c", "a.txt")]
+    assert r.json()[0]["chunks"] == 2 and r.json()[0]["tokens"] == 50
+
+    r = auth_client.get(reverse("list_files"), {"limit": 2, "cursor": r["X-Next-Cursor"]})
+    assert [f["file_id"] for f in r.json()] == ["a", "d"]
+    assert "X-Next-Cursor" not in r
+
+    # a page boundary between two files of the same name
+    r = auth_client.get(reverse("list_files"), {"limit": 1})
+    r = auth_client.get(reverse("list_files"), {"limit": 1, "cursor": r["X-Next-Cursor"]})
+    assert [f["file_id"] for f in r.json()] == ["c"]
+
+    assert auth_client.get(reverse("list_files"), {"cursor": "junk"}).status_code == 400
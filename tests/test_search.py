@@ -0,0 +1,173 @@
+# tests/test_search.py
+import io
+import random
+import pytest
+from django.core.management import call_command
+
+from rag.models import RagChunk
+from rag.search import nearest_chunks, vector_cursor
+
+
+def _vec(rnd):
+    return [rnd.random() for _ in range(1536)]
+
+
+@pytest.mark.django_db
+def test_nearest_chunks_filters_by_user(user, django_user_model, settings):
+    settings.RAG_HNSW_EF_SEARCH = 40
+    other = django_user_model.objects.create_user("o", "o@x.com", "p")
+    rnd = random.Random(0)
+    for owner in (user, other):
+        for i in range(5):
+            RagChunk.objects.create(
+                user=owner, file_id="f", file_name="f.txt", chunk_idx=i,
+                char_start=i, char_end=i + 1, embedding=_vec(rnd),
+            )
+    with vector_cursor() as cur:
+        cur.execute("SHOW hnsw.ef_search")
+        assert cur.fetchone()[0] == "40"
+        rows = nearest_chunks(cur, user.id, _vec(rnd), 3)
+    assert len(rows) == 3
+    ids = set(RagChunk.objects.filter(user=user).values_list("id", flat=True))
+    assert {r[0] for r in rows} <= ids
+
+
+@pytest.mark.django_db
+def test_vector_recall_command(user):
+    rnd = random.Random(1)
+    for i in range(20):
+        RagChunk.objects.create(
+            user=user, file_id="f", file_name="f.txt", chunk_idx=i,
+            char_start=i, char_end=i + 1, embedding=_vec(rnd),
+        )
+    out = io.StringIO()
+    call_command("vector_recall", queries=5, k=3, ef="10,40", stdout=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "5 queries, k=3"
+    assert [l.split()[0] for l in lines[2:]] == ["exact", "ef=10", "ef=40"]
+
+
+def test_compact_expression():
+    from rag.search import compact_expression
+    assert compact_expression("embedding", "halfvec", 1536) == "((embedding)::halfvec(1536))"
+    assert compact_expression("embedding", "halfvec", 512) == (
+        "((l2_normalize(subvector(embedding, 1, 512)))::halfvec(512))"
+    )
+    assert compact_expression("%s::vector", "bit", 256) == (
+        "(binary_quantize(subvector(%s::vector, 1, 256))::bit(256))"
+    )
+
+
+def _pgvector_at_least(*version):
+    from django.db import connection
+    with connection.cursor() as cur:
+        cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        return tuple(int(x) for x in cur.fetchone()[0].split(".")[:2]) >= version
+
+
+@pytest.mark.django_db
+def test_vector_index_requires_pgvector_07():
+    from django.core.management.base import CommandError
+    if _pgvector_at_least(0, 7):
+        pytest.skip("server has halfvec support")
+    with pytest.raises(CommandError, match="0.7"):
+        call_command("vector_index", index="halfvec", dims=512, stdout=io.StringIO())
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("index,dims", [("halfvec", 512), ("bit", 1536)])
+def test_compact_search_reranks_on_full_vectors(user, settings, index, dims):
+    if not _pgvector_at_least(0, 7):
+        pytest.skip("halfvec/bit need pgvector >= 0.7")
+    settings.RAG_VECTOR_INDEX, settings.RAG_VECTOR_DIMENSIONS = index, dims
+    rnd = random.Random(2)
+    vecs = [_vec(rnd) for _ in range(30)]
+    for i, v in enumerate(vecs):
+        RagChunk.objects.create(
+            user=user, file_id="f", file_name="f.txt", chunk_idx=i,
+            char_start=i, char_end=i + 1, embedding=v,
+        )
+    call_command("vector_index", stdout=io.StringIO())
+    with vector_cursor() as cur:
+        rows = nearest_chunks(cur, user.id, vecs[7], 3, rerank=10)
+    assert rows[0][3] == 7  # the query's own chunk wins after exact re-rank
+    out = io.StringIO()
+    call_command("vector_recall", queries=5, k=3, ef="40", storage=f"{index}:{dims}", stdout=out)
+    assert out.getvalue().splitlines()[-1].split()[0] == f"{index}:{dims}"
+
+
+@pytest.mark.django_db
+def test_search_chunks_prefilters_by_file_centroid(user, settings):
+    from agent.models import UserFile
+    from rag.search import search_chunks
+    settings.RAG_FILE_PREFILTER, settings.RAG_PREFILTER_FILES = True, 1
+    rnd = random.Random(3)
+    near, far = _vec(rnd), [-x for x in _vec(rnd)]
+    for fid, base in (("near", near), ("far", far)):
+        UserFile.objects.create(user=user, file_id=fid, name=fid, centroid=base)
+        for i in range(3):
+            RagChunk.objects.create(
+                user=user, file_id=fid, file_name=fid, chunk_idx=i,
+                char_start=i, char_end=i + 1, embedding=[x + i * 0.01 for x in base],
+            )
+    with vector_cursor() as cur:
+        rows = search_chunks(cur, user.id, near, 5)
+    assert [r[1] for r in rows] == ["near"] * 3
+    assert [r[3] for r in rows] == [0, 1, 2]
+
+    settings.RAG_FILE_PREFILTER = False
+    with vector_cursor() as cur:
+        assert len(search_chunks(cur, user.id, near, 5)) == 5
+
+
+@pytest.mark.django_db
+def test_nearest_files_is_not_cut_short_by_other_users(user, django_user_model):
+    from agent.models import UserFile
+    from rag.search import nearest_files
+    other = django_user_model.objects.create_user("o", "o@x.com", "p")
+    rnd = random.Random(5)
+    query = _vec(rnd)
+    for i in range(30):   # another user's files crowd the query's neighbourhood
+        UserFile.objects.create(user=other, file_id=f"o{i}", name="o", centroid=query)
+    for i in range(3):
+        UserFile.objects.create(user=user, file_id=f"u{i}", name="u", centroid=_vec(rnd))
+    with vector_cursor(ef_search=1) as cur:
+        cur.execute("SELECT set_config('enable_sort', 'off', true)")  # favour the HNSW walk
+        files = nearest_files(cur, user.id, query, 3)
+    assert sorted(f[0] for f in files) == ["u0", "u1", "u2"]
+
+
+@pytest.mark.django_db
+def test_search_chunks_mmr_diversifies_candidates(user, settings):
+    from rag.search import search_chunks
+    settings.RAG_FILE_PREFILTER = False
+    rnd = random.Random(4)
+    base, other = _vec(rnd), _vec(rnd)
+    for i in range(3):   # three near-identical windows of one passage
+        RagChunk.objects.create(
+            user=user, file_id="dup", file_name="dup", chunk_idx=i,
+            char_start=i, char_end=i + 1, embedding=[x + i * 1e-3 for x in base],
+        )
+    RagChunk.objects.create(
+        user=user, file_id="other", file_name="other", chunk_idx=0,
+        char_start=0, char_end=1, embedding=[0.6 * a + 0.4 * b for a, b in zip(base, other)],
+    )
+
+    settings.RAG_MMR_CANDIDATES = 0
+    with vector_cursor() as cur:
+        assert [r[1] for r in search_chunks(cur, user.id, base, 2)] == ["dup", "dup"]
+
+    settings.RAG_MMR_CANDIDATES, settings.RAG_MMR_LAMBDA = 10, 0.5
+    with vector_cursor() as cur:
+        rows = search_chunks(cur, user.id, base, 2)
+    assert [r[1] for r in rows] == ["dup", "other"]
+    assert all(len(r) == 5 for r in rows)
+
+
+def test_as_array_accepts_vector_or_ndarray():
+    import numpy as np
+    from pgvector import Vector
+    from rag.search import _as_array
+    for value in (Vector([1, 2, 3]), np.array([1, 2, 3], dtype=np.float64), [1, 2, 3]):
+        out = _as_array(value)
+        assert out.dtype == np.float32 and out.tolist() == [1, 2, 3]
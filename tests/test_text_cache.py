@@ -0,0 +1,91 @@
+# tests/test_text_cache.py
+import os
+import pytest
+import responses
+
+from agent import text_cache
+from agent.views import _export_drive_text
+
+META_URL = "https://www.googleapis.com/drive/v3/files/abc"
+
+
+def test_roundtrip_and_revision_miss():
+    text_cache.put("abc", "v1", "héllo")
+    assert text_cache.get("abc", "v1") == "héllo"
+    assert text_cache.get("abc", "v2") is None
+    assert text_cache.get("abc", None) is None
+
+
+def test_new_revision_replaces_old():
+    text_cache.put("abc", "v1", "old")
+    text_cache.put("abc", "v2", "new")
+    assert text_cache.get("abc", "v1") is None
+    assert text_cache.get("abc", "v2") == "new"
+
+
+def test_revision_prefers_checksum():
+    assert text_cache.revision({"md5Checksum": "m", "version": "3"}) == "m"
+    assert text_cache.revision({"version": "3"}) == "3"
+    assert text_cache.revision({}) is None
+
+
+def test_lru_eviction(settings):
+    blob = os.urandom(4000).hex()
+    text_cache.put("a", "1", blob)
+    # room for two entries, not three
+    settings.TEXT_CACHE_MAX_BYTES = int(text_cache._path("a", "1").stat().st_size * 2.5)
+    text_cache.put("b", "1", blob)
+    os.utime(text_cache._path("a", "1"), (0, 0))
+    os.utime(text_cache._path("b", "1"), (10, 10))
+    text_cache.get("a", "1")  # touch → most recently used
+    text_cache.put("c", "1", blob)
+    assert text_cache.get("b", "1") is None
+    assert text_cache.get("a", "1") == blob
+    assert text_cache.get("c", "1") == blob
+
+
+def test_eviction_walks_only_when_over_budget(settings, mocker):
+    blob = os.urandom(4000).hex()
+    text_cache.put("a", "1", blob)   # first write syncs the estimate
+    size = text_cache._path("a", "1").stat().st_size
+    settings.TEXT_CACHE_MAX_BYTES = int(size * 4.5)
+    walk = mocker.spy(text_cache.Path, "glob")
+    for name in "bcd":
+        text_cache.put(name, "1", blob)
+    assert all(c.args[1] == "*.z" for c in walk.call_args_list)   # old revisions only
+    text_cache.put("e", "1", blob)   # over budget: walk and trim to 90 %
+    assert any(c.args[1] == "*/*.z" for c in walk.call_args_list)
+    cached = [n for n in "abcde" if text_cache.get(n, "1")]
+    assert len(cached) * size <= settings.TEXT_CACHE_MAX_BYTES * 0.9
+    assert "e" in cached
+
+
+def test_disabled_when_budget_zero(settings):
+    settings.TEXT_CACHE_MAX_BYTES = 0
+    text_cache.put("abc", "v1", "x")
+    assert text_cache.get("abc", "v1") is None
+
+
+@responses.activate
+def test_export_uses_cache_after_metadata_check():
+    responses.add(
+        responses.GET, META_URL,
+        json={"name": "doc.pdf", "mimeType": "application/pdf", "md5Checksum": "m1"},
+    )
+    text_cache.put("abc", "m1", "cached text")
+    assert _export_drive_text("abc", "tok") == "cached text"
+    assert len(responses.calls) == 1  # metadata only, no download
+
+
+def test_streamed_writer_discards_on_error():
+    with text_cache.writer("abc", "v1") as w:
+        w.write("hé")
+        w.write("llo")
+    assert text_cache.get("abc", "v1") == "héllo"
+
+    with pytest.raises(RuntimeError):
+        with text_cache.writer("abc", "v2") as w:
+            w.write("partial")
+            raise RuntimeError
+    assert text_cache.get("abc", "v2") is None
+    assert text_cache.get("abc", "v1") == "héllo"
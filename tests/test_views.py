@@ -1,5 +1,6 @@
 # tests/test_views.py
 import json
+import pytest
 import responses
 from django.urls import reverse
 from freezegun import freeze_time
@@ -17,9 +18,10 @@ def test_chat_requires_message(auth_client):
 
 @freeze_time("2025-08-07")
 @responses.activate
+@pytest.mark.django_db
 def test_chat_completion_basic(auth_client, mocker):
     # Patch vector search to avoid heavy PG setup
-    mocker.patch("agent.views.get_relevant_context", return_value=[])
+    mocker.patch("agent.views._search", return_value=([0.0] * 1536, []))
     # Patch OpenAI
     openai_mock = mocker.patch("agent.views.client.chat.completions.create")
     openai_mock.return_value.choices[0].message.content = "hi back"
@@ -32,3 +34,122 @@ def test_chat_completion_basic(auth_client, mocker):
     assert resp.status_code == 200
     assert resp.json()["response"] == "hi back"
 
+
+
+@pytest.mark.django_db
+def test_get_relevant_context_exports_concurrently_with_deadline(user, mocker, settings):
+    import threading
+    import time
+    from agent.models import DriveAuth
+    from agent.views import get_relevant_context
+
+    settings.RAG_EXPORT_DEADLINE = 0.5
+    DriveAuth.objects.create(user=user, access_token="tok", expiry_ts=time.time() + 3600)
+    mocker.patch("agent.views.embed_query", return_value=[0.0] * 1536)
+    mocker.patch("agent.views.search_chunks", return_value=[
+        (1, "fast", "f", 0, 4), (2, "slow", "s", 0, 4),
+        (3, "fast", "f", 5, 9), (4, "broken", "b", 0, 1),
+    ])
+    release = threading.Event()
+    running = []
+
+    def export(file_id, token):
+        running.append(file_id)
+        if file_id == "slow":
+            release.wait(5)
+        if file_id == "broken":
+            raise RuntimeError("drive down")
+        return "aaaa bbbb"
+
+    mocker.patch("agent.views._export_drive_text", side_effect=export)
+    t0 = time.monotonic()
+    try:
+        contexts = get_relevant_context("q", user, k=4)
+    finally:
+        release.set()
+    assert time.monotonic() - t0 < 2
+    assert contexts == ["aaaa", "bbbb"]
+    assert sorted(running) == ["broken", "fast", "slow"]
+
+
+class _FakeStream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for p in self.parts:
+            yield p
+
+    async def close(self):
+        self.closed = True
+
+
+def _delta(text):
+    from unittest.mock import MagicMock
+    part = MagicMock()
+    part.choices[0].delta.content = text
+    return part
+
+
+def _stream_response(auth_client, mocker, parts):
+    stream = _FakeStream([_delta(p) for p in parts])
+    mocker.patch("agent.views._retrieve", return_value=[{
+        "file_id": "f1", "file_name": "a.pdf", "char_start": 0, "char_end": 4, "text": "ctx",
+    }])
+    create = mocker.patch(
+        "agent.views.async_client.chat.completions.create",
+        new=mocker.AsyncMock(return_value=stream),
+    )
+    resp = auth_client.post(
+        reverse("chat_stream"), json.dumps({"message": "hi"}),
+        content_type="application/json",
+    )
+    return resp, stream, create
+
+
+def _events(raw: str):
+    out = []
+    for block in raw.strip().split("\n\n"):
+        event, data = block.split("\n")
+        out.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return out
+
+
+@pytest.mark.django_db
+def test_chat_stream_sends_sources_then_tokens(auth_client, mocker):
+    from asgiref.sync import async_to_sync
+    resp, stream, create = _stream_response(auth_client, mocker, ["Hel", None, "lo"])
+    assert resp["Content-Type"] == "text/event-stream"
+
+    async def consume():
+        return b"".join([part async for part in resp.streaming_content]).decode()
+
+    events = _events(async_to_sync(consume)())
+    assert events == [
+        ("sources", [{"file_id": "f1", "file_name": "a.pdf", "char_start": 0, "char_end": 4}]),
+        ("token", {"text": "Hel"}),
+        ("token", {"text": "lo"}),
+        ("done", {}),
+    ]
+    assert create.await_args.kwargs["stream"] is True
+    assert "<doc>ctx</doc>" in create.await_args.kwargs["messages"][0]["content"]
+    assert stream.closed
+
+
+@pytest.mark.django_db
+def test_chat_stream_closes_upstream_on_disconnect(auth_client, mocker):
+    from asgiref.sync import async_to_sync
+    resp, stream, _ = _stream_response(auth_client, mocker, ["a", "b", "c"])
+
+    async def read_two_then_disconnect():
+        gen = resp._iterator
+        await gen.__anext__()  # sources
+        await gen.__anext__()  # first token
+        await gen.aclose()     # what the ASGI handler does on http.disconnect
+
+    async_to_sync(read_two_then_disconnect)()
+    assert stream.closed